@@ -0,0 +1,78 @@
+# --- FOTOGRAMES DEL MAPA DE CONVERGÈNCIA ---
+# Mòdul a part (i lleuger) perquè el grup de processos de l'animació l'ha d'importar sense executar el guió de
+# Streamlit. El mapa de flux es divideix en el fons (terra, mar, costa i fronteres), que és igual per a totes les
+# hores, i el camp de l'hora (convergència, línies de corrent i títol). Cada procés dibuixa el fons una sola vegada
+# en un llenç Agg i en guarda el raster; cada fotograma el restaura i només hi dibuixa les capes de l'hora.
+import io
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+import cartopy.crs as ccrs
+import cartopy.feature as cfeature
+from scipy.interpolate import griddata
+import metpy.calc as mpcalc
+from metpy.units import units
+
+EXTENSIO_MAPA = [0, 3.5, 40.4, 43]
+LLINDAR_MAPA = -5.5
+COLORS_FOTOGRAMA = 64
+
+def dibuixar_fons_mapa(ax):
+    ax.set_extent(EXTENSIO_MAPA, crs=ccrs.PlateCarree())
+    ax.add_feature(cfeature.LAND, facecolor="#E0E0E0", zorder=0)
+    ax.add_feature(cfeature.OCEAN, facecolor='#b0c4de', zorder=0)
+    ax.add_feature(cfeature.COASTLINE, edgecolor='black', linewidth=0.5, zorder=1)
+    ax.add_feature(cfeature.BORDERS, linestyle=':', edgecolor='black', zorder=1)
+
+def dibuixar_convergencia(ax, lats, lons, u, v):
+    # u, v en m/s als punts de la graella; camp interpolat (cúbic) a 100×100 i divergència en 10⁻⁵ s⁻¹
+    grid_lon = np.linspace(min(lons), max(lons), 100)
+    grid_lat = np.linspace(min(lats), max(lats), 100)
+    X, Y = np.meshgrid(grid_lon, grid_lat)
+    points = np.vstack((lons, lats)).T
+    u_grid = np.nan_to_num(griddata(points, u, (X, Y), method='cubic'))
+    v_grid = np.nan_to_num(griddata(points, v, (X, Y), method='cubic'))
+    dx, dy = mpcalc.lat_lon_grid_deltas(X, Y)
+    divergencia = (mpcalc.divergence(u_grid * units('m/s'), v_grid * units('m/s'), dx=dx, dy=dy) * 1e5).m
+    convergencia_forta = np.ma.masked_where(divergencia > LLINDAR_MAPA, divergencia)
+    ax.contourf(X, Y, convergencia_forta, levels=np.linspace(-15.0, LLINDAR_MAPA, 10), cmap='Reds_r', alpha=0.6,
+                zorder=2, transform=ccrs.PlateCarree(), extend='min')
+    ax.streamplot(grid_lon, grid_lat, u_grid, v_grid, color="#000000", density=5.9, linewidth=0.5,
+                  arrowsize=0.50, zorder=4, transform=ccrs.PlateCarree())
+
+class FonsMapa:
+    def __init__(self, ppp):
+        self.fig = Figure(figsize=(9, 9), dpi=ppp); self.llenc = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+        dibuixar_fons_mapa(self.ax); self.ax.set_autoscale_on(False); self.ax.set_title(" ", weight='bold')
+        self.llenc.draw(); self.fons = self.llenc.copy_from_bbox(self.fig.bbox)
+        # Retall com bbox_inches='tight': el mapa és més ample que alt i la figura quadrada
+        caixa = self.fig.get_tightbbox(self.llenc.get_renderer()).padded(0.1)
+        alt = self.llenc.get_width_height()[1]
+        self.retall = (slice(max(0, int(alt - caixa.y1 * ppp)), int(alt - caixa.y0 * ppp)), slice(max(0, int(caixa.x0 * ppp)), int(caixa.x1 * ppp)))
+
+    def renderitzar(self, lats, lons, u, v, titol):
+        ax = self.ax; abans = set(map(id, ax.get_children()))
+        try:
+            dibuixar_convergencia(ax, lats, lons, u, v); ax.title.set_text(titol)
+            nous = sorted((a for a in ax.get_children() if id(a) not in abans), key=lambda a: a.get_zorder())
+            self.llenc.restore_region(self.fons)
+            for artista in nous: ax.draw_artist(artista)
+            ax.draw_artist(ax.title)
+            return np.asarray(self.llenc.buffer_rgba())[self.retall][..., :3].copy()
+        finally:
+            for artista in [a for a in ax.get_children() if id(a) not in abans]: artista.remove()
+
+_fons = None
+
+def inicialitzar(ppp):
+    # Inicialitzador de cada procés del grup: el fons es dibuixa aquí, abans del primer fotograma
+    global _fons
+    _fons = FonsMapa(ppp)
+
+def renderitzar_fotograma(lats, lons, u, v, titol):
+    # Fotograma ja reduït a paleta (la quantització també es reparteix entre processos), en PNG per viatjar barat
+    imatge = Image.fromarray(_fons.renderitzar(lats, lons, u, v, titol)).quantize(colors=COLORS_FOTOGRAMA)
+    memoria = io.BytesIO(); imatge.save(memoria, format='PNG', compress_level=1)
+    return memoria.getvalue()
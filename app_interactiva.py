@@ -1,5 +1,8 @@
 import streamlit as st
 import openmeteo_requests
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+from openmeteo_sdk.VariablesWithTime import VariablesWithTime
+from openmeteo_sdk.VariableWithValues import VariableWithValues
 import requests_cache
 from retry_requests import retry
 import numpy as np
@@ -11,7 +14,9 @@ from matplotlib.colors import ListedColormap, BoundaryNorm
 import matplotlib.colors as mcolors
 import matplotlib.lines as mlines
 import matplotlib.patches as patches
-from matplotlib.collections import PatchCollection
+from matplotlib.collections import PatchCollection, LineCollection
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import matplotlib.transforms as mtransforms
 from metpy.plots import SkewT, Hodograph
 from metpy.units import units
@@ -20,111 +25,324 @@ from matplotlib.patches import Circle, Polygon
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 from scipy.interpolate import griddata
+from scipy.spatial import cKDTree
 import cartopy.io.img_tiles as cimgt
 from datetime import datetime, timedelta
 import pytz
+import re
+import threading
+import time
+import io
+import sys
+import functools
+import json
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from PIL import Image
+from animacio_convergencia import dibuixar_fons_mapa, dibuixar_convergencia, inicialitzar, renderitzar_fotograma
 
 # --- CONFIGURACIÓ INICIAL ---
-st.set_page_config(layout="wide", page_title="Tempestes.cat")
 cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
 retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
 openmeteo = openmeteo_requests.Client(session=retry_session)
+# Els errors del que corre fora del fil del guió (passades en segon pla, arxiu, grups de fils) van al registre
+registre = logging.getLogger("tempestes")
 
-# --- DATOS DE LES LOCALITATS (LLISTA DEFINITIVA I COMPLETA) ---
-pobles_data = {
-    'Amposta': {'lat': 40.707, 'lon': 0.579},
-    'Arbúcies': {'lat': 41.815, 'lon': 2.515},
-    'Arenys de Mar': {'lat': 41.581, 'lon': 2.551},
-    'Badalona': {'lat': 41.450, 'lon': 2.247},
-    'Balaguer': {'lat': 41.790, 'lon': 0.810},
-    'Banyoles': {'lat': 42.119, 'lon': 2.766},
-    'Barcelona': {'lat': 41.387, 'lon': 2.168},
-    'Berga': {'lat': 42.103, 'lon': 1.845},
-    'Blanes': {'lat': 41.674, 'lon': 2.793},
-    'Calafell': {'lat': 41.199, 'lon': 1.567},
-    'Caldes de Montbui': {'lat': 41.633, 'lon': 2.166},
-    'Calella': {'lat': 41.614, 'lon': 2.664},
-    'Cambrils': {'lat': 41.066, 'lon': 1.056},
-    'Canet de Mar': {'lat': 41.590, 'lon': 2.580},
-    'Cardona': {'lat': 41.914, 'lon': 1.679},
-    'Castell-Platja d\'Aro': {'lat': 41.818, 'lon': 3.067},
-    'Castelldefels': {'lat': 41.279, 'lon': 1.975},
-    'Cerdanyola del Vallès': {'lat': 41.491, 'lon': 2.141},
-    'Cervera': {'lat': 41.666, 'lon': 1.272},
-    'Cornellà de Llobregat': {'lat': 41.355, 'lon': 2.069},
-    'Deltebre': {'lat': 40.719, 'lon': 0.710},
-    'El Masnou': {'lat': 41.481, 'lon': 2.318},
-    'El Pont de Suert': {'lat': 42.408, 'lon': 0.741},
-    'El Prat de Llobregat': {'lat': 41.326, 'lon': 2.095},
-    'El Vendrell': {'lat': 41.219, 'lon': 1.534},
-    'Esplugues de Llobregat': {'lat': 41.375, 'lon': 2.086},
-    'Falset': {'lat': 41.144, 'lon': 0.819},
-    'Figueres': {'lat': 42.266, 'lon': 2.962},
-    'Gandesa': {'lat': 41.052, 'lon': 0.436},
-    'Gavà': {'lat': 41.305, 'lon': 2.001},
-    'Girona': {'lat': 41.983, 'lon': 2.824},
-    'Granollers': {'lat': 41.608, 'lon': 2.289},
-    'Igualada': {'lat': 41.580, 'lon': 1.616},
-    'L\'Ametlla de Mar': {'lat': 40.883, 'lon': 0.802},
-    'L\'Escala': {'lat': 42.122, 'lon': 3.131},
-    'L\'Hospitalet de Llobregat': {'lat': 41.357, 'lon': 2.102},
-    'La Bisbal d\'Empordà': {'lat': 41.959, 'lon': 3.037},
-    'La Jonquera': {'lat': 42.419, 'lon': 2.875},
-    'La Seu d\'Urgell': {'lat': 42.358, 'lon': 1.463},
-    'Les Borges Blanques': {'lat': 41.522, 'lon': 0.869},
-    'Lleida': {'lat': 41.617, 'lon': 0.622},
-    'Lloret de Mar': {'lat': 41.700, 'lon': 2.845},
-    'Manlleu': {'lat': 42.000, 'lon': 2.283},
-    'Manresa': {'lat': 41.727, 'lon': 1.825},
-    'Martorell': {'lat': 41.474, 'lon': 1.927},
-    'Mataró': {'lat': 41.538, 'lon': 2.445},
-    'Moià': {'lat': 41.810, 'lon': 2.096},
-    'Molins de Rei': {'lat': 41.414, 'lon': 2.016},
-    'Mollerussa': {'lat': 41.631, 'lon': 0.895},
-    'Mollet del Vallès': {'lat': 41.539, 'lon': 2.213},
-    'Mont-roig del Camp': {'lat': 41.087, 'lon': 0.957},
-    'Montblanc': {'lat': 41.375, 'lon': 1.161},
-    'Móra d\'Ebre': {'lat': 41.092, 'lon': 0.643},
-    'Olesa de Montserrat': {'lat': 41.545, 'lon': 1.894},
-    'Olot': {'lat': 42.181, 'lon': 2.490},
-    'Palamós': {'lat': 41.846, 'lon': 3.128},
-    'Piera': {'lat': 41.520, 'lon': 1.748},
-    'Premià de Mar': {'lat': 41.491, 'lon': 2.359},
-    'Puigcerdà': {'lat': 42.432, 'lon': 1.928},
-    'Reus': {'lat': 41.155, 'lon': 1.107},
-    'Ripoll': {'lat': 42.201, 'lon': 2.190},
-    'Roses': {'lat': 42.262, 'lon': 3.175},
-    'Rubí': {'lat': 41.493, 'lon': 2.032},
-    'Sabadell': {'lat': 41.547, 'lon': 2.108},
-    'Salou': {'lat': 41.076, 'lon': 1.140},
-    'Sant Adrià de Besòs': {'lat': 41.428, 'lon': 2.219},
-    'Sant Boi de Llobregat': {'lat': 41.346, 'lon': 2.041},
-    'Sant Carles de la Ràpita': {'lat': 40.618, 'lon': 0.593},
-    'Sant Celoni': {'lat': 41.691, 'lon': 2.491},
-    'Sant Cugat del Vallès': {'lat': 41.472, 'lon': 2.085},
-    'Sant Feliu de Guíxols': {'lat': 41.780, 'lon': 3.028},
-    'Sant Feliu de Llobregat': {'lat': 41.381, 'lon': 2.045},
-    'Sant Joan Despí': {'lat': 41.368, 'lon': 2.057},
-    'Santa Coloma de Farners': {'lat': 41.859, 'lon': 2.668},
-    'Santa Coloma de Gramenet': {'lat': 41.454, 'lon': 2.213},
-    'Santa Perpètua de Mogoda': {'lat': 41.536, 'lon': 2.182},
-    'Sitges': {'lat': 41.235, 'lon': 1.811},
-    'Solsona': {'lat': 41.992, 'lon': 1.516},
-    'Sort': {'lat': 42.413, 'lon': 1.129},
-    'Tarragona': {'lat': 41.118, 'lon': 1.245},
-    'Tàrrega': {'lat': 41.646, 'lon': 1.141},
-    'Terrassa': {'lat': 41.561, 'lon': 2.008},
-    'Tortosa': {'lat': 40.812, 'lon': 0.521},
-    'Tremp': {'lat': 42.166, 'lon': 0.894},
-    'Valls': {'lat': 41.286, 'lon': 1.250},
-    'Vic': {'lat': 41.930, 'lon': 2.255},
-    'Vielha': {'lat': 42.702, 'lon': 0.796},
-    'Vila-seca': {'lat': 41.111, 'lon': 1.144},
-    'Viladecans': {'lat': 41.315, 'lon': 2.019},
-    'Vilafranca del Penedès': {'lat': 41.345, 'lon': 1.698},
-    'Vilanova i la Geltrú': {'lat': 41.224, 'lon': 1.725},
-    'Vilassar de Mar': {'lat': 41.506, 'lon': 2.392},
-}
+class ErrorOpenMeteo(Exception):
+    # Una descàrrega fallida: es registra on passa i es torna a llançar; només el fil del guió la mostra a la pàgina
+    pass
+P_LEVELS_AROME = [1000, 925, 850, 700, 600, 500, 400, 300, 250, 200, 150, 100]
+
+# --- CATÀLEG DE LOCALITATS ---
+# El catàleg és a pobles.csv (nom, lat, lon), amb les mateixes localitats que tenia el diccionari, i es llegeix
+# una sola vegada per procés. Es guarda en columnes (noms ordenats i matrius de latituds i longituds) perquè el
+# mostreig de camps, l'agrupació per cel·la i el selector no recorrin diccionaris.
+RUTA_POBLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pobles.csv')
+
+class CatalegLocalitats:
+    __slots__ = ('noms', 'lats', 'lons', 'index', 'coordenades', 'clau')
+
+    def __init__(self, ruta):
+        taula = pd.read_csv(ruta, dtype={'nom': str, 'lat': float, 'lon': float}).sort_values('nom', kind='stable')
+        self.noms = tuple(taula['nom'])
+        self.lats, self.lons = taula['lat'].to_numpy(), taula['lon'].to_numpy()
+        self.index = {nom: i for i, nom in enumerate(self.noms)}
+        self.coordenades = list(zip(self.lats.tolist(), self.lons.tolist()))
+        self.clau = hash(self.noms)
+
+    def __len__(self):
+        return len(self.noms)
+
+    def __iter__(self):
+        return iter(self.noms)
+
+    def __contains__(self, nom):
+        return nom in self.index
+
+    def __getitem__(self, nom):
+        lat, lon = self.coordenades[self.index[nom]]
+        return {'lat': lat, 'lon': lon}
+
+    def files(self, noms):
+        return np.fromiter((self.index[nom] for nom in noms), dtype=int, count=len(noms))
+
+@st.cache_resource
+def obtenir_cataleg_localitats():
+    return CatalegLocalitats(RUTA_POBLES)
+
+pobles_data = obtenir_cataleg_localitats()
+
+# --- GESTIÓ DE LA MEMÒRIA CAU ---
+# Substitueix @st.cache_data a les funcions que reben moltes claus diferents: límit d'entrades i de bytes
+# per memòria cau, expulsió LRU, caducitat, expulsió de tot el que pertany a passades anteriors i claus
+# barates (sense serialitzar arguments grans). Els objectes viuen en un recurs compartit del procés. Les dades
+# d'altres models (per_run=False) no segueixen les passades d'AROME: només caduquen pel ttl.
+def mida_aproximada(obj):
+    if isinstance(obj, np.ndarray): return obj.nbytes
+    if isinstance(obj, (list, tuple)): return sys.getsizeof(obj) + sum(mida_aproximada(o) for o in obj)
+    if isinstance(obj, dict): return sys.getsizeof(obj) + sum(mida_aproximada(k) + mida_aproximada(v) for k, v in obj.items())
+    # Objecte de l'SDK: el buffer de la resposta (compartit per totes les de la mateixa petició)
+    if (buffer := getattr(getattr(obj, '_tab', None), 'Bytes', None)) is not None: return len(buffer)
+    if hasattr(type(obj), '__slots__'): return sys.getsizeof(obj) + sum(mida_aproximada(getattr(obj, a)) for a in type(obj).__slots__)
+    return sys.getsizeof(obj)
+
+class MemoriaCau:
+    def __init__(self, nom, max_entrades, max_bytes, ttl):
+        self.nom, self.max_entrades, self.max_bytes, self.ttl = nom, max_entrades, max_bytes, ttl
+        self._entrades = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = self.encerts = self.errades = self.expulsions = 0
+
+    def obtenir(self, clau, run):
+        with self._lock:
+            entrada = self._entrades.get(clau)
+            if entrada is None or entrada[2] != run or time.time() - entrada[3] > self.ttl:
+                if entrada is not None: self._treure(clau)
+                self.errades += 1
+                return False, None
+            self._entrades.move_to_end(clau); self.encerts += 1
+            return True, entrada[0]
+
+    def desar(self, clau, valor, run):
+        mida = mida_aproximada(valor)
+        with self._lock:
+            if clau in self._entrades: self._treure(clau)
+            self._entrades[clau] = (valor, mida, run, time.time()); self.bytes += mida
+            while self._entrades and (len(self._entrades) > self.max_entrades or self.bytes > self.max_bytes):
+                self._treure(next(iter(self._entrades)))
+
+    def expulsar_runs_antics(self, run):
+        with self._lock:
+            for clau in [c for c, e in self._entrades.items() if e[2] is not None and e[2] != run]: self._treure(clau)
+
+    def _treure(self, clau):
+        _, mida, _, _ = self._entrades.pop(clau); self.bytes -= mida; self.expulsions += 1
+
+    def metriques(self):
+        consultes = self.encerts + self.errades
+        return {'Memòria cau': self.nom, 'Entrades': len(self._entrades), 'Límit entrades': self.max_entrades,
+                'MB': round(self.bytes / 1e6, 2), 'Límit MB': round(self.max_bytes / 1e6, 1),
+                'Encerts (%)': round(100 * self.encerts / consultes, 1) if consultes else 0.0, 'Expulsions': self.expulsions}
+
+class GestorCau:
+    def __init__(self):
+        self.caus = {}
+        self.run = None
+
+    def registrar(self, nom, max_entrades, max_bytes, ttl):
+        if nom not in self.caus: self.caus[nom] = MemoriaCau(nom, max_entrades, max_bytes, ttl)
+        return self.caus[nom]
+
+    def canvi_de_run(self, run):
+        if run != self.run:
+            self.run = run
+            for cau in self.caus.values(): cau.expulsar_runs_antics(run)
+
+    def metriques(self):
+        return [cau.metriques() for cau in self.caus.values()]
+
+@st.cache_resource
+def obtenir_gestor_cau():
+    return GestorCau()
+
+def run_vigent():
+    instantania = obtenir_magatzem_passades().instantania()
+    run = instantania['run'] if instantania else get_arome_run_actual()
+    obtenir_gestor_cau().canvi_de_run(run)
+    return run
+
+def resultat_valid(valor):
+    return valor is not None and not (isinstance(valor, tuple) and valor[0] is None)
+
+def cau_gestionada(nom, max_entrades, max_mb, ttl=3600, clau=None, per_run=True):
+    cau = obtenir_gestor_cau().registrar(nom, max_entrades, int(max_mb * 1e6), ttl)
+    def decorador(func):
+        @functools.wraps(func)
+        def embolcall(*args):
+            k, run = (clau(*args) if clau else args), run_vigent() if per_run else None
+            trobat, valor = cau.obtenir(k, run)
+            if trobat: return valor
+            valor = func(*args)
+            if resultat_valid(valor): cau.desar(k, valor, run)
+            return valor
+        return embolcall
+    return decorador
+
+CLAU_POBLES = pobles_data.clau
+
+# --- PLANIFICADOR DE PETICIONS PER CEL·LA DEL MODEL ---
+# Open-Meteo retorna cada coordenada ajustada a una cel·la d'AROME (Latitude()/Longitude()). Les localitats
+# veïnes que cauen a la mateixa cel·la es demanen i es desen una sola vegada, amb la coordenada de la cel·la.
+HOURLY_SONDEIG = ["temperature_2m", "dew_point_2m", "surface_pressure"] + [f"{v}_{p}hPa" for v in ["temperature", "dew_point", "wind_speed", "wind_direction", "geopotential_height"] for p in P_LEVELS_AROME]
+
+# Les peticions multipunt passen a POST quan les coordenades ja no caben a la URL d'un GET; continuen sent una
+# sola petició i un sol buffer de respostes per a la descodificació directa.
+MAX_PUNTS_GET = 100
+# Si la petició de cel·les falla, no es torna a provar fins passat aquest temps: mentrestant es fan servir les
+# coordenades originals (claus de memòria cau pròpies i fora de l'índex de la instantània)
+ESPERA_REINTENT_CELLES = 60
+
+def peticio_punts(params):
+    metode = "POST" if len(params["latitude"]) > MAX_PUNTS_GET else "GET"
+    return openmeteo.weather_api("https://api.open-meteo.com/v1/forecast", params=params, method=metode)
+
+# --- HORITZÓ PER DIES ---
+# El pronòstic es guarda i es demana a trossos d'un dia local (0 = avui). Cada petició porta start_date/end_date
+# d'un sol dia en lloc de forecast_days, de manera que només es descarrega, descodifica i analitza el dia que es
+# consulta; la resta de dies de l'horitzó de cada model es carreguen en segon pla.
+HORITZO_DIES = {'arome_france': 2, 'icon_d2': 2, 'meteofrance_arpege_europe': 4, 'ecmwf_ifs025': 7}
+NOMS_DIES_SETMANA = ["dl.", "dt.", "dc.", "dj.", "dv.", "ds.", "dg."]
+
+def data_dia(dia):
+    return (datetime.now(pytz.timezone('Europe/Madrid')) + timedelta(days=dia)).date()
+
+def parametres_dia(dia):
+    data = data_dia(dia).isoformat()
+    return {"start_date": data, "end_date": data}
+
+def etiqueta_dia(dia):
+    data = data_dia(dia)
+    return f"{['Avui', 'Demà'][dia] if dia < 2 else NOMS_DIES_SETMANA[data.weekday()]} {data:%d/%m}"
+
+class PlanificadorCelles:
+    def __init__(self):
+        self.celles = {}
+        self._lock = threading.Lock()
+        self._error, self._reintent = None, 0.0
+
+    def resoldre(self, coords):
+        with self._lock: pendents = list(dict.fromkeys(c for c in coords if c not in self.celles)) if time.time() >= self._reintent else []
+        if pendents:
+            params = {"latitude": [c[0] for c in pendents], "longitude": [c[1] for c in pendents], "hourly": ["surface_pressure"],
+                      "models": "arome_france", **parametres_dia(0)}
+            try:
+                responses = peticio_punts(params)
+                with self._lock:
+                    for c, r in zip(pendents, responses): self.celles[c] = (round(float(r.Latitude()), 4), round(float(r.Longitude()), 4))
+                    self._error = None
+            except Exception as e:
+                registre.warning("No s'han pogut resoldre %d coordenades a cel·les d'AROME (%s); nou intent d'aquí a %d s", len(pendents), e, ESPERA_REINTENT_CELLES)
+                with self._lock: self._error, self._reintent = e, time.time() + ESPERA_REINTENT_CELLES
+        return [self.celles.get(c, c) for c in coords]
+
+    def incidencia(self):
+        # Última petició fallida i segons fins al proper intent, o None
+        with self._lock: return (self._error, max(0.0, self._reintent - time.time())) if self._error is not None else None
+
+    def metriques(self, coords):
+        return len(coords), len(set(self.resoldre(coords)))
+
+@st.cache_resource
+def obtenir_planificador_celles():
+    return PlanificadorCelles()
+
+def coordenades_pobles():
+    return pobles_data.coordenades
+
+def celles_de(coords):
+    # Primer el catàleg sencer (una sola petició), després les coordenades demanades
+    planificador = obtenir_planificador_celles()
+    planificador.resoldre(coordenades_pobles())
+    return planificador.resoldre(coords)
+
+def cela_de(lat, lon):
+    return celles_de([(lat, lon)])[0]
+
+# --- DESCODIFICACIÓ DIRECTA DE LES RESPOSTES ---
+# Les respostes d'una petició són FlatBuffers consecutius dins del mateix buffer de bytes. En lloc de crear
+# un objecte de l'SDK per variable (Variables(i).ValuesAsNumpy()), es recorren d'un sol cop les taules de
+# totes les respostes amb lectures vectoritzades dels offsets i s'obté la posició de cada vector de valors.
+# Si els vectors estan equiespaiats (el cas habitual) el resultat és una vista (respostes, variables, hores)
+# sobre el buffer, sense cap còpia; si no, una sola recollida de bytes els posa en una matriu contigua.
+# Les entrades de la vtaula es pregunten a les classes generades de l'SDK (versió fixada a requirements.txt) i
+# cada resultat es contrasta amb ValuesAsNumpy() de la primera i l'última variable abans de fer-lo servir.
+class SondaTaula:
+    # _tab fals: anota l'entrada de la vtaula que llegeix un accessor de l'SDK i li diu que el camp no hi és
+    def Offset(self, entrada):
+        self.entrada = entrada; return 0
+
+def entrada_vtaula(classe, accessor, *args):
+    objecte, sonda = classe(), SondaTaula()
+    objecte._tab = sonda; getattr(objecte, accessor)(*args)
+    return sonda.entrada
+
+ENTRADA_HOURLY = entrada_vtaula(WeatherApiResponse, 'Hourly')
+ENTRADA_VARIABLES = entrada_vtaula(VariablesWithTime, 'Variables', 0)
+ENTRADA_VALORS = entrada_vtaula(VariableWithValues, 'ValuesAsNumpy')
+
+def llegir_enters(b, posicions, tipus):
+    mida = np.dtype(tipus).itemsize
+    return b[np.asarray(posicions)[..., None] + np.arange(mida)].view(tipus)[..., 0].astype(np.int64)
+
+def camp_taula(b, taules, entrada):
+    # Posició on apunta el camp (taula o vector) de cada taula; -1 si el camp no hi és
+    vtaules = taules - llegir_enters(b, taules, '<i4')
+    camp = np.where(llegir_enters(b, vtaules, '<u2') > entrada, llegir_enters(b, vtaules + entrada, '<u2'), 0)
+    return np.where((camp > 0) & (taules >= 0), taules + camp + llegir_enters(b, taules + camp, '<u4'), -1)
+
+def posicions_valors(b, arrels):
+    # Per a cada resposta i variable horària: inici i longitud del vector de valors
+    llistes = camp_taula(b, camp_taula(b, arrels, ENTRADA_HOURLY), ENTRADA_VARIABLES)
+    if (llistes < 0).any(): return None, None
+    n_vars = llegir_enters(b, llistes, '<u4')
+    if (n_vars != n_vars[0]).any(): return None, None
+    entrades = (llistes + 4)[:, None] + 4 * np.arange(n_vars[0])
+    vectors = camp_taula(b, entrades + llegir_enters(b, entrades, '<u4'), ENTRADA_VALORS)
+    return np.where(vectors >= 0, vectors + 4, -1), np.where(vectors >= 0, llegir_enters(b, vectors, '<u4'), 0)
+
+def valors_respostes_sdk(responses):
+    primera = responses[0].Hourly()
+    sortida = np.empty((len(responses), primera.VariablesLength(), len(primera.Variables(0).ValuesAsNumpy())), dtype=np.float32)
+    for i, r in enumerate(responses):
+        hourly = r.Hourly()
+        for j in range(sortida.shape[1]): sortida[i, j] = hourly.Variables(j).ValuesAsNumpy()
+    return sortida
+
+def valors_directes(responses):
+    # Lectura directa del buffer, o None si l'estructura no és la que s'espera
+    if not all(hasattr(r, '_tab') for r in responses) or any(r._tab.Bytes is not responses[0]._tab.Bytes for r in responses): return None
+    buffer = responses[0]._tab.Bytes; b = np.frombuffer(buffer, dtype=np.uint8)
+    posicions, longituds = posicions_valors(b, np.array([r._tab.Pos for r in responses]))
+    if posicions is None or (posicions < 0).any() or (longituds != longituds.flat[0]).any(): return None
+    n_hores = int(longituds.flat[0])
+    pas_var = np.unique(np.diff(posicions, axis=1)); pas_resp = np.unique(np.diff(posicions[:, 0]))
+    if len(pas_var) <= 1 and len(pas_resp) <= 1:
+        pas_var = int(pas_var[0]) if len(pas_var) else 4 * n_hores
+        pas_resp = int(pas_resp[0]) if len(pas_resp) else pas_var * posicions.shape[1]
+        return np.ndarray(posicions.shape + (n_hores,), dtype='<f4', buffer=buffer, offset=int(posicions[0, 0]), strides=(pas_resp, pas_var, 4))
+    return b[posicions[..., None] + np.arange(4 * n_hores)].view('<f4')
+
+def valors_respostes(responses):
+    # Matriu (respostes, variables, hores) de float32
+    valors = valors_directes(responses)
+    if valors is not None:
+        for i, j in ((0, 0), (-1, -1)):
+            if not np.array_equal(valors[i, j], responses[i].Hourly().Variables(j % valors.shape[1]).ValuesAsNumpy(), equal_nan=True):
+                registre.warning("La lectura directa no coincideix amb l'SDK (resposta %s, variable %s); es descodifica amb l'SDK", i, j); valors = None; break
+    return valors if valors is not None else valors_respostes_sdk(responses)
 
 # --- FUNCIONS ---
 def get_next_arome_update_time():
@@ -145,13 +363,28 @@ def get_next_arome_update_time():
     next_update_local = next_update_time.astimezone(local_tz)
     return f"Pròxima actualització de dades (model AROME) estimada a les **{next_update_local.strftime('%H:%Mh')}**"
 
+def get_arome_run_actual():
+    now_utc = datetime.now(pytz.utc)
+    availability_delay = timedelta(hours=4)
+    disponible = now_utc - availability_delay
+    run_datetime = disponible.replace(hour=(disponible.hour // 6) * 6, minute=0, second=0, microsecond=0)
+    return run_datetime.strftime('%Y%m%d%HZ')
+
 def get_parameter_style(param_name, value):
     color = "white"; emoji = ""
     if value is None or not isinstance(value, (int, float)): return color, emoji
-    if param_name == 'CIN_Fre':
+    if param_name == 'CIN_Fre' or param_name.startswith('CIN_'):
         if value >= -25: color, emoji = "#32CD32", "✅"
         elif value < -100: color, emoji = "#FF4500", "⚠️"
         elif value < -25: color, emoji = "#FFA500", ""
+    elif param_name == 'DCAPE':
+        if value > 1200: color, emoji = "#FF4500", "⚠️"
+        elif value > 800: color, emoji = "#FFA500", ""
+    elif param_name in ('STP', 'SCP', 'SHIP'):
+        moderat, alt = {'STP': (1, 3), 'SCP': (1, 4), 'SHIP': (1, 2)}[param_name]
+        if value > alt: color, emoji = "#FF4500", "⚠️"
+        elif value > moderat: color, emoji = "#FFA500", ""
+        elif value > 0.5 * moderat: color = "#32CD32"
     elif 'CAPE' in param_name:
         if value > 3500: color, emoji = "#FF00FF", "⚠️"
         elif value > 2500: color, emoji = "#FF4500", "⚠️"
@@ -170,35 +403,54 @@ def get_parameter_style(param_name, value):
         elif value < 1500: color = "#32CD32"
     return color, emoji
 
+# Avisos per ordre de gravetat; generar_avis_localitat i generar_avis_lot comparteixen textos i regles
+AVISOS = [
+    ("Sense risc de tempestes significatives. Atmosfera estable.", "#3CB371"),
+    ("Sense risc de tempestes. La 'tapa' atmosfèrica (CIN) és massa forta per permetre el seu desenvolupament.", "#3CB371"),
+    ("Risc molt baix de tempestes. El nivell d'inici de la convecció (LFC) és massa alt i difícil d'assolir.", "#4682B4"),
+    ("Risc Baix: Possibles xàfecs o tempestes febles i aïllades (unicel·lulars).", "#4682B4"),
+    ("PRECAUCIÓ: Risc de TEMPESTES ORGANITZADES (multicèl·lules). Possibles fortes pluges i calamarsa.", "#FFD700"),
+    ("AVÍS: Potencial per a SUPERCL·LULES. Risc de calamarsa grossa i fortes ratxes de vent.", "#FF8C00"),
+    ("RISC ALT: Condicions favorables per a SUPERCL·LULES amb potencial de TORNADOS.", "#DC143C"),
+]
+
 def generar_avis_localitat(params):
-    cape_u = params.get('CAPE_Utilitzable', {}).get('value', 0)
-    cin = params.get('CIN_Fre', {}).get('value')
-    shear = params.get('Shear_0-6km', {}).get('value')
-    srh1 = params.get('SRH_0-1km', {}).get('value')
-    lcl_agl = params.get('LCL_AGL', {}).get('value', 9999)
-    lfc_agl = params.get('LFC_AGL', {}).get('value', 9999)
+    cape_u = params.get('CAPE_Utilitzable', 0)
+    cin = params.get('CIN_Fre')
+    shear = params.get('Shear_0-6km')
+    srh1 = params.get('SRH_0-1km')
+    lcl_agl = params.get('LCL_AGL', 9999)
+    lfc_agl = params.get('LFC_AGL', 9999)
 
     if cape_u < 100:
-        return ("Sense risc de tempestes significatives. Atmosfera estable.", "#3CB371")
+        return AVISOS[0]
     if cin is not None and cin < -100:
-        return ("Sense risc de tempestes. La 'tapa' atmosfèrica (CIN) és massa forta per permetre el seu desenvolupament.", "#3CB371")
+        return AVISOS[1]
     if lfc_agl > 3000:
-        return ("Risc molt baix de tempestes. El nivell d'inici de la convecció (LFC) és massa alt i difícil d'assolir.", "#4682B4")
+        return AVISOS[2]
 
     if shear is not None and shear > 20 and cape_u > 1500 and srh1 is not None and srh1 > 250 and lcl_agl < 1200:
-        return ("RISC ALT: Condicions favorables per a SUPERCL·LULES amb potencial de TORNADOS.", "#DC143C")
+        return AVISOS[6]
     if shear is not None and shear > 18 and cape_u > 1000:
-        return ("AVÍS: Potencial per a SUPERCL·LULES. Risc de calamarsa grossa i fortes ratxes de vent.", "#FF8C00")
+        return AVISOS[5]
     if shear is not None and shear > 12 and cape_u > 500:
-        return ("PRECAUCIÓ: Risc de TEMPESTES ORGANITZADES (multicèl·lules). Possibles fortes pluges i calamarsa.", "#FFD700")
+        return AVISOS[4]
+
+    return AVISOS[3]
 
-    return ("Risc Baix: Possibles xàfecs o tempestes febles i aïllades (unicel·lulars).", "#4682B4")
+def generar_avis_lot(lot):
+    # Les mateixes regles sobre matrius de paràmetres; un NaN equival a un paràmetre absent. Retorna índexs d'AVISOS
+    cape_u, lcl_agl, lfc_agl = np.nan_to_num(lot['CAPE_Utilitzable'], nan=0), np.nan_to_num(lot['LCL_AGL'], nan=9999), np.nan_to_num(lot['LFC_AGL'], nan=9999)
+    cin, shear, srh1 = lot['CIN_Fre'], lot['Shear_0-6km'], lot['SRH_0-1km']
+    with np.errstate(invalid='ignore'):
+        condicions = [cape_u < 100, cin < -100, lfc_agl > 3000, (shear > 20) & (cape_u > 1500) & (srh1 > 250) & (lcl_agl < 1200), (shear > 18) & (cape_u > 1000), (shear > 12) & (cape_u > 500)]
+    return np.select(condicions, [0, 1, 2, 6, 5, 4], default=3)
 
 def generar_analisi_detallada(params):
     conversa = []
-    cape, cin, cape_u, pwat = (params.get(k, {}).get('value') for k in ['CAPE_Brut', 'CIN_Fre', 'CAPE_Utilitzable', 'PWAT_Total'])
-    shear6, srh1, srh3 = (params.get(k, {}).get('value') for k in ['Shear_0-6km', 'SRH_0-1km', 'SRH_0-3km'])
-    lcl_agl, lfc_agl, el_msl = (params.get(k, {}).get('value') for k in ['LCL_AGL', 'LFC_AGL', 'EL_MSL'])
+    cape, cin, cape_u, pwat = (params.get(k) for k in ['CAPE_Brut', 'CIN_Fre', 'CAPE_Utilitzable', 'PWAT_Total'])
+    shear6, srh1, srh3 = (params.get(k) for k in ['Shear_0-6km', 'SRH_0-1km', 'SRH_0-3km'])
+    lcl_agl, lfc_agl, el_msl = (params.get(k) for k in ['LCL_AGL', 'LFC_AGL', 'EL_MSL'])
 
     conversa.append("--- ANÀLISI TERMODINÀMICA ---")
     if cape is None or cape < 100:
@@ -255,28 +507,50 @@ def generar_analisi_detallada(params):
 
     return conversa
 
-@st.cache_data
-def obtener_sondeo_atmosferico(lat, lon):
+def obtener_sondeo_atmosferico(lat, lon, dia=0):
+    return obtener_sondeo_cela(*cela_de(lat, lon), dia)
+
+@cau_gestionada('Sondeigs', max_entrades=150, max_mb=64)
+def obtener_sondeo_cela(lat, lon, dia=0):
     url = "https://api.open-meteo.com/v1/forecast"
-    p_levels = [1000, 925, 850, 700, 600, 500, 400, 300, 250, 200, 150, 100]
-    h_base = ["temperature_2m", "dew_point_2m", "surface_pressure"]
-    h_press = [f"{v}_{p}hPa" for v in ["temperature", "dew_point", "wind_speed", "wind_direction", "geopotential_height"] for p in p_levels]
+    p_levels = P_LEVELS_AROME
     params = {
         "latitude": lat, "longitude": lon, 
-        "hourly": h_base + h_press, 
+        "hourly": HOURLY_SONDEIG, 
         "models": "arome_france", 
         "timezone": "auto", 
-        "forecast_days": 1
+        **parametres_dia(dia)
     }
     try: 
         r = openmeteo.weather_api(url, params=params)
         return r[0] if r else None, p_levels
     except Exception as e: 
-        st.error(f"Error a l'API d'Open-Meteo: {e}")
-        return None, None
+        registre.warning("Sondeig de la cel·la (%s, %s), dia %s: %s", lat, lon, dia, e)
+        raise ErrorOpenMeteo(e) from e
+
+def obtener_sondeigs_lot(coords, dia=0):
+    # Una sola petició per a totes les cel·les que encara no són a la memòria cau; després es reparteix
+    celles = celles_de(list(coords))
+    cau, run = obtenir_gestor_cau().caus['Sondeigs'], run_vigent()
+    falten = [c for c in dict.fromkeys(celles) if not cau.obtenir((*c, dia), run)[0]]
+    if falten:
+        params = {"latitude": [c[0] for c in falten], "longitude": [c[1] for c in falten], "hourly": HOURLY_SONDEIG,
+                  "models": "arome_france", "timezone": "auto", **parametres_dia(dia)}
+        try:
+            for c, r in zip(falten, peticio_punts(params)): cau.desar((*c, dia), (r, P_LEVELS_AROME), run)
+        except Exception as e:
+            # Les cel·les que falten es tornen a demanar una a una a sota (i fallen amb ErrorOpenMeteo si cal)
+            registre.warning("Sondeigs en lot (%d cel·les), dia %s: %s", len(falten), dia, e)
+    return [obtener_sondeo_cela(*c, dia) for c in celles]
+
+def interpolate_sfc(sfc_val, p_sfc, p_api, d_api):
+    if np.isnan(sfc_val):
+        valid_p = [p for p, t in zip(p_api, d_api) if not np.isnan(t)]; valid_d = [t for t in d_api if not np.isnan(t)]
+        if len(valid_p) > 1: p_sorted, d_sorted = zip(*sorted(zip(valid_p, valid_d))); return np.interp(p_sfc, p_sorted, d_sorted)
+    return sfc_val
 
 def calculate_parameters(p, T, Td, u, v, h):
-    params = {}
+    params = dict.fromkeys(NOMS_PARAMETRES)
     def get_val(qty, unit=None):
         try: return qty.to(unit).m if unit else qty.m
         except: return None
@@ -285,24 +559,24 @@ def calculate_parameters(p, T, Td, u, v, h):
         parcel_prof = mpcalc.parcel_profile(p, T[0], Td[0])
         cape, cin = mpcalc.cape_cin(p, T, Td, parcel_prof)
         raw_cape = get_val(cape, 'J/kg'); raw_cin = get_val(cin, 'J/kg')
-        params['CAPE_Brut'] = {'value': raw_cape, 'units': 'J/kg'}; params['CIN_Fre'] = {'value': raw_cin, 'units': 'J/kg'}
+        params['CAPE_Brut'] = raw_cape; params['CIN_Fre'] = raw_cin
     except: pass
-    if raw_cape is not None and raw_cin is not None: params['CAPE_Utilitzable'] = {'value': max(0, raw_cape - abs(raw_cin)), 'units': 'J/kg'}
-    try: lcl_p, _ = mpcalc.lcl(p[0], T[0], Td[0]); lcl_h = mpcalc.pressure_to_height_std(lcl_p); params['LCL_AGL'] = {'value': get_val(lcl_h - h[0], 'm'), 'units': 'm'}
+    if raw_cape is not None and raw_cin is not None: params['CAPE_Utilitzable'] = max(0, raw_cape - abs(raw_cin))
+    try: lcl_p, _ = mpcalc.lcl(p[0], T[0], Td[0]); lcl_h = mpcalc.pressure_to_height_std(lcl_p); params['LCL_AGL'] = get_val(lcl_h - h[0], 'm')
     except: pass
-    try: lfc_p, _ = mpcalc.lfc(p, T, Td); lfc_h = mpcalc.pressure_to_height_std(lfc_p); params['LFC_AGL'] = {'value': get_val(lfc_h - h[0], 'm'), 'units': 'm'}
+    try: lfc_p, _ = mpcalc.lfc(p, T, Td); lfc_h = mpcalc.pressure_to_height_std(lfc_p); params['LFC_AGL'] = get_val(lfc_h - h[0], 'm')
     except: pass
-    try: el_p, _ = mpcalc.el(p, T, Td); el_h = mpcalc.pressure_to_height_std(el_p); params['EL_MSL'] = {'value': get_val(el_h, 'km'), 'units': 'km'}
+    try: el_p, _ = mpcalc.el(p, T, Td); el_h = mpcalc.pressure_to_height_std(el_p); params['EL_MSL'] = get_val(el_h, 'km')
     except: pass
-    try: s_u, s_v = mpcalc.bulk_shear(p, u, v, height=h, depth=6*units.km); params['Shear_0-6km'] = {'value': get_val(mpcalc.wind_speed(s_u, s_v), 'm/s'), 'units': 'm/s'}
+    try: s_u, s_v = mpcalc.bulk_shear(p, u, v, height=h, depth=6*units.km); params['Shear_0-6km'] = get_val(mpcalc.wind_speed(s_u, s_v), 'm/s')
     except: pass
-    try: _, srh, _ = mpcalc.storm_relative_helicity(h, u, v, depth=1*units.km); params['SRH_0-1km'] = {'value': get_val(srh), 'units': 'm²/s²'}
+    try: _, _, srh = mpcalc.storm_relative_helicity(h, u, v, depth=1*units.km); params['SRH_0-1km'] = get_val(srh)
     except: pass
-    try: _, srh, _ = mpcalc.storm_relative_helicity(h, u, v, depth=3*units.km); params['SRH_0-3km'] = {'value': get_val(srh), 'units': 'm²/s²'}
+    try: _, _, srh = mpcalc.storm_relative_helicity(h, u, v, depth=3*units.km); params['SRH_0-3km'] = get_val(srh)
     except: pass
-    try: pwat = mpcalc.precipitable_water(p, Td); params['PWAT_Total'] = {'value': get_val(pwat, 'mm'), 'units': 'mm'}
+    try: pwat = mpcalc.precipitable_water(p, Td); params['PWAT_Total'] = get_val(pwat, 'mm')
     except: pass
-    return params
+    return ConjuntParametres.de_valors(params)
 
 def crear_hodograf(p, u, v, h):
     fig, ax = plt.subplots(1, 1, figsize=(5, 5))
@@ -314,37 +588,108 @@ def crear_hodograf(p, u, v, h):
     ax.set_xlabel('kt'); ax.set_ylabel('kt')
     return fig
 
-def crear_skewt(p, T, Td, u, v):
-    fig = plt.figure(figsize=(7, 9))
-    skew = SkewT(fig, rotation=45)
-    skew.plot(p, T, 'r', lw=2, label='T'); skew.plot(p, Td, 'b', lw=2, label='Td'); skew.plot_barbs(p, u, v, length=7, color='white')
+# --- FONS ESTÀTIC DEL SKEW-T ---
+# Eixos, adiabàtiques seques i humides, línies de mescla i isoterma de 0 °C són iguals per a tots els sondeigs:
+# es dibuixen una sola vegada en un llenç Agg i se'n guarda el raster. Cada sondeig restaura aquest fons i només
+# dibuixa les seves traces (T, Td, parcel·la, vent...), que s'esborren després. El PNG surt a la mateixa
+# resolució que st.pyplot (200 ppp) i retallat com bbox_inches='tight'.
+PPP_SKEWT = 200
+
+def dibuixar_fons_skewt(skew):
     skew.plot_dry_adiabats(color='lightcoral', ls='--', alpha=0.5); skew.plot_moist_adiabats(color='cornflowerblue', ls='--', alpha=0.5); skew.plot_mixing_lines(color='lightgreen', ls='--', alpha=0.5)
-    skew.ax.axvline(0, color='darkturquoise', linestyle='--', label='Isoterma 0°C')
-    if len(p) > 1:
-        try:
-            prof = mpcalc.parcel_profile(p, T[0], Td[0]); skew.plot(p, prof, 'k', lw=2, ls='--', label='Parcela')
-            wet_bulb_prof = mpcalc.wet_bulb_temperature(p, T, Td); skew.plot(p, wet_bulb_prof, color='purple', lw=1.5, label='Tª Humida')
-            cape, cin = mpcalc.cape_cin(p, T, Td, prof)
-            if cape.m > 0: skew.shade_cape(p, T, prof, alpha=0.4, color='khaki')
-            if cin.m != 0: skew.shade_cin(p, T, prof, alpha=0.3, color='lightgray')
-            lcl_p, _ = mpcalc.lcl(p[0], T[0], Td[0]); lfc_p, _ = mpcalc.lfc(p, T, Td, prof); el_p, _ = mpcalc.el(p, T, Td, prof)
-            if lcl_p: skew.ax.axhline(lcl_p.m, color='purple', linestyle='--', label='LCL')
-            if lfc_p: skew.ax.axhline(lfc_p.m, color='darkred', linestyle='--', label='LFC')
-            if el_p: skew.ax.axhline(el_p.m, color='red', linestyle='--', label='EL')
-        except: pass
-    skew.ax.set_ylim(1050, 100); skew.ax.set_xlim(-50, 40); skew.ax.set_xlabel('°C'); skew.ax.set_ylabel('hPa'); plt.legend()
+    skew.ax.axvline(0, color='darkturquoise', linestyle='--')
+    skew.ax.set_ylim(1050, 100); skew.ax.set_xlim(-50, 40); skew.ax.set_xlabel('°C'); skew.ax.set_ylabel('hPa')
+
+def figura_agg(**opcions):
+    # Figura fora de pyplot, amb el seu propi llenç Agg com FonsSkewT: el gestor global de figures de pyplot no és
+    # segur entre fils, i les figures que es dibuixen al grup de fils de la pàgina no hi han de passar
+    fig = Figure(**opcions); FigureCanvasAgg(fig)
     return fig
 
+def png_figura(fig):
+    memoria = io.BytesIO(); fig.savefig(memoria, format='png', dpi=PPP_SKEWT, bbox_inches='tight')
+    return memoria.getvalue()
+
+def renderitzar_skewt_complet(dibuixar):
+    # Camí de referència: figura nova amb el fons redibuixat a cada sondeig
+    fig = figura_agg(figsize=(7, 9)); skew = SkewT(fig, rotation=45)
+    dibuixar_fons_skewt(skew); dibuixar(skew)
+    return png_figura(fig)
+
+class FonsSkewT:
+    def __init__(self, ppp=PPP_SKEWT):
+        self.fig = Figure(figsize=(7, 9), dpi=ppp); self.llenc = FigureCanvasAgg(self.fig)
+        self.skew = SkewT(self.fig, rotation=45); dibuixar_fons_skewt(self.skew); self.skew.ax.set_autoscale_on(False)
+        self.llenc.draw(); self.fons = self.llenc.copy_from_bbox(self.fig.bbox)
+        caixa = self.fig.get_tightbbox(self.llenc.get_renderer()).padded(0.1)
+        alt = self.llenc.get_width_height()[1]
+        self.retall = (slice(max(0, int(alt - caixa.y1 * ppp)), int(alt - caixa.y0 * ppp)), slice(max(0, int(caixa.x0 * ppp)), int(caixa.x1 * ppp)))
+        self.bloqueig = threading.Lock()
+
+    def renderitzar(self, dibuixar):
+        # Un sol llenç per procés: les sessions s'hi alternen amb el bloqueig
+        ax = self.skew.ax
+        with self.bloqueig:
+            abans = set(map(id, ax.get_children()))
+            try:
+                dibuixar(self.skew)
+                nous = sorted((a for a in ax.get_children() if id(a) not in abans), key=lambda a: a.get_zorder())
+                self.llenc.restore_region(self.fons)
+                for artista in nous: ax.draw_artist(artista)
+                imatge = np.asarray(self.llenc.buffer_rgba())[self.retall].copy()
+            finally:
+                for artista in [a for a in ax.get_children() if id(a) not in abans]: artista.remove()
+        memoria = io.BytesIO(); plt.imsave(memoria, imatge, format='png', pil_kwargs={'compress_level': 1})
+        return memoria.getvalue()
+
+@st.cache_resource
+def obtenir_fons_skewt():
+    return FonsSkewT()
+
+def crear_skewt(p, T, Td, u, v, taula=None, renderitzar=None):
+    def dibuixar(skew):
+        skew.plot(p, T, 'r', lw=2, label='T'); skew.plot(p, Td, 'b', lw=2, label='Td'); skew.plot_barbs(p, u, v, length=7, color='white')
+        skew.ax.plot([], [], color='darkturquoise', linestyle='--', label='Isoterma 0°C')
+        if len(p) > 1:
+            try:
+                if taula is None:
+                    prof = mpcalc.parcel_profile(p, T[0], Td[0]); wet_bulb_prof = mpcalc.wet_bulb_temperature(p, T, Td)
+                else:
+                    p_m, t_k = p.to('hPa').m, T.to('K').m; td_k = Td.to('K').m
+                    prof = perfil_parcela_lot(p_m[None], p_m[:1], t_k[:1], td_k[:1], taula)[0][0] * units.K
+                    wet_bulb_prof = (taula.bulb_humit(p_m, t_k, td_k) * units.K).to('degC')
+                skew.plot(p, prof, 'k', lw=2, ls='--', label='Parcela'); skew.plot(p, wet_bulb_prof, color='purple', lw=1.5, label='Tª Humida')
+                cape, cin = mpcalc.cape_cin(p, T, Td, prof)
+                if cape.m > 0: skew.shade_cape(p, T, prof, alpha=0.4, color='khaki')
+                if cin.m != 0: skew.shade_cin(p, T, prof, alpha=0.3, color='lightgray')
+                lcl_p, _ = mpcalc.lcl(p[0], T[0], Td[0]); lfc_p, _ = mpcalc.lfc(p, T, Td, prof); el_p, _ = mpcalc.el(p, T, Td, prof)
+                if lcl_p: skew.ax.axhline(lcl_p.m, color='purple', linestyle='--', label='LCL')
+                if lfc_p: skew.ax.axhline(lfc_p.m, color='darkred', linestyle='--', label='LFC')
+                if el_p: skew.ax.axhline(el_p.m, color='red', linestyle='--', label='EL')
+            except: pass
+        skew.ax.legend()
+    return (renderitzar or obtenir_fons_skewt().renderitzar)(dibuixar)
+
 def display_metrics(params_dict):
     param_map = [('CIN (Fre)', 'CIN_Fre'), ('CAPE (Brut)', 'CAPE_Brut'), ('Shear 0-6km', 'Shear_0-6km'), ('CAPE Utilitzable', 'CAPE_Utilitzable'), ('LCL (AGL)', 'LCL_AGL'), ('LFC (AGL)', 'LFC_AGL'), ('EL (MSL)', 'EL_MSL'), ('SRH 0-1km', 'SRH_0-1km'), ('SRH 0-3km', 'SRH_0-3km'), ('PWAT Total', 'PWAT_Total')]
-    st.markdown("""<style>.metric-container{border:1px solid rgba(255,255,255,0.1);border-radius:10px;padding:10px;margin-bottom:10px;}</style>""", unsafe_allow_html=True)
     available_params = [ (label, key) for label, key in param_map ]
-    
+    mostrar_targetes(params_dict, available_params)
+    if any(key in params_dict for _, key in ETIQUETES_INDEXS):
+        st.markdown("**Índexs de temps sever**")
+        mostrar_targetes(params_dict, ETIQUETES_INDEXS)
+    if 'Tipus_Precipitacio' in params_dict:
+        st.markdown(f"**Hivern: {TIPUS_PRECIPITACIO[int(params_dict['Tipus_Precipitacio'])][0].lower()} si hi ha precipitació**")
+        mostrar_targetes(params_dict, ETIQUETES_PRECIPITACIO)
+    # Variants de parcel·la, només quan s'han calculat (mode d'anàlisi SB/ML/MU)
+    if any(f'CAPE_{tipus}' in params_dict for tipus in PARCELLES):
+        st.markdown("**Parcel·les SB · ML · MU**")
+        mostrar_targetes(params_dict, [(f"{nom} {tipus}", f"{clau}_{tipus}") for tipus in PARCELLES for nom, clau in (('CAPE', 'CAPE'), ('CIN', 'CIN'), ('LFC (AGL)', 'LFC'), ('EL (MSL)', 'EL'))])
+
+def mostrar_targetes(params_dict, available_params):
     cols = st.columns(min(4, len(available_params)))
     for i, (label, key) in enumerate(available_params):
-        param = params_dict.get(key, {})
-        value = param.get('value')
-        units_str = param.get('units', '')
+        value = params_dict.get(key)
+        units_str = params_dict.unitats(key)
 
         if value is None or not isinstance(value, (int, float)):
             val_str = "Sense dades"
@@ -369,8 +714,8 @@ def display_metrics(params_dict):
             st.markdown(html, unsafe_allow_html=True)
 
 def crear_grafic_orografia(params, zero_iso_h_agl):
-    lcl_agl = params.get('LCL_AGL', {}).get('value')
-    lfc_agl = params.get('LFC_AGL', {}).get('value')
+    lcl_agl = params.get('LCL_AGL')
+    lfc_agl = params.get('LFC_AGL')
     if lcl_agl is None or np.isnan(lcl_agl): return None
     fig, ax = plt.subplots(figsize=(8, 6), dpi=120)
     ax.set_yticks(np.arange(0, 10.1, 0.5)); ax.set_facecolor('#4169E1')
@@ -421,15 +766,15 @@ def crear_grafic_orografia(params, zero_iso_h_agl):
     return fig
 
 def crear_grafic_nuvol(params, H, u, v, is_convergence_active):
-    lcl_agl = params.get('LCL_AGL', {}).get('value')
-    lfc_agl = params.get('LFC_AGL', {}).get('value')
-    el_msl_km = params.get('EL_MSL', {}).get('value')
-    cape = params.get('CAPE_Brut', {}).get('value', 0)
-    srh1 = params.get('SRH_0-1km', {}).get('value')
+    lcl_agl = params.get('LCL_AGL')
+    lfc_agl = params.get('LFC_AGL')
+    el_msl_km = params.get('EL_MSL')
+    cape = params.get('CAPE_Brut', 0)
+    srh1 = params.get('SRH_0-1km')
     
     if lcl_agl is None or el_msl_km is None: return None
     
-    fig, ax = plt.subplots(figsize=(6, 9), dpi=120)
+    fig = figura_agg(figsize=(6, 9), dpi=120); ax = fig.subplots()
     ax.set_facecolor('#4F94CD'); sky_cmap = mcolors.LinearSegmentedColormap.from_list("sky", ["#4F94CD", "#B0E0E6"])
     ax.imshow(np.linspace(0, 1, 256).reshape(-1, 1), aspect='auto', cmap=sky_cmap, origin='lower', extent=[-5, 5, 0, 16])
     ax.add_patch(Polygon([(-5, 0), (5, 0), (5, 0.5), (-5, 0.5)], color='#3A1F04'))
@@ -478,77 +823,50 @@ def crear_grafic_nuvol(params, H, u, v, is_convergence_active):
     ax.set_xticks([]); ax.grid(axis='y', linestyle='--', alpha=0.3)
     return fig
 
-@st.cache_data
-def obtener_dades_mapa_vents(hora, nivell):
-    lats = np.linspace(40.5, 42.8, 12)
-    lons = np.linspace(0.2, 3.3, 12)
-    lon_grid, lat_grid = np.meshgrid(lons, lats)
+# Malla regular de la graella de vents (files de latitud, columnes de longitud, ordenada fila a fila)
+LATS_GRAELLA, LONS_GRAELLA = np.linspace(40.5, 42.8, 12), np.linspace(0.2, 3.3, 12)
+
+@cau_gestionada('Vents graella', max_entrades=96, max_mb=16)
+def obtener_dades_mapa_vents(hora, nivell, dia=0):
+    lon_grid, lat_grid = np.meshgrid(LONS_GRAELLA, LATS_GRAELLA)
     
     params = {
         "latitude": lat_grid.flatten().tolist(),
         "longitude": lon_grid.flatten().tolist(),
         "hourly": [f"wind_speed_{nivell}hPa", f"wind_direction_{nivell}hPa"],
-        "models": "arome_france", "timezone": "auto", "forecast_days": 1
+        "models": "arome_france", "timezone": "auto", **parametres_dia(dia)
     }
     try:
         url = "https://api.open-meteo.com/v1/forecast"
         responses = openmeteo.weather_api(url, params=params)
-        lats_out, lons_out, speeds_out, dirs_out = [], [], [], []
-        for r in responses:
-            hourly = r.Hourly()
-            speed = hourly.Variables(0).ValuesAsNumpy()[hora]
-            direction = hourly.Variables(1).ValuesAsNumpy()[hora]
-            if not np.isnan(speed) and not np.isnan(direction):
-                lats_out.append(r.Latitude())
-                lons_out.append(r.Longitude())
-                speeds_out.append(speed)
-                dirs_out.append(direction)
-        return lats_out, lons_out, speeds_out, dirs_out
+        valors = valors_respostes(responses)[:, :, hora]
+        lats_r, lons_r = np.array([r.Latitude() for r in responses]), np.array([r.Longitude() for r in responses])
+        ok = ~np.isnan(valors[:, 0]) & ~np.isnan(valors[:, 1])
+        return lats_r[ok].tolist(), lons_r[ok].tolist(), valors[ok, 0].tolist(), valors[ok, 1].tolist()
     except:
         return None, None, None, None
 
 def crear_mapa_vents(lats, lons, u_comp, v_comp, comarcas, nivell):
-    fig = plt.figure(figsize=(9, 9), dpi=150)
+    # El fons i les capes de l'hora són els mateixos que els dels fotogrames de l'animació (animacio_convergencia.py)
+    fig = figura_agg(figsize=(9, 9), dpi=150)
     ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
-    ax.set_extent([0, 3.5, 40.4, 43], crs=ccrs.PlateCarree())
-
-    ax.add_feature(cfeature.LAND, facecolor="#E0E0E0", zorder=0)
-    ax.add_feature(cfeature.OCEAN, facecolor='#b0c4de', zorder=0)
-    ax.add_feature(cfeature.COASTLINE, edgecolor='black', linewidth=0.5, zorder=1)
-    ax.add_feature(cfeature.BORDERS, linestyle=':', edgecolor='black', zorder=1)
-
-    grid_lon = np.linspace(min(lons), max(lons), 100)
-    grid_lat = np.linspace(min(lats), max(lats), 100)
-    X, Y = np.meshgrid(grid_lon, grid_lat)
-    points = np.vstack((lons, lats)).T
-    u_grid = griddata(points, u_comp.m, (X, Y), method='cubic')
-    v_grid = griddata(points, v_comp.m, (X, Y), method='cubic')
-    u_grid, v_grid = np.nan_to_num(u_grid), np.nan_to_num(v_grid)
-    dx, dy = mpcalc.lat_lon_grid_deltas(X, Y)
-    divergence = mpcalc.divergence(u_grid * units('m/s'), v_grid * units('m/s'), dx=dx, dy=dy) * 1e5
-
-    conv_threshold = -5.5
-    divergence_values = divergence.m
-    divergence_strong_conv = np.ma.masked_where(divergence_values > conv_threshold, divergence_values)
-    
-    levels = np.linspace(-15.0, conv_threshold, 10)
-    
-    cs = ax.contourf(X, Y, divergence_strong_conv,
-                     levels=levels, cmap='Reds_r', alpha=0.6,
-                     zorder=2, transform=ccrs.PlateCarree(), extend='min')
-
-    ax.streamplot(grid_lon, grid_lat, u_grid, v_grid,
-                  color="#000000", density=5.9, linewidth=0.5,
-                  arrowsize=0.50, zorder=4, transform=ccrs.PlateCarree())
-        
+    dibuixar_fons_mapa(ax)
+    dibuixar_convergencia(ax, lats, lons, u_comp.m, v_comp.m)
     ax.set_title(f"Flux i focus de convergència a {nivell}hPa", weight='bold')
     return fig
 
-@st.cache_data
-def encontrar_localitats_con_convergencia(hora, nivell, localitats, threshold):
-    lats, lons, speeds, dirs = obtener_dades_mapa_vents(hora, nivell)
+@cau_gestionada('Convergència', max_entrades=288, max_mb=4, clau=lambda hora, nivell, localitats, threshold, motor=None, dia=0: (hora, nivell, threshold, motor, dia, CLAU_POBLES))
+def encontrar_localitats_con_convergencia(hora, nivell, localitats, threshold, motor=None, dia=0):
+    lats, lons, speeds, dirs = obtener_dades_mapa_vents(hora, nivell, dia)
+    return calcular_localitats_convergencia(lats, lons, speeds, dirs, localitats, threshold, motor)
+
+def calcular_localitats_convergencia(lats, lons, speeds, dirs, localitats, threshold, motor=None):
     if not lats or len(lats) < 4: return []
+    divergencia = MOTORS_CONVERGENCIA[motor or MOTOR_CONVERGENCIA_PER_DEFECTE](lats, lons, speeds, dirs, localitats)
+    return [localitats.noms[i] for i in np.flatnonzero(divergencia < threshold)]
 
+def divergencia_pobles_cubica(lats, lons, speeds, dirs, localitats):
+    # Camp interpolat (cúbic) a una malla de 100×100 i valor del punt de malla més proper a cada localitat
     speeds_ms = (np.array(speeds) * 1000 / 3600) * units('m/s')
     dirs_deg = np.array(dirs) * units.degrees
     u_comp, v_comp = mpcalc.wind_components(speeds_ms, dirs_deg)
@@ -566,141 +884,1972 @@ def encontrar_localitats_con_convergencia(hora, nivell, localitats, threshold):
     divergence = mpcalc.divergence(u_grid * units('m/s'), v_grid * units('m/s'), dx=dx, dy=dy) * 1e5
     divergence_values = divergence.m
 
-    localitats_en_convergencia = []
-    for nom_poble, coords in localitats.items():
-        lon_idx = (np.abs(grid_lon - coords['lon'])).argmin()
-        lat_idx = (np.abs(grid_lat - coords['lat'])).argmin()
-        valor_convergencia = divergence_values[lat_idx, lon_idx]
-        
-        if valor_convergencia < threshold:
-            localitats_en_convergencia.append(nom_poble)
-            
-    return localitats_en_convergencia
+    lon_idx = np.abs(grid_lon - localitats.lons[:, None]).argmin(axis=1)
+    lat_idx = np.abs(grid_lat - localitats.lats[:, None]).argmin(axis=1)
+    return divergence_values[lat_idx, lon_idx]
+
+# --- MOTOR VECTORITZAT DE PARÀMETRES (MOLTES COLUMNES ALHORA) ---
+# Perfils en matrius (N columnes, L nivells) en hPa, °C, m/s i m, amb la superfície a l'índex 0
+# i els nivells sense dades (NaN) al final de cada fila. Reprodueix calculate_parameters sense MetPy.
+Rd, Cp_d, Lv, EPSILON, G0 = 287.04749, 1004.6662, 2.50084e6, 0.6219569, 9.80665
+KAPPA = Rd / Cp_d
+UNITATS_PARAMETRES = {'CAPE_Brut': 'J/kg', 'CIN_Fre': 'J/kg', 'CAPE_Utilitzable': 'J/kg', 'LCL_AGL': 'm', 'LFC_AGL': 'm', 'EL_MSL': 'km',
+                      'Shear_0-6km': 'm/s', 'SRH_0-1km': 'm²/s²', 'SRH_0-3km': 'm²/s²', 'PWAT_Total': 'mm'}
+
+def pressio_a_altura_std(p_hpa):
+    return 288.0 / 0.0065 * (1 - (p_hpa / 1013.25) ** (Rd * 0.0065 / G0))
+
+def pressio_vapor_saturacio(t_c):
+    return 6.112 * np.exp(17.67 * t_c / (t_c + 243.5))
+
+def ratio_mescla_saturacio(p_hpa, t_k):
+    es = pressio_vapor_saturacio(t_k - 273.15)
+    return EPSILON * es / (p_hpa - es)
+
+def temperatura_virtual(t_k, w):
+    return t_k * (w + EPSILON) / (EPSILON * (1 + w))
+
+def gradient_pseudoadiabatic(p_hpa, t_k):
+    rs = ratio_mescla_saturacio(p_hpa, t_k)
+    return (Rd * t_k + Lv * rs) / (Cp_d + Lv * Lv * rs * EPSILON / (Rd * t_k ** 2)) / p_hpa
+
+def lcl_lot(p0, t0_k, td0_k):
+    t_lcl = 1 / (1 / (td0_k - 56) + np.log(t0_k / td0_k) / 800) + 56
+    return p0 * (t_lcl / t0_k) ** (1 / KAPPA), t_lcl
+
+def ascens_pseudoadiabatic(p_act, t_act, p_obj):
+    # RK4 des de (p_act, t_act) fins a p_obj, amb subpassos d'uns 20 hPa comuns a totes les columnes
+    salt = np.where(np.isfinite(p_obj) & np.isfinite(p_act), p_obj - p_act, 0)
+    n_sub = max(1, int(np.ceil(np.abs(salt).max(initial=0) / 20)))
+    dp = salt / n_sub
+    pc, tc = p_act.copy(), t_act.copy()
+    for _ in range(n_sub):
+        k1 = gradient_pseudoadiabatic(pc, tc)
+        k2 = gradient_pseudoadiabatic(pc + dp / 2, tc + dp / 2 * k1)
+        k3 = gradient_pseudoadiabatic(pc + dp / 2, tc + dp / 2 * k2)
+        k4 = gradient_pseudoadiabatic(pc + dp, tc + dp * k3)
+        tc = tc + dp / 6 * (k1 + 2 * k2 + 2 * k3 + k4); pc = pc + dp
+    return tc
+
+def perfil_parcela_lot(p, p0, t0_k, td0_k, taula=None):
+    p_lcl, t_lcl = lcl_lot(p0, t0_k, td0_k)
+    perfil = t0_k[:, None] * (p / p0[:, None]) ** KAPPA
+    if taula is not None:
+        return np.where(p < p_lcl[:, None], taula.ascens(p_lcl, t_lcl, p), perfil), p_lcl
+    p_act, t_act = p_lcl.copy(), t_lcl.copy()
+    for j in range(p.shape[1]):
+        actiu = np.isfinite(p[:, j]) & (p[:, j] < p_act)
+        if not actiu.any(): continue
+        t_nou = ascens_pseudoadiabatic(p_act, t_act, np.where(actiu, p[:, j], p_act))
+        perfil[:, j] = np.where(actiu, t_nou, perfil[:, j])
+        p_act = np.where(actiu, p[:, j], p_act); t_act = np.where(actiu, t_nou, t_act)
+    return perfil, p_lcl
+
+def interp_columnes(x_obj, x, y):
+    # Interpolació lineal fila a fila; x monòton (creixent o decreixent) amb NaN al final
+    x1, x2, y1, y2 = x[:, :-1], x[:, 1:], y[:, :-1], y[:, 1:]
+    dins = ((x1 - x_obj[:, None]) * (x2 - x_obj[:, None]) <= 0) & (x1 != x2) & np.isfinite(y1) & np.isfinite(y2)
+    valor = y1 + (x_obj[:, None] - x1) / np.where(x1 != x2, x2 - x1, 1) * (y2 - y1)
+    idx = np.argmax(dins, axis=1)[:, None]
+    return np.where(dins.any(axis=1), np.take_along_axis(valor, idx, axis=1)[:, 0], np.nan)
+
+def integral_trams(x, b, x_baix, x_dalt):
+    # ∫ b dx del perfil lineal a trossos entre x_dalt i x_baix (x = ln p decreix amb l'altura)
+    x1, x2, b1, b2 = x[:, :-1], x[:, 1:], b[:, :-1], b[:, 1:]
+    lo, hi = np.maximum(x2, x_dalt[:, None]), np.minimum(x1, x_baix[:, None])
+    valid = np.isfinite(b1) & np.isfinite(b2) & (hi > lo)
+    pendent = (b1 - b2) / np.where(x1 != x2, x1 - x2, 1)
+    area = 0.5 * (2 * b2 + pendent * (lo - x2 + hi - x2)) * (hi - lo)
+    return np.where(valid, area, 0).sum(axis=1)
+
+def lfc_el_lot(x, b, x_lcl):
+    x1, x2, b1, b2 = x[:, :-1], x[:, 1:], b[:, :-1], b[:, 1:]
+    x_creua = x1 + (x2 - x1) * b1 / np.where(b1 != b2, b1 - b2, 1)
+    puja = (b1 <= 0) & (b2 > 0) & (x_creua <= x_lcl[:, None])
+    x_lfc = np.where(puja, x_creua, -np.inf).max(axis=1)
+    x_lfc = np.where(interp_columnes(x_lcl, x, b) > 0, x_lcl, x_lfc)
+    x_lfc = np.where(np.isfinite(x_lfc), x_lfc, np.nan)
+    baixa = (b1 > 0) & (b2 <= 0) & (x_creua < x_lfc[:, None])
+    x_el = np.where(baixa, x_creua, np.inf).min(axis=1)
+    return x_lfc, np.where(np.isfinite(x_el), x_el, np.nan)
+
+def srh_lot(h, u, v, profunditat):
+    h_sup = h[:, 0] + profunditat
+    u_sup, v_sup = interp_columnes(h_sup, h, u), interp_columnes(h_sup, h, v)
+    u1, u2, v1, v2, h2 = u[:, :-1], u[:, 1:], v[:, :-1], v[:, 1:], h[:, 1:]
+    talla = h2 > h_sup[:, None]
+    u2 = np.where(talla, u_sup[:, None], u2); v2 = np.where(talla, v_sup[:, None], v2)
+    dins = np.concatenate([np.ones_like(talla[:, :1]), ~talla[:, :-1]], axis=1) & np.isfinite(h2)
+    capes = np.where(dins, u2 * v1 - u1 * v2, 0)
+    return np.where(np.isfinite(u_sup), np.nansum(capes, axis=1), np.nan)
+
+def termodinamica_lot(p, T, Td, taula=None):
+    # Parcel·la que surt del primer nivell de cada columna: LCL, LFC i EL, i CAPE/CIN amb temperatura virtual
+    t_k, td_k, x = T + 273.15, Td + 273.15, np.log(p)
+    parcela, p_lcl = perfil_parcela_lot(p, p[:, 0], t_k[:, 0], td_k[:, 0], taula)
+    x_lcl = np.log(p_lcl)
+    x_lfc, x_el = lfc_el_lot(x, parcela - t_k, x_lcl)
+    # Com mpcalc.cape_cin, la integració de CAPE/CIN es fa amb temperatura virtual
+    w_env = EPSILON * pressio_vapor_saturacio(Td) / (p - pressio_vapor_saturacio(Td))
+    w_par = np.where(p > p_lcl[:, None], ratio_mescla_saturacio(p[:, :1], td_k[:, :1]), ratio_mescla_saturacio(p, parcela))
+    b_v = temperatura_virtual(parcela, w_par) - temperatura_virtual(t_k, w_env)
+    x_lfc_v, x_el_v = lfc_el_lot(x, b_v, x_lcl)
+    n_valid = np.isfinite(p).sum(axis=1)
+    x_cim = np.take_along_axis(x, np.maximum(n_valid - 1, 0)[:, None], axis=1)[:, 0]
+    te_lfc = np.isfinite(x_lfc_v)
+    cape = np.where(te_lfc, Rd * integral_trams(x, b_v, x_lfc_v, np.where(np.isfinite(x_el_v), x_el_v, x_cim)), 0.0)
+    cin = np.where(te_lfc, np.minimum(Rd * integral_trams(x, b_v, x[:, 0], x_lfc_v), 0.0), 0.0)
+    return {'cape': cape, 'cin': cin, 'p_lcl': p_lcl, 'p_lfc': np.exp(x_lfc), 'p_el': np.exp(x_el), 'w_env': w_env, 'valida': n_valid > 1}
+
+def calcular_parametres_lot(p, T, Td, u, v, h, taula=None):
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        termo = termodinamica_lot(p, T, Td, taula)
+        cape, cin, w_env = termo['cape'], termo['cin'], termo['w_env']
+        h0 = h[:, 0]
+        u6, v6 = interp_columnes(h0 + 6000, h, u), interp_columnes(h0 + 6000, h, v)
+        pwat = -np.nansum(np.where(np.isfinite(w_env[:, 1:]), 0.5 * (w_env[:, :-1] + w_env[:, 1:]) * np.diff(p * 100, axis=1), 0), axis=1) / G0
+        resultat = {
+            'CAPE_Brut': cape, 'CIN_Fre': cin, 'CAPE_Utilitzable': np.maximum(0, cape - np.abs(cin)),
+            'LCL_AGL': pressio_a_altura_std(termo['p_lcl']) - h0,
+            'LFC_AGL': pressio_a_altura_std(termo['p_lfc']) - h0,
+            'EL_MSL': pressio_a_altura_std(termo['p_el']) / 1000,
+            'Shear_0-6km': np.hypot(u6 - u[:, 0], v6 - v[:, 0]),
+            'SRH_0-1km': srh_lot(h, u, v, 1000), 'SRH_0-3km': srh_lot(h, u, v, 3000),
+            'PWAT_Total': pwat,
+        }
+    return {k: np.where(termo['valida'], val, np.nan) for k, val in resultat.items()}
+
+# Variants de parcel·la (SB, ML i MU) en una sola passada: cada variant és una columna on la parcel·la
+# surt del primer nivell, com fa MetPy (la capa barrejada substitueix els 100 hPa inferiors i la MU
+# descarta els nivells de sota), i les 3N columnes passen juntes per l'ascens i la integració.
+PARCELLES = {'SB': "Superfície", 'ML': "Capa barrejada 100 hPa", 'MU': "Més inestable"}
+PROFUNDITAT_ML, PROFUNDITAT_MU = 100.0, 300.0
+UNITATS_PARCELLES = {f"{c}_{tipus}": u for tipus in PARCELLES for c, u in (('CAPE', 'J/kg'), ('CIN', 'J/kg'), ('LFC', 'm'), ('EL', 'km'))}
+UNITATS_PARCELLES['P_MU'] = 'hPa'
+
+def theta_e_bolton(p, t_k, td_k):
+    w, t_l = ratio_mescla_saturacio(p, td_k), lcl_lot(p, t_k, td_k)[1]
+    return t_k * (1000 / p) ** (0.2854 * (1 - 0.28 * w)) * np.exp((3.376 / t_l - 0.00254) * 1000 * w * (1 + 0.81 * w))
+
+def columnes_parcelles(p, T, Td):
+    p0, t_k, td_k = p[:, 0], T + 273.15, Td + 273.15
+    primer = np.arange(p.shape[1]) == 0
+    # ML: mitjanes de θ i de la ratio de mescla a la capa, portades a la pressió de superfície
+    theta, w = t_k * (1000 / p) ** KAPPA, ratio_mescla_saturacio(p, td_k)
+    gruix = p0 - np.maximum(p0 - PROFUNDITAT_ML, np.nanmin(p, axis=1))
+    theta_ml = integral_trams(p, theta, p0, p0 - PROFUNDITAT_ML) / gruix
+    w_ml = integral_trams(p, w, p0, p0 - PROFUNDITAT_ML) / gruix
+    e_ml = w_ml * p0 / (EPSILON + w_ml)
+    T_ml, Td_ml = T.copy(), Td.copy()
+    T_ml[:, 0] = theta_ml * (p0 / 1000) ** KAPPA - 273.15
+    Td_ml[:, 0] = 243.5 * np.log(e_ml / 6.112) / (17.67 - np.log(e_ml / 6.112))
+    ml = compactar_columnes(primer | (p < (p0 - PROFUNDITAT_ML)[:, None]), p, T_ml, Td_ml)
+    # MU: nivell de θe màxima (Bolton) dins dels 300 hPa inferiors
+    theta_e = theta_e_bolton(p, t_k, td_k)
+    theta_e = np.where(np.isfinite(theta_e) & (p >= (p0 - PROFUNDITAT_MU)[:, None]), theta_e, -np.inf)
+    p_mu = np.take_along_axis(p, np.argmax(theta_e, axis=1)[:, None], axis=1)[:, 0]
+    mu = compactar_columnes(p <= p_mu[:, None], p, T, Td)
+    return tuple(np.concatenate(c) for c in zip((p, T, Td), ml, mu)), p_mu
+
+def calcular_parcelles_lot(p, T, Td, h, taula=None):
+    n = len(p)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        columnes, p_mu = columnes_parcelles(p, T, Td)
+        termo = termodinamica_lot(*columnes, taula=taula)
+        h0 = np.tile(h[:, 0], len(PARCELLES))
+        valors = {'CAPE': termo['cape'], 'CIN': termo['cin'],
+                  'LFC': pressio_a_altura_std(termo['p_lfc']) - h0, 'EL': pressio_a_altura_std(termo['p_el']) / 1000}
+    valida = np.isfinite(p).sum(axis=1) > 1
+    resultat = {f"{c}_{tipus}": np.where(valida, val[i * n:(i + 1) * n], np.nan) for c, val in valors.items() for i, tipus in enumerate(PARCELLES)}
+    resultat['P_MU'] = np.where(valida, p_mu, np.nan)
+    return resultat
+
+# --- ÍNDEXS DE TEMPS SEVER ---
+# Biblioteca d'índexs sobre les mateixes matrius (N, L) i els paràmetres base del lot. Cada família és una funció
+# que rep un context compartit (perfils, paràmetres base i resultats intermedis de les famílies anteriors, per
+# això l'ordre importa) i retorna els seus índexs; calcular_indexs_lot en cronometra cada una. La capa efectiva
+# i STP/SCP segueixen les definicions de l'SPC, amb la parcel·la de superfície del lot base en lloc de la ML.
+UNITATS_INDEXS = {'Gradient_700-500': '°C/km', 'DCAPE': 'J/kg', 'Iso_0C': 'm', 'Iso_-10C': 'm', 'Iso_-20C': 'm', 'Bunkers_Dir': '°', 'Bunkers_Vel': 'm/s',
+                  'Shear_Efectiu': 'm/s', 'SRH_Efectiva': 'm²/s²', 'STP': '', 'SCP': '', 'SHIP': ''}
+ETIQUETES_INDEXS = [('Gradient 700-500', 'Gradient_700-500'), ('DCAPE', 'DCAPE'), ('Iso 0°C (MSL)', 'Iso_0C'), ('Iso -10°C (MSL)', 'Iso_-10C'), ('Iso -20°C (MSL)', 'Iso_-20C'),
+                    ('Bunkers RM (dir.)', 'Bunkers_Dir'), ('Bunkers RM (vel.)', 'Bunkers_Vel'), ('Shear efectiu', 'Shear_Efectiu'), ('SRH efectiva', 'SRH_Efectiva'),
+                    ('STP', 'STP'), ('SCP', 'SCP'), ('SHIP (calamarsa)', 'SHIP')]
+CAPA_DCAPE, VEL_DESVIACIO_BUNKERS = (700.0, 500.0), 7.5
+
+def valor_a_pressio(c, p_obj, y):
+    return interp_columnes(np.full(len(c['p']), np.log(p_obj)), c['x'], y)
+
+def mitjana_capa(c, y, baix, dalt):
+    # Mitjana de y ponderada per pressió entre baix i dalt (m sobre el terra), com la de mpcalc.bunkers_storm_motion
+    p, h = c['p'], c['h']
+    p_baix, p_dalt = interp_columnes(h[:, 0] + baix, h, p), interp_columnes(h[:, 0] + dalt, h, p)
+    return integral_trams(p, y, p_baix, p_dalt) / (p_baix - p_dalt)
+
+def index_gradient(c):
+    c['t500'] = valor_a_pressio(c, 500, c['T'])
+    return {'Gradient_700-500': (valor_a_pressio(c, 700, c['T']) - c['t500']) / (valor_a_pressio(c, 500, c['h']) - valor_a_pressio(c, 700, c['h'])) * 1000}
+
+def index_dcape(c):
+    # Com mpcalc.downdraft_cape: descens pseudoadiabàtic fins a terra des del bulb humit del nivell de θe mínima
+    # entre 700 i 500 hPa, integrat amb temperatura virtual (parcel·la saturada)
+    p, t_k, td_k = c['p'], c['T'] + 273.15, c['Td'] + 273.15
+    theta_e = theta_e_bolton(p, t_k, td_k)
+    theta_e = np.where(np.isfinite(theta_e) & (p <= CAPA_DCAPE[0]) & (p >= CAPA_DCAPE[1]), theta_e, np.inf)
+    origen = np.argmin(theta_e, axis=1)
+    p_o, t_o, td_o = (np.take_along_axis(a, origen[:, None], axis=1)[:, 0] for a in (p, t_k, td_k))
+    p_lcl, t_lcl = lcl_lot(p_o, t_o, td_o)
+    sota = np.arange(p.shape[1]) <= origen[:, None]
+    if c['taula'] is not None:
+        parcela = c['taula'].ascens(p_lcl, t_lcl, p)
+    else:
+        parcela = np.full_like(p, np.nan)
+        p_act, t_act = p_o, ascens_pseudoadiabatic(p_lcl, t_lcl, p_o)
+        for j in range(int(origen.max()), -1, -1):
+            actiu = (j <= origen) & np.isfinite(p[:, j])
+            t_nou = ascens_pseudoadiabatic(p_act, t_act, np.where(actiu, p[:, j], p_act))
+            parcela[:, j] = np.where(actiu, t_nou, np.nan)
+            p_act = np.where(actiu, p[:, j], p_act); t_act = np.where(actiu, t_nou, t_act)
+    b = np.where(sota, temperatura_virtual(t_k, ratio_mescla_saturacio(p, td_k)) - temperatura_virtual(parcela, ratio_mescla_saturacio(p, parcela)), np.nan)
+    return {'DCAPE': np.where(np.isfinite(theta_e).any(axis=1), Rd * integral_trams(c['x'], b, c['x'][:, 0], np.log(p_o)), np.nan)}
+
+def index_isotermes(c):
+    # Primer pas per cada isoterma des de terra cap amunt, en metres sobre el nivell del mar (com l'arxiu de text)
+    c['iso0'] = interp_columnes(np.zeros(len(c['p'])), c['T'], c['h'])
+    return {'Iso_0C': c['iso0'], **{f'Iso_{t}C': interp_columnes(np.full(len(c['p']), float(t)), c['T'], c['h']) for t in (-10, -20)}}
+
+def index_bunkers(c):
+    # Supercèl·lula dreta: vent mitjà 0-6 km desviat 7,5 m/s a la dreta del cisallament (0-0,5 km → 5,5-6 km)
+    u, v = c['u'], c['v']
+    su, sv = mitjana_capa(c, u, 5500, 6000) - mitjana_capa(c, u, 0, 500), mitjana_capa(c, v, 5500, 6000) - mitjana_capa(c, v, 0, 500)
+    modul = np.hypot(su, sv)
+    c['u_rm'] = mitjana_capa(c, u, 0, 6000) + VEL_DESVIACIO_BUNKERS * sv / modul
+    c['v_rm'] = mitjana_capa(c, v, 0, 6000) - VEL_DESVIACIO_BUNKERS * su / modul
+    return {'Bunkers_Dir': np.degrees(np.arctan2(-c['u_rm'], -c['v_rm'])) % 360, 'Bunkers_Vel': np.hypot(c['u_rm'], c['v_rm'])}
+
+def index_capa_efectiva(c):
+    # Parcel·la MU (θe màxima dels 300 hPa inferiors, com a columnes_parcelles) i capa efectiva: primers nivells
+    # seguits amb CAPE ≥ 100 i CIN ≥ -250 J/kg. Sense MUCAPE de 100 J/kg no n'hi ha. Les parcel·les de tots els
+    # nivells candidats s'apilen com a columnes d'una sola crida a termodinamica_lot, com a calcular_parcelles_lot
+    # (el primer nivell és la parcel·la de superfície, que ja és al lot base)
+    p, T, Td, h, u, v = (c[k] for k in ('p', 'T', 'Td', 'h', 'u', 'v'))
+    n, L = p.shape; nivells = np.arange(L)
+    candidat = np.isfinite(p) & (p >= (p[:, 0] - PROFUNDITAT_MU)[:, None])
+    theta_e = np.where(candidat, theta_e_bolton(p, T + 273.15, Td + 273.15), -np.inf)
+    mu = np.argmax(np.nan_to_num(theta_e, nan=-np.inf), axis=1)
+    termo_mu = termodinamica_lot(*compactar_columnes(nivells >= mu[:, None], p, T, Td), taula=c['taula'])
+    c['mucape'] = termo_mu['cape']
+    c['w_mu'] = ratio_mescla_saturacio(p[np.arange(n), mu], Td[np.arange(n), mu] + 273.15) * 1000
+    candidat &= (c['mucape'] >= 100)[:, None]
+    cape, cin = np.full((n, L), np.nan), np.full((n, L), np.nan)
+    cape[:, 0], cin[:, 0] = c['base']['CAPE_Brut'], c['base']['CIN_Fre']
+    files, ks = np.nonzero(candidat[:, 1:]); ks += 1
+    if len(files):
+        termo = termodinamica_lot(*compactar_columnes(nivells >= ks[:, None], p[files], T[files], Td[files]), taula=c['taula'])
+        cape[files, ks], cin[files, ks] = termo['cape'], termo['cin']
+    # La capa és el primer tram seguit de nivells que compleixen (els candidats ja són seguits des de superfície)
+    compleix = candidat & (cape >= 100) & (cin >= -250)
+    efectiva = compleix.any(axis=1)
+    base = np.argmax(compleix, axis=1)
+    fora = ~compleix & (nivells > base[:, None])
+    cim = np.where(fora.any(axis=1), np.argmax(fora, axis=1), L) - 1
+    h_base, h_cim = h[np.arange(n), base], h[np.arange(n), cim]
+    # Shear fins a la meitat de la profunditat de la parcel·la MU (base efectiva → EL), amb l'EL situat al perfil
+    h_el = interp_columnes(np.log(termo_mu['p_el']), np.log(p), h)
+    h_mig = h_base + 0.5 * (h_el - h_base)
+    shear = np.hypot(interp_columnes(h_mig, h, u) - interp_columnes(h_base, h, u), interp_columnes(h_mig, h, v) - interp_columnes(h_base, h, v))
+    u_r, v_r = u - c['u_rm'][:, None], v - c['v_rm'][:, None]
+    srh = srh_lot(h, u_r, v_r, h_cim - h[:, 0]) - srh_lot(h, u_r, v_r, h_base - h[:, 0])
+    c['ebwd'], c['esrh'] = np.where(efectiva, np.nan_to_num(shear), 0.0), np.where(efectiva, srh, 0.0)
+    return {'Shear_Efectiu': c['ebwd'], 'SRH_Efectiva': c['esrh']}
+
+def index_stp(c):
+    b = c['base']
+    terme_lcl = np.clip((2000 - b['LCL_AGL']) / 1000, 0, 1)
+    terme_shear = np.where(c['ebwd'] < 12.5, 0, np.minimum(c['ebwd'], 30) / 20)
+    terme_cin = np.clip((200 + b['CIN_Fre']) / 150, 0, 1)
+    return {'STP': b['CAPE_Brut'] / 1500 * terme_lcl * c['esrh'] / 150 * terme_shear * terme_cin}
+
+def index_scp(c):
+    terme_shear = np.where(c['ebwd'] < 10, 0, np.minimum(c['ebwd'] / 20, 1))
+    return {'SCP': c['mucape'] / 1000 * c['esrh'] / 50 * terme_shear}
+
+def index_ship(c):
+    # Significant Hail Parameter (SPC) com a indicador de la mida de la calamarsa
+    gradient, mucape, h_iso0 = c['resultat']['Gradient_700-500'], c['mucape'], c['iso0'] - c['h'][:, 0]
+    ship = mucape * np.clip(c['w_mu'], 11, 13.6) * gradient * -np.minimum(c['t500'], -5.5) * np.clip(c['base']['Shear_0-6km'], 7, 27) / 42e6
+    ship *= np.where(mucape < 1300, mucape / 1300, 1) * np.where(gradient < 5.8, gradient / 5.8, 1) * np.where(h_iso0 < 2400, h_iso0 / 2400, 1)
+    return {'SHIP': ship}
+
+INDEXS_SEVERS = {"Gradient 700-500 hPa": index_gradient, "DCAPE": index_dcape, "Isotermes 0/-10/-20 °C": index_isotermes, "Moviment de Bunkers": index_bunkers,
+                 "Capa efectiva (shear i SRH)": index_capa_efectiva, "STP": index_stp, "SCP": index_scp, "SHIP": index_ship}
+
+def calcular_indexs_lot(p, T, Td, u, v, h, base, taula=None, temps=None):
+    # base: paràmetres del lot (calcular_parametres_lot o un conjunt d'una columna); temps acumula ms per família
+    c = {'p': p, 'T': T, 'Td': Td, 'u': u, 'v': v, 'h': h, 'x': np.log(p), 'base': base, 'taula': taula, 'resultat': {}}
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        for nom, funcio in INDEXS_SEVERS.items():
+            t0 = time.perf_counter(); c['resultat'].update(funcio(c))
+            if temps is not None: temps[nom] = temps.get(nom, 0.0) + (time.perf_counter() - t0) * 1000
+    valida = np.isfinite(p).sum(axis=1) > 1
+    return {k: np.where(valida, c['resultat'][k], np.nan) for k in UNITATS_INDEXS}
+
+def parametres_columna(lot, i):
+    return ConjuntParametres.de_valors({k: val[i] for k, val in lot.items()})
+
+def compactar_columnes(valid, *arrays):
+    ordre = np.argsort(~valid, axis=1, kind='stable')
+    return tuple(np.where(np.take_along_axis(valid, ordre, axis=1), np.take_along_axis(a, ordre, axis=1), np.nan) for a in arrays)
+
+def muntar_columnes(sfc, press, p_levels, hora):
+    # Mateixa construcció del perfil que la vista puntual: superfície + nivells per sobre del terra
+    T_s, Td_s, P_s = (sfc[:, i, hora].astype(float) for i in range(3))
+    T_p, Td_p, Ws_p, Wd_p, H_p = (press[:, i, :, hora].astype(float) for i in range(5))
+    for i in np.flatnonzero(np.isfinite(P_s) & (np.isnan(T_s) | np.isnan(Td_s))):
+        T_s[i] = interpolate_sfc(T_s[i], P_s[i], p_levels, T_p[i]); Td_s[i] = interpolate_sfc(Td_s[i], P_s[i], p_levels, Td_p[i])
+    p_lv = np.broadcast_to(np.asarray(p_levels, dtype=float), T_p.shape)
+    ws, wd = Ws_p * 0.514444, np.deg2rad(Wd_p)
+    zeros = np.zeros_like(P_s)
+    p = np.column_stack([P_s, p_lv]); T = np.column_stack([T_s, T_p]); Td = np.column_stack([Td_s, Td_p])
+    u = np.column_stack([zeros, -ws * np.sin(wd)]); v = np.column_stack([zeros, -ws * np.cos(wd)])
+    h = np.column_stack([pressio_a_altura_std(P_s), H_p])
+    sfc_ok = np.isfinite(P_s) & np.isfinite(T_s) & np.isfinite(Td_s)
+    valid = np.column_stack([sfc_ok, (p_lv < P_s[:, None]) & np.isfinite(T_p) & sfc_ok[:, None]])
+    return compactar_columnes(valid, p, T, Td, u, v, h)
+
+# --- TIPUS DE PRECIPITACIÓ I COTA DE NEU ---
+# Diagnòstic hivernal sobre les mateixes matrius (N, L), per a totes les localitats i hores d'un sol cop. El bulb
+# humit de cada nivell és el de mpcalc.wet_bulb_temperature (ascens sec fins al LCL i baixada pseudoadiabàtica, amb
+# RK4 o amb la taula); la cota de neu queda FUSIO_COTA_NEU per sota de la isozero de bulb humit, retallada al terra
+# de la cel·la (cota = terra vol dir que la neu hi arriba). El tipus segueix les àrees de Bourgouin (2000), Rd ∫ T d ln p
+# respecte de 0 °C com el CAPE: la de fusió de la capa càlida de terra o, amb un nas càlid sobre una capa freda, la de
+# fusió del nas i la de regel de sota (la franja mixta compta com a pluja gelant). És el tipus si hi ha precipitació.
+UNITATS_PRECIPITACIO = {'Cota_Neu': 'm', 'Isozero_Bulb_Humit': 'm', 'Altitud_Terra': 'm', 'Nas_Calid_Tmax': '°C', 'Energia_Fusio': 'J/kg', 'Energia_Regel': 'J/kg', 'Tipus_Precipitacio': ''}
+NOMS_PRECIPITACIO = tuple(UNITATS_PRECIPITACIO)
+ETIQUETES_PRECIPITACIO = [('Cota de neu (MSL)', 'Cota_Neu'), ('Isozero bulb humit (MSL)', 'Isozero_Bulb_Humit'), ('Nas càlid (T màx.)', 'Nas_Calid_Tmax'),
+                          ('Energia de fusió', 'Energia_Fusio'), ('Energia de regel', 'Energia_Regel')]
+TIPUS_PRECIPITACIO = [("Pluja", "#4682B4", 'o'), ("Aiguaneu", "#9370DB", 'D'), ("Neu", "#FFFFFF", '*'), ("Gresol", "#FFA500", '^'), ("Pluja gelant", "#DC143C", 'X')]
+PLUJA, AIGUANEU, NEU, GRESOL, PLUJA_GELANT = range(len(TIPUS_PRECIPITACIO))
+FUSIO_COTA_NEU, PRESSIO_MIN_NEU = 250.0, 450.0
+
+def bulb_humit_lot(p, T, Td, taula=None):
+    t_k, td_k = T + 273.15, np.minimum(Td, T) + 273.15
+    if taula is not None: return taula.bulb_humit(p, t_k, td_k) - 273.15
+    p_lcl, t_lcl = lcl_lot(p, t_k, td_k)
+    return ascens_pseudoadiabatic(p_lcl.ravel(), t_lcl.ravel(), p.ravel()).reshape(p.shape) - 273.15
+
+def creuaments_zero(x, y):
+    # Per segment (N, L-1): la x on y passa per zero i si hi entra pujant (≤ 0 → > 0) o en surt (> 0 → ≤ 0)
+    y1, y2 = y[:, :-1], y[:, 1:]
+    x_creua = x[:, :-1] + (x[:, 1:] - x[:, :-1]) * y1 / np.where(y1 != y2, y1 - y2, 1)
+    return x_creua, (y1 <= 0) & (y2 > 0), (y1 > 0) & (y2 <= 0)
+
+def primer_segment(marca, despres=None):
+    # Primer segment marcat de cada fila (posterior a «despres», si es dona); -1 si no n'hi ha cap
+    if despres is not None: marca = marca & (np.arange(marca.shape[1]) > despres[:, None])
+    return np.where(marca.any(axis=1), np.argmax(marca, axis=1), -1)
+
+def valor_segment(valors, k):
+    return np.where(k >= 0, np.take_along_axis(valors, np.maximum(k, 0)[:, None], axis=1)[:, 0], np.nan)
+
+def calcular_precipitacio_lot(p, T, Td, h, taula=None):
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        baixos = np.isfinite(p) & (p >= PRESSIO_MIN_NEU)
+        p, T, Td, h = (np.where(baixos, a, np.nan) for a in (p, T, Td, h))
+        x, h_terra, t_terra = np.log(p), h[:, 0], T[:, 0]
+        # Primer pas per zero del bulb humit des de terra; si a terra ja és ≤ 0 °C, la isozero és el terra
+        tw = bulb_humit_lot(p, T, Td, taula)
+        iso_tw = np.where(tw[:, 0] <= 0, h_terra, interp_columnes(np.zeros(len(p)), tw, h))
+        # Capa càlida de terra (fins al primer pas per zero) o nas càlid (entre el primer pas cap a > 0 i el següent)
+        x_creua, entra, surt = creuaments_zero(x, T)
+        fusio_terra = Rd * integral_trams(x, T, x[:, 0], valor_segment(x_creua, primer_segment(surt)))
+        k_base = primer_segment(entra); k_cim = primer_segment(surt, k_base)
+        x_base = valor_segment(x_creua, k_base)
+        nas = (t_terra <= 0) & (k_base >= 0) & (k_cim >= 0)
+        fusio_nas = Rd * integral_trams(x, T, x_base, valor_segment(x_creua, k_cim))
+        regel = -Rd * integral_trams(x, T, x[:, 0], x_base)
+        nivells = np.arange(T.shape[1])
+        t_nas = np.max(np.where((nivells > k_base[:, None]) & (nivells <= k_cim[:, None]), T, -np.inf), axis=1)
+        tipus = np.select([t_terra > 0, ~nas | (fusio_nas < 2)],
+                          [np.select([fusio_terra < 5.6, fusio_terra < 13.2], [NEU, AIGUANEU], PLUJA), NEU],
+                          np.where(regel > 56 + 0.66 * fusio_nas, GRESOL, PLUJA_GELANT))
+    valida = np.isfinite(t_terra) & np.isfinite(h_terra)
+    return {'Cota_Neu': np.where(valida, np.maximum(iso_tw - FUSIO_COTA_NEU, h_terra), np.nan), 'Isozero_Bulb_Humit': np.where(valida, iso_tw, np.nan),
+            'Altitud_Terra': h_terra, 'Nas_Calid_Tmax': np.where(valida & nas, t_nas, np.nan),
+            'Energia_Fusio': np.where(valida, np.where(t_terra > 0, fusio_terra, np.where(nas, fusio_nas, 0)), np.nan),
+            'Energia_Regel': np.where(valida & nas, regel, np.nan), 'Tipus_Precipitacio': np.where(valida, tipus, np.nan)}
+
+def columnes_hores(perfils):
+    # Columnes de totes les hores en un sol lot, hora rere hora (fila = hora * N + columna)
+    return [np.concatenate(c) for c in zip(*(muntar_columnes(perfils['sfc'], perfils['press'], P_LEVELS_AROME, h) for h in range(perfils['sfc'].shape[-1])))]
+
+def precipitacio_perfils(perfils, taula=None):
+    n, n_hores = len(perfils['lats']), perfils['sfc'].shape[-1]
+    p, T, Td, _, _, h = columnes_hores(perfils)
+    lot = calcular_precipitacio_lot(p, T, Td, h, taula)
+    return ConjuntParametres(NOMS_PRECIPITACIO, np.stack([lot[k].reshape(n_hores, n).T for k in NOMS_PRECIPITACIO], axis=-1))
+
+# --- REPRESENTACIÓ COMPACTA ---
+# Sondeigs i conjunts de paràmetres sobre matrius float32 contigües, en classes amb __slots__ (sense __dict__
+# per objecte, i es serialitzen com un sol buffer). Les unitats només s'afegeixen a la frontera amb MetPy
+# (amb_unitats). Un paràmetre absent és un NaN: per a un sol sondeig, get() el retorna com el valor per defecte.
+# Els conjunts de moltes columnes (cel·la, hora) tenen els paràmetres a l'últim eix i conj[nom] és una vista.
+NOMS_PARAMETRES = tuple(UNITATS_PARAMETRES)
+NOMS_LOT = NOMS_PARAMETRES + tuple(UNITATS_INDEXS)
+
+class Sondeig:
+    __slots__ = ('dades',)
+
+    def __init__(self, p, T, Td, u, v, h):
+        self.dades = np.array([p, T, Td, u, v, h], dtype=np.float32)
+
+    def __len__(self):
+        return self.dades.shape[1]
+
+    def amb_unitats(self):
+        p, T, Td, u, v, h = self.dades.astype(float)
+        return p * units.hPa, T * units.degC, Td * units.degC, u * units('m/s'), v * units('m/s'), h * units.m
+
+class ConjuntParametres:
+    __slots__ = ('noms', 'valors')
+
+    def __init__(self, noms, valors):
+        noms = tuple(noms)
+        self.noms = next((comuns for comuns in (NOMS_PARAMETRES, NOMS_LOT) if noms == comuns), noms)
+        self.valors = np.asarray(valors, dtype=np.float32)
+
+    @classmethod
+    def de_valors(cls, valors):
+        # Diccionari {nom: valor o matriu}; None compta com a absent
+        return cls(valors.keys(), np.stack([np.asarray(np.nan if v is None else v, dtype=np.float32) for v in valors.values()], axis=-1))
+
+    def _columna(self, nom):
+        try: return self.noms.index(nom)
+        except ValueError: raise KeyError(nom) from None
+
+    def __getitem__(self, nom):
+        return self.valors[..., self._columna(nom)]
+
+    def __contains__(self, nom):
+        return nom in self.noms and bool(np.isfinite(self[nom]).any())
+
+    def __or__(self, altre):
+        return ConjuntParametres(self.noms + altre.noms, np.concatenate([self.valors, altre.valors], axis=-1))
+
+    def keys(self):
+        return self.noms
+
+    def items(self):
+        return ((nom, self.valors[..., i]) for i, nom in enumerate(self.noms))
+
+    def get(self, nom, defecte=None):
+        return float(self[nom]) if nom in self else defecte
+
+    def unitats(self, nom):
+        return UNITATS_PARAMETRES.get(nom) or UNITATS_PARCELLES.get(nom) or UNITATS_INDEXS.get(nom) or UNITATS_PRECIPITACIO.get(nom, '')
+
+# --- ANÀLISI EN GRAELLA ---
+def descodificar_perfils(responses, p_levels):
+    n_levels = len(p_levels)
+    lats = np.array([r.Latitude() for r in responses]); lons = np.array([r.Longitude() for r in responses])
+    variables = valors_respostes(responses)
+    return {'lats': lats, 'lons': lons, 'sfc': variables[:, :3], 'press': variables[:, 3:].reshape(len(responses), 5, n_levels, -1), 'p_levels': list(p_levels)}
+
+def descarregar_perfils_punts(lats, lons, hora_inici=0, dia=0):
+    params = {
+        "latitude": list(lats),
+        "longitude": list(lons),
+        "hourly": HOURLY_SONDEIG,
+        "models": "arome_france", "timezone": "auto", **parametres_dia(dia)
+    }
+    if hora_inici > 0:
+        # Només les hores que la passada nova pot haver canviat
+        data = params.pop("start_date"); del params["end_date"]
+        params["start_hour"] = f"{data}T{hora_inici:02d}:00"; params["end_hour"] = f"{data}T23:00"
+    return descodificar_perfils(peticio_punts(params), P_LEVELS_AROME)
+
+def descarregar_perfils_graella(hora_inici=0, dia=0):
+    lon_grid, lat_grid = np.meshgrid(LONS_GRAELLA, LATS_GRAELLA)
+    return descarregar_perfils_punts(lat_grid.flatten().tolist(), lon_grid.flatten().tolist(), hora_inici, dia)
+
+ESTIL_MAPES_PARAMETRES = {
+    'CAPE_Utilitzable': ([0, 100, 500, 1000, 1500, 2500, 3500, 5000], 'YlOrRd', "CAPE Utilitzable (J/kg)"),
+    'CAPE_Brut': ([0, 100, 500, 1000, 1500, 2500, 3500, 5000], 'YlOrRd', "CAPE Brut (J/kg)"),
+    'CIN_Fre': ([-400, -200, -100, -50, -25, -10, 0], 'Blues_r', "CIN (J/kg)"),
+    'Shear_0-6km': ([0, 5, 10, 12, 15, 18, 20, 25, 35], 'PuRd', "Shear 0-6km (m/s)"),
+    'SRH_0-1km': ([0, 50, 100, 150, 250, 400, 600], 'RdPu', "SRH 0-1km (m²/s²)"),
+    'SRH_0-3km': ([0, 50, 100, 150, 250, 400, 600], 'RdPu', "SRH 0-3km (m²/s²)"),
+    'DCAPE': ([0, 250, 500, 750, 1000, 1250, 1500, 2000], 'OrRd', "DCAPE (J/kg)"),
+    'STP': ([0, 0.25, 0.5, 1, 2, 3, 5, 8], 'YlOrRd', "STP"),
+    'SCP': ([0, 0.5, 1, 2, 4, 8, 12, 20], 'YlOrRd', "SCP"),
+    'SHIP': ([0, 0.25, 0.5, 1, 1.5, 2, 3, 4], 'YlOrRd', "SHIP (calamarsa)"),
+}
+
+def crear_mapa_parametre(lats, lons, valors, param_key, hora, marca=None):
+    fig = plt.figure(figsize=(9, 9), dpi=150)
+    ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    ax.set_extent([0, 3.5, 40.4, 43], crs=ccrs.PlateCarree())
+
+    ax.add_feature(cfeature.LAND, facecolor="#E0E0E0", zorder=0)
+    ax.add_feature(cfeature.OCEAN, facecolor='#b0c4de', zorder=0)
+    ax.add_feature(cfeature.COASTLINE, edgecolor='black', linewidth=0.5, zorder=3)
+    ax.add_feature(cfeature.BORDERS, linestyle=':', edgecolor='black', zorder=3)
+
+    nivells, cmap, etiqueta = ESTIL_MAPES_PARAMETRES[param_key]
+    ok = np.isfinite(valors)
+    grid_lon = np.linspace(lons.min(), lons.max(), 100)
+    grid_lat = np.linspace(lats.min(), lats.max(), 100)
+    X, Y = np.meshgrid(grid_lon, grid_lat)
+    camp = griddata(np.vstack((lons[ok], lats[ok])).T, valors[ok], (X, Y), method='cubic')
+    cs = ax.contourf(X, Y, np.clip(camp, nivells[0], nivells[-1]), levels=nivells, cmap=cmap, alpha=0.7,
+                     zorder=2, transform=ccrs.PlateCarree(), extend='both')
+    cbar = plt.colorbar(cs, ax=ax, orientation='vertical', pad=0.02, shrink=0.7); cbar.set_label(etiqueta)
+    if marca is not None:
+        nom, lat_m, lon_m = marca
+        ax.plot(lon_m, lat_m, marker='*', color='black', markersize=12, zorder=5, transform=ccrs.PlateCarree())
+        ax.text(lon_m + 0.05, lat_m + 0.05, nom, weight='bold', zorder=5, transform=ccrs.PlateCarree())
+
+    ax.set_title(f"{etiqueta} a les {hora:02d}:00h", weight='bold')
+    return fig
+
+# --- COMPARATIVA DE SONDEIGS ---
+# Una sola descodificació per localitat (totes les hores) i una sola passada vectoritzada per a tots
+# els perfils; cada família de traces és una única LineCollection, de manera que dibuixar-ne 24 costa
+# pràcticament el mateix que dibuixar-ne un.
+def obtener_perfils_localitat(lat, lon, dia=0):
+    # Si la instantània de la passada ja té la cel·la, es serveix d'allà: tota la pàgina veu la mateixa passada
+    cela = cela_de(lat, lon)
+    instantania = obtenir_magatzem_passades().instantania(dia)
+    if instantania and cela in instantania['pobles']['index']:
+        perfils, i = instantania['pobles']['perfils'], instantania['pobles']['index'][cela]
+        return {**perfils, **{k: perfils[k][i:i + 1] for k in ('lats', 'lons', 'sfc', 'press')}}
+    return obtener_perfils_cela(*cela, dia)
+
+@cau_gestionada('Perfils descodificats', max_entrades=150, max_mb=32)
+def obtener_perfils_cela(lat, lon, dia=0):
+    sondeo, p_levels = obtener_sondeo_cela(lat, lon, dia)
+    if sondeo is None: return None
+    return descodificar_perfils([sondeo], p_levels)
+
+def apilar_perfils(parelles):
+    sfc = np.stack([dades['sfc'][0, :, hora] for dades, hora in parelles])[..., None]
+    press = np.stack([dades['press'][0, :, :, hora] for dades, hora in parelles])[..., None]
+    return muntar_columnes(sfc, press, parelles[0][0]['p_levels'], 0)
+
+def segments_perfils(x, y):
+    return [np.column_stack([xi[ok], yi[ok]]) for xi, yi, ok in zip(x, y, np.isfinite(x) & np.isfinite(y))]
+
+def crear_skewt_comparatiu(p, T, Td, parcela_c, u, v, etiquetes):
+    colors = plt.cm.plasma(np.linspace(0, 0.9, len(etiquetes)))
+    def dibuixar(skew):
+        for valors, estil, gruix in ((T, '-', 2), (Td, '-', 1.2), (parcela_c, '--', 1)):
+            skew.ax.add_collection(LineCollection(segments_perfils(valors, p), colors=colors, linestyles=estil, linewidths=gruix), autolim=False)
+        ok = np.isfinite(p[0])
+        skew.plot_barbs(p[0][ok] * units.hPa, (u[0][ok] * units('m/s')).to('kt'), (v[0][ok] * units('m/s')).to('kt'), length=7, color='white')
+        skew.ax.legend(handles=[mlines.Line2D([], [], color=c, lw=2, label=e) for c, e in zip(colors, etiquetes)], fontsize='small', ncol=2 if len(etiquetes) > 8 else 1)
+    return obtenir_fons_skewt().renderitzar(dibuixar)
+
+def crear_hodograf_comparatiu(u, v, h, etiquetes):
+    fig, ax = plt.subplots(1, 1, figsize=(5, 5))
+    hodo = Hodograph(ax, component_range=40.); hodo.add_grid(increment=10)
+    colors = plt.cm.plasma(np.linspace(0, 0.9, len(etiquetes)))
+    sota_10km = h - h[:, :1] <= 10000
+    u_kt, v_kt = np.where(sota_10km, u, np.nan) * 1.943844, np.where(sota_10km, v, np.nan) * 1.943844
+    ax.add_collection(LineCollection(segments_perfils(u_kt, v_kt), colors=colors, linewidths=1.5))
+    ax.set_xlabel('kt'); ax.set_ylabel('kt')
+    return fig
+
+def taules_comparativa(lot, etiquetes):
+    valors = pd.DataFrame({f"{k} ({UNITATS_PARAMETRES[k]})": lot[k] for k in UNITATS_PARAMETRES}, index=etiquetes)
+    return valors, valors - valors.iloc[0]
+
+# --- ARXIU DE SONDEIGS EN TEXT ---
+# Format dels fitxers desats (00h.txt..23h.txt, multi_sondeig.txt, ...): capçalera amb data vàlida,
+# abast i passada, i una fila per nivell "Altitud  Pressió  T  Tw  Td  HR  Vent" de dalt a baix.
+DIR_APP = os.path.dirname(os.path.abspath(__file__))
+FITXERS_ARXIU = [f"{h:02d}h.txt" for h in range(24)] + ["multi_sondeig.txt", "sondeig_destacable.txt", "sondeig_interessant.txt", "sondeigseguiment.txt", "sondeigproves.txt", "neubcn.txt"]
+MESOS = {'janvier': 1, 'février': 2, 'mars': 3, 'avril': 4, 'mai': 5, 'juin': 6, 'juillet': 7, 'août': 8, 'septembre': 9, 'octobre': 10, 'novembre': 11, 'décembre': 12,
+         'gener': 1, 'febrer': 2, 'març': 3, 'abril': 4, 'maig': 5, 'juny': 6, 'juliol': 7, 'agost': 8, 'setembre': 9, 'octubre': 10, 'desembre': 12}
+PATRO_FILA = re.compile(r'^\s*(-?\d+)\s*m[^\t]*\t\s*(\d+)\s*hPa\t\s*(-?[\d.]+)\s*°C\t\s*(-?[\d.]+)\s*°C\t\s*(-?[\d.]+)\s*°C\t\s*(\d+)\s*%\t\s*(\d+)\s*°\s*/\s*([\d.]+)\s*kt')
+PATRO_VALID = re.compile(r'(\d{1,2}) (\w+) (\d{4}) (\d{1,2}):(\d{2})')
+PATRO_RUN = re.compile(r'Run (\d{2})Z \w+ \w+ (\d{1,2}) (\w+) (\d{4})')
+
+def llegir_sondeigs_arxiu(path):
+    sondeigs, meta, files = [], {}, None
+    def tancar():
+        if files:
+            a = np.array(files[::-1])
+            sondeigs.append({'fitxer': os.path.basename(path), 'h': a[:, 0], 'p': a[:, 1], 'T': a[:, 2], 'Tw': a[:, 3], 'Td': a[:, 4], 'wd': a[:, 6], 'ws_kt': a[:, 7], **meta})
+    with open(path, encoding='utf-8') as fitxer:
+        for linia in fitxer:
+            fila = PATRO_FILA.match(linia)
+            if fila:
+                files.append([float(x) for x in fila.groups()]); continue
+            if linia.strip().startswith(('Altitud', 'Altitude')):
+                tancar(); files = []; continue
+            if files: tancar(); files = None; meta = {}
+            if (m := PATRO_VALID.search(linia)) and m.group(2).lower() in MESOS:
+                meta['valid'] = datetime(int(m.group(3)), MESOS[m.group(2).lower()], int(m.group(1)), int(m.group(4)), int(m.group(5)))
+            if (m := PATRO_RUN.search(linia)) and m.group(3).lower() in MESOS:
+                meta['run'] = datetime(int(m.group(4)), MESOS[m.group(3).lower()], int(m.group(2)), int(m.group(1)))
+                if 'valid' in meta:
+                    # L'hora vàlida és local i la passada en UTC
+                    valid_utc = pytz.timezone('Europe/Madrid').localize(meta['valid']).astimezone(pytz.utc).replace(tzinfo=None)
+                    meta['abast_h'] = int(round((valid_utc - meta['run']).total_seconds() / 3600))
+    tancar()
+    return sondeigs
+
+def columnes_arxiu(sondeigs):
+    L = max(len(s['p']) for s in sondeigs)
+    p, T, Td, u, v, h = (np.full((len(sondeigs), L), np.nan) for _ in range(6))
+    for i, s in enumerate(sondeigs):
+        n = len(s['p']); ws, wd = s['ws_kt'] * 0.514444, np.deg2rad(s['wd'])
+        p[i, :n], T[i, :n], Td[i, :n], h[i, :n] = s['p'], s['T'], s['Td'], s['h']
+        u[i, :n], v[i, :n] = -ws * np.sin(wd), -ws * np.cos(wd)
+    return p, T, Td, u, v, h
+
+def carregar_arxiu_sondeigs():
+    return [s for f in FITXERS_ARXIU if os.path.exists(os.path.join(DIR_APP, f)) for s in llegir_sondeigs_arxiu(os.path.join(DIR_APP, f))]
+
+# --- RESOLUCIÓ VERTICAL ADAPTATIVA ---
+# AROME ofereix més nivells de pressió dels 12 que es demanen sempre. Els extres es demanen en blocs,
+# per ordre de prioritat (capa límit, entorn del LCL/LFC, resta) i fins al pressupost de bytes de la petició.
+NIVELLS_AROME_DISPONIBLES = [1000, 950, 925, 900, 850, 800, 750, 700, 650, 600, 550, 500, 450, 400, 350, 300, 275, 250, 225, 200, 175, 150, 125, 100]
+VARIABLES_NIVELL = ["temperature", "dew_point", "wind_speed", "wind_direction", "geopotential_height"]
+BYTES_PER_NIVELL = len(VARIABLES_NIVELL) * (24 * 4 + 48)
+MIDA_BLOC_NIVELLS = 4
+RESOLUCIONS_VERTICALS = {"Estàndard (12 nivells)": 0, "Adaptativa": 8 * BYTES_PER_NIVELL, "Completa (24 nivells)": np.inf}
+
+def altura_std_a_pressio(h_m):
+    return 1013.25 * (1 - h_m * 0.0065 / 288.0) ** (G0 / (Rd * 0.0065))
+
+def planificar_nivells(p_sfc, p_lcl, p_lfc, pressupost_bytes):
+    def prioritat(pl):
+        if pl >= p_sfc: return None
+        if p_sfc - pl <= 250: return 0
+        if np.any(np.abs(pl - np.concatenate([np.atleast_1d(p_lcl), np.atleast_1d(p_lfc)])) <= 75): return 1
+        return 2 if np.isinf(pressupost_bytes) else None
+    candidats = sorted((prioritat(pl), -pl, pl) for pl in NIVELLS_AROME_DISPONIBLES if pl not in P_LEVELS_AROME and prioritat(pl) is not None)
+    n_max = len(candidats) if np.isinf(pressupost_bytes) else int(pressupost_bytes // BYTES_PER_NIVELL)
+    return [pl for _, _, pl in candidats[:n_max]]
+
+@cau_gestionada('Nivells extra', max_entrades=300, max_mb=32)
+def obtener_nivells_extra(lat, lon, nivells, dia=0):
+    params = {"latitude": lat, "longitude": lon, "hourly": [f"{v}_{p}hPa" for v in VARIABLES_NIVELL for p in nivells],
+              "models": "arome_france", "timezone": "auto", **parametres_dia(dia)}
+    try:
+        return valors_respostes(openmeteo.weather_api("https://api.open-meteo.com/v1/forecast", params=params)).reshape(1, len(VARIABLES_NIVELL), len(nivells), -1)
+    except Exception as e:
+        # Sense els nivells extra el sondeig es queda amb els estàndard
+        registre.warning("Nivells extra %s de la cel·la (%s, %s): %s", nivells, lat, lon, e)
+        return None
+
+def obtener_perfils_alta_resolucio(lat, lon, pressupost_bytes, dia=0):
+    base = obtener_perfils_localitat(lat, lon, dia)
+    if base is None or pressupost_bytes == 0: return base
+    # El sondeig estàndard de totes les hores situa la capa límit i el rang de LCL/LFC del dia
+    sfc = base['sfc'][0].astype(float)
+    p_lcl, _ = lcl_lot(sfc[2], sfc[0] + 273.15, sfc[1] + 273.15)
+    lot = calcular_parametres_lot(*apilar_perfils([(base, h) for h in range(sfc.shape[1])]))
+    p_lfc = altura_std_a_pressio(lot['LFC_AGL'] + pressio_a_altura_std(sfc[2]))
+    nivells = planificar_nivells(np.nanmin(sfc[2]), p_lcl[np.isfinite(p_lcl)], p_lfc[np.isfinite(p_lfc)], pressupost_bytes)
+    press, p_levels = base['press'], list(base['p_levels'])
+    lat_c, lon_c = cela_de(lat, lon)
+    for i in range(0, len(nivells), MIDA_BLOC_NIVELLS):
+        bloc = tuple(nivells[i:i + MIDA_BLOC_NIVELLS])
+        extra = obtener_nivells_extra(lat_c, lon_c, bloc, dia)
+        if extra is None: break
+        press = np.concatenate([press, extra], axis=2); p_levels += list(bloc)
+    ordre = np.argsort(p_levels)[::-1]
+    return {**base, 'press': press[:, :, ordre], 'p_levels': [p_levels[i] for i in ordre]}
+
+# --- TAULA DE PSEUDOADIABÀTIQUES ---
+# Pseudoadiabàtiques precalculades amb el mateix RK4 del motor vectoritzat en una graella (θw, ln p), desades
+# en .npy i obertes amb mmap (un sol fitxer de ~0,6 MB compartit per tots els processos). Una parcel·la saturada
+# a (p, T) queda identificada per la seva θw (equivalent a la θe, però amb un eix uniforme en temperatura) i
+# l'ascens esdevé una interpolació bilineal. Fites respecte MetPy amb els sondeigs de l'arxiu (tests/test_parametres.py
+# i banc "Taula de pseudoadiabàtiques"): error màxim de 0,1 K a la parcel·la i de 0,03 K al bulb humit entre la
+# superfície i 100 hPa. Fora de la graella (θw de -45 a 45 °C, 1100-50 hPa) els valors queden retallats a la vora.
+DIR_TAULES = os.path.join(DIR_APP, 'taules')
+THETA_W_TAULA = np.arange(-45.0, 45.01, 0.25) + 273.15
+LN_P_TAULA = np.linspace(np.log(1100.0), np.log(50.0), 400)
+
+class TaulaPseudoadiabatiques:
+    def __init__(self, directori):
+        fitxer = os.path.join(directori, f"pseudoadiabatiques_{len(THETA_W_TAULA)}x{len(LN_P_TAULA)}.npy")
+        if not os.path.exists(fitxer):
+            os.makedirs(directori, exist_ok=True)
+            temporal = fitxer + f".{os.getpid()}.tmp"
+            with open(temporal, 'wb') as f: np.save(f, self.construir())
+            os.replace(temporal, fitxer)
+        self.t = np.asarray(np.load(fitxer, mmap_mode='r'))
+        self.pas_ln_p = LN_P_TAULA[0] - LN_P_TAULA[1]
+
+    @staticmethod
+    def construir():
+        # Cada fila surt de 1000 hPa a T = θw i s'integra nivell a nivell cap amunt i cap avall
+        p_taula, taula = np.exp(LN_P_TAULA), np.empty((len(THETA_W_TAULA), len(LN_P_TAULA)), dtype=np.float32)
+        inici = int(np.argmin(np.abs(p_taula - 1000.0)))
+        t_inici = ascens_pseudoadiabatic(np.full(len(THETA_W_TAULA), 1000.0), THETA_W_TAULA.copy(), np.full(len(THETA_W_TAULA), p_taula[inici]))
+        for sentit in (range(inici, len(p_taula)), range(inici, -1, -1)):
+            p_act, t_act = np.full(len(THETA_W_TAULA), p_taula[inici]), t_inici
+            for j in sentit:
+                t_act = ascens_pseudoadiabatic(p_act, t_act, np.full_like(p_act, p_taula[j])); p_act = np.full_like(p_act, p_taula[j])
+                taula[:, j] = t_act
+        return taula
+
+    def _index_p(self, p):
+        j = np.clip((LN_P_TAULA[0] - np.log(p)) / self.pas_ln_p, 0, len(LN_P_TAULA) - 1.000001)
+        j0 = np.where(np.isfinite(j), j, 0).astype(int)
+        return j0, j - j0
+
+    def index_theta(self, p, t_k):
+        # Índex fraccionari de la pseudoadiabàtica que passa per (p, t_k): a pressió fixa T creix amb θw,
+        # així que n'hi ha prou amb una bisecció sobre les files (9 passos per a 361 θw)
+        j0, f = self._index_p(p)
+        temp = lambda i: self.t[i, j0] * (1 - f) + self.t[i, j0 + 1] * f
+        lo, hi = np.zeros(np.shape(j0), dtype=int), np.full(np.shape(j0), len(THETA_W_TAULA) - 1)
+        while np.any(hi - lo > 1):
+            mig = (lo + hi) // 2; sota = temp(mig) < t_k
+            lo, hi = np.where(sota, mig, lo), np.where(sota, hi, mig)
+        t1, t2 = temp(lo), temp(hi)
+        return np.clip(lo + (t_k - t1) / (t2 - t1), 0, len(THETA_W_TAULA) - 1.000001)
+
+    def temperatura(self, i_theta, p):
+        i0 = np.where(np.isfinite(i_theta), i_theta, 0).astype(int); g = i_theta - i0
+        j0, f = self._index_p(p)
+        return ((self.t[i0, j0] * (1 - f) + self.t[i0, j0 + 1] * f) * (1 - g) + (self.t[i0 + 1, j0] * (1 - f) + self.t[i0 + 1, j0 + 1] * f) * g)
+
+    def ascens(self, p_lcl, t_lcl, p):
+        return self.temperatura(self.index_theta(p_lcl, t_lcl)[:, None], p)
+
+    def bulb_humit(self, p, t_k, td_k):
+        # Com mpcalc.wet_bulb_temperature: ascens sec fins al LCL i baixada per la pseudoadiabàtica fins a p
+        p_lcl, t_lcl = lcl_lot(p, t_k, td_k)
+        return self.temperatura(self.index_theta(p_lcl, t_lcl), p)
+
+@st.cache_resource
+def obtenir_taula_pseudoadiabatiques():
+    return TaulaPseudoadiabatiques(DIR_TAULES)
+
+MOTORS_ASCENS = {"Integració RK4": lambda: None, "Taula de pseudoadiabàtiques": obtenir_taula_pseudoadiabatiques}
+
+# --- CONVERGÈNCIA A LA MALLA NATIVA ---
+# Mode ràpid: les diferències finites es fan directament sobre la malla regular de la petició (12×12, o més
+# densa si se'n descarrega una altra) amb les coordenades que retorna l'API, i la divergència només
+# s'interpola (bilineal) a les localitats. Evita les dues interpolacions cúbiques a 100×100 punts.
+# Els punts sense dades queden a NaN i les localitats que en depenen no es marquen.
+def divergencia_malla_nativa(lats, lons, u, v, lats_graella=LATS_GRAELLA, lons_graella=LONS_GRAELLA):
+    # Cada punt retornat (ajustat a la cel·la del model) torna al seu node de la malla demanada
+    fila = np.abs(np.asarray(lats)[:, None] - lats_graella).argmin(axis=1)
+    col = np.abs(np.asarray(lons)[:, None] - lons_graella).argmin(axis=1)
+    forma = (len(lats_graella), len(lons_graella))
+    lat_2d, lon_2d = np.repeat(lats_graella[:, None], forma[1], axis=1), np.repeat(lons_graella[None, :], forma[0], axis=0)
+    u_2d, v_2d = np.full(forma, np.nan), np.full(forma, np.nan)
+    lat_2d[fila, col], lon_2d[fila, col], u_2d[fila, col], v_2d[fila, col] = lats, lons, u, v
+    dx, dy = mpcalc.lat_lon_grid_deltas(lon_2d, lat_2d)
+    return mpcalc.divergence(u_2d * units('m/s'), v_2d * units('m/s'), dx=dx, dy=dy).m * 1e5
+
+def mostreig_bilineal(camp, lats_graella, lons_graella, lats, lons):
+    fi = np.interp(lats, lats_graella, np.arange(len(lats_graella)))
+    fj = np.interp(lons, lons_graella, np.arange(len(lons_graella)))
+    i0, j0 = np.minimum(fi.astype(int), len(lats_graella) - 2), np.minimum(fj.astype(int), len(lons_graella) - 2)
+    a, b = fi - i0, fj - j0
+    return (camp[i0, j0] * (1 - a) * (1 - b) + camp[i0 + 1, j0] * a * (1 - b)
+            + camp[i0, j0 + 1] * (1 - a) * b + camp[i0 + 1, j0 + 1] * a * b)
+
+def divergencia_pobles_nativa(lats, lons, speeds, dirs, localitats, lats_graella=LATS_GRAELLA, lons_graella=LONS_GRAELLA):
+    speeds_ms, dirs_rad = np.asarray(speeds) / 3.6, np.radians(dirs)
+    camp = divergencia_malla_nativa(lats, lons, -speeds_ms * np.sin(dirs_rad), -speeds_ms * np.cos(dirs_rad), lats_graella, lons_graella)
+    return mostreig_bilineal(camp, lats_graella, lons_graella, localitats.lats, localitats.lons)
+
+MOTORS_CONVERGENCIA = {"Interpolació cúbica (100×100)": divergencia_pobles_cubica, "Malla nativa (ràpid)": divergencia_pobles_nativa}
+MOTOR_CONVERGENCIA_PER_DEFECTE = "Interpolació cúbica (100×100)"
+
+# --- ARXIU CLIMATOLÒGIC ---
+# Arxiu columnar només d'afegir. Cada lot arxivat (una passada, una importació) és un segment nou: un
+# directori amb un .npy per columna que es publica amb un rename atòmic i ja no es modifica. Les columnes
+# escalars es carreguen senceres i s'indexen per (localitat, hora vàlida); els perfils, que són la part
+# gran, es llegeixen per mmap només quan es demanen.
+DIR_CLIMATOLOGIA = os.path.join(DIR_APP, 'climatologia')
+GRAELLA_CLIMATOLOGIA = np.arange(1000.0, 99.0, -25.0)
+VARIABLES_PERFIL_CLIMATOLOGIA = ('T', 'Td', 'u', 'v')
+FONTS_CLIMATOLOGIA = {'AROME': 0, 'Arxiu de text': 1}
+OPERADORS_CONSULTA = {'>': np.greater, '≥': np.greater_equal, '<': np.less, '≤': np.less_equal}
+
+def segons_utc(dt_local):
+    return int(pytz.timezone('Europe/Madrid').localize(dt_local).timestamp())
+
+def perfils_a_graella(p, T, Td, u, v, h=None):
+    lnp = np.log(p)
+    sortida = {var: np.full((len(p), len(GRAELLA_CLIMATOLOGIA)), np.nan, dtype=np.float32) for var in VARIABLES_PERFIL_CLIMATOLOGIA}
+    for j, nivell in enumerate(GRAELLA_CLIMATOLOGIA):
+        x = np.full(len(p), np.log(nivell))
+        for var, y in zip(VARIABLES_PERFIL_CLIMATOLOGIA, (T, Td, u, v)): sortida[var][:, j] = interp_columnes(x, lnp, y)
+    return sortida
+
+class ArxiuClimatologic:
+    ESCALARS = {'poble': np.int32, 'valid': np.int64, 'run': np.int64, 'font': np.int8}
+
+    def __init__(self, directori):
+        self.directori = directori
+        self._lock = threading.Lock()
+        self.segments, self.perfils, self.pobles = [], [], []
+        self.columnes = {c: np.array([], dtype=t) for c, t in self.ESCALARS.items()}
+        self.columnes.update({k: np.array([], dtype=np.float32) for k in UNITATS_PARAMETRES})
+        self._indexar()
+        self.recarregar()
+
+    def __len__(self):
+        return len(self.columnes['poble'])
+
+    def _indexar(self):
+        c = self.columnes
+        self.inici_segments = np.cumsum([0] + [n for _, n in self.perfils])
+        self.ordre = np.lexsort((c['valid'], c['poble']))
+        self.poble_ordenat, self.valid_ordenat = c['poble'][self.ordre], c['valid'][self.ordre]
+        # Per a cada (localitat, hora vàlida) només la passada més recent compta com a previsió vigent
+        o = np.lexsort((-c['run'], c['valid'], c['poble']))
+        primer = np.ones(len(o), dtype=bool)
+        primer[1:] = (c['poble'][o][1:] != c['poble'][o][:-1]) | (c['valid'][o][1:] != c['valid'][o][:-1])
+        self.es_ultima = np.zeros(len(o), dtype=bool); self.es_ultima[o[primer]] = True
+        self.runs = set(np.unique(c['run']).tolist())
+
+    def recarregar(self):
+        with self._lock:
+            if not os.path.isdir(self.directori): return
+            nous = sorted(d for d in os.listdir(self.directori) if d.startswith('seg_') and d not in self.segments)
+            if not nous: return
+            with open(os.path.join(self.directori, 'pobles.json'), encoding='utf-8') as f: self.pobles = json.load(f)
+            blocs = [self.columnes]
+            for nom in nous:
+                ruta = os.path.join(self.directori, nom)
+                n = len(np.load(os.path.join(ruta, 'poble.npy'), mmap_mode='r'))
+                # Els segments antics no tenen les columnes afegides després: es llegeixen com a NaN
+                blocs.append({c: np.load(os.path.join(ruta, f'{c}.npy')) if os.path.exists(os.path.join(ruta, f'{c}.npy')) else np.full(n, np.nan, dtype=np.float32) for c in self.columnes})
+                perfils = {var: np.load(os.path.join(ruta, f'perfil_{var}.npy'), mmap_mode='r') for var in VARIABLES_PERFIL_CLIMATOLOGIA if os.path.exists(os.path.join(ruta, f'perfil_{var}.npy'))}
+                self.segments.append(nom); self.perfils.append((perfils or None, n))
+            self.columnes = {c: np.concatenate([b[c] for b in blocs]) for c in self.columnes}
+            self._indexar()
+
+    def afegir(self, pobles, valid, run, font, parametres, perfils=None):
+        with self._lock:
+            self.pobles += [nom for nom in dict.fromkeys(pobles) if nom not in self.pobles]
+            index = {nom: i for i, nom in enumerate(self.pobles)}
+            os.makedirs(self.directori, exist_ok=True)
+            with open(os.path.join(self.directori, 'pobles.json.tmp'), 'w', encoding='utf-8') as f: json.dump(self.pobles, f, ensure_ascii=False)
+            os.replace(os.path.join(self.directori, 'pobles.json.tmp'), os.path.join(self.directori, 'pobles.json'))
+            nom = f"seg_{time.time_ns():020d}"
+            temporal = os.path.join(self.directori, f".{nom}")
+            os.makedirs(temporal)
+            columnes = {'poble': [index[p] for p in pobles], 'valid': valid, 'run': np.broadcast_to(run, len(pobles)), 'font': np.broadcast_to(font, len(pobles))}
+            for c, tipus in self.ESCALARS.items(): np.save(os.path.join(temporal, f'{c}.npy'), np.asarray(columnes[c], dtype=tipus))
+            for k, val in parametres.items(): np.save(os.path.join(temporal, f'{k}.npy'), np.asarray(val, dtype=np.float32))
+            for var, val in (perfils or {}).items(): np.save(os.path.join(temporal, f'perfil_{var}.npy'), np.asarray(val, dtype=np.float32))
+            os.rename(temporal, os.path.join(self.directori, nom))
+        self.recarregar()
+
+    def conte_run(self, run):
+        return run in self.runs
+
+    def consultar(self, poble=None, des_de=None, fins_a=None, run=None, font=None, condicions=(), ultima_passada=True):
+        # Índexs de les files que compleixen totes les condicions; tot són operacions sobre columnes senceres
+        if poble is not None:
+            if poble not in self.pobles: return np.array([], dtype=np.int64)
+            pid = self.pobles.index(poble)
+            a, b = np.searchsorted(self.poble_ordenat, [pid, pid + 1])
+            # Dins d'una localitat les files ja estan ordenades per hora vàlida
+            valid = self.valid_ordenat[a:b]
+            i0 = np.searchsorted(valid, des_de) if des_de is not None else 0
+            i1 = np.searchsorted(valid, fins_a, side='right') if fins_a is not None else len(valid)
+            files = self.ordre[a + i0:a + i1]
+        else:
+            mascara = np.ones(len(self), dtype=bool)
+            if des_de is not None: mascara &= self.columnes['valid'] >= des_de
+            if fins_a is not None: mascara &= self.columnes['valid'] <= fins_a
+            files = np.flatnonzero(mascara)
+        mascara = self.es_ultima[files] if ultima_passada else np.ones(len(files), dtype=bool)
+        if run is not None: mascara &= self.columnes['run'][files] == run
+        if font is not None: mascara &= self.columnes['font'][files] == font
+        with np.errstate(invalid='ignore'):
+            for columna, operador, llindar in condicions: mascara &= OPERADORS_CONSULTA[operador](self.columnes[columna][files], llindar)
+        return files[mascara]
+
+    def taula(self, files):
+        tz = pytz.timezone('Europe/Madrid'); c = self.columnes
+        taula = pd.DataFrame({'Localitat': np.array(self.pobles, dtype=object)[c['poble'][files]] if len(self.pobles) else [],
+                              'Vàlid': pd.to_datetime(c['valid'][files], unit='s', utc=True).tz_convert(tz).tz_localize(None),
+                              'Passada': pd.to_datetime(c['run'][files], unit='s', utc=True).strftime('%Y-%m-%d %HZ'),
+                              'Font': np.array(list(FONTS_CLIMATOLOGIA), dtype=object)[c['font'][files]]})
+        for k in UNITATS_PARAMETRES: taula[f"{k} ({UNITATS_PARAMETRES[k]})"] = c[k][files]
+        return taula
+
+    def perfils_files(self, files):
+        sortida = {var: np.full((len(files), len(GRAELLA_CLIMATOLOGIA)), np.nan, dtype=np.float32) for var in VARIABLES_PERFIL_CLIMATOLOGIA}
+        segment = np.searchsorted(self.inici_segments, files, side='right') - 1
+        for s in np.unique(segment):
+            perfils, _ = self.perfils[s]
+            if perfils is None: continue
+            dins = segment == s
+            for var in perfils: sortida[var][dins] = perfils[var][files[dins] - self.inici_segments[s]]
+        return sortida
+
+@st.cache_resource
+def obtenir_arxiu_climatologic():
+    return ArxiuClimatologic(DIR_CLIMATOLOGIA)
+
+def index_pobles(instantania):
+    # Localitats de pobles_data (ordenades) i la fila de la seva cel·la a la instantània
+    noms = pobles_data.noms
+    celles = obtenir_planificador_celles().resoldre(pobles_data.coordenades)
+    noms, idx = zip(*[(nom, instantania['pobles']['index'][c]) for nom, c in zip(noms, celles) if c in instantania['pobles']['index']])
+    return list(noms), np.array(idx)
+
+def arxivar_instantania(instantania, arxiu):
+    # Les hores anteriors a l'inici de la passada vénen de la instantània anterior i ja són a l'arxiu
+    run = int(pytz.utc.localize(datetime.strptime(instantania['run'], '%Y%m%d%HZ')).timestamp())
+    if arxiu.conte_run(run): return 0
+    pobles = instantania['pobles']; perfils = pobles['perfils']
+    noms, idx = index_pobles(instantania)
+    hores = range(instantania['hora_inici'], perfils['sfc'].shape[-1])
+    data = datetime.strptime(instantania['data'], '%Y-%m-%d')
+    graelles = [perfils_a_graella(*muntar_columnes(perfils['sfc'], perfils['press'], P_LEVELS_AROME, h)) for h in hores]
+    arxiu.afegir(noms * len(hores), np.repeat([segons_utc(data + timedelta(hours=h)) for h in hores], len(noms)), run, FONTS_CLIMATOLOGIA['AROME'],
+                 {k: pobles['parametres'][k][idx][:, hores].T.ravel() for k in UNITATS_PARAMETRES},
+                 {var: np.concatenate([g[var][idx] for g in graelles]) for var in VARIABLES_PERFIL_CLIMATOLOGIA})
+    return len(noms) * len(hores)
+
+def arxivar_sondeigs_text(arxiu):
+    claus = set(zip(*(arxiu.columnes[c][arxiu.columnes['font'] == FONTS_CLIMATOLOGIA['Arxiu de text']].tolist() for c in ('valid', 'run'))))
+    nous = {}
+    for s in carregar_arxiu_sondeigs():
+        if 'valid' in s and 'run' in s and (clau := (segons_utc(s['valid']), int(pytz.utc.localize(s['run']).timestamp()))) not in claus: nous.setdefault(clau, s)
+    sondeigs = list(nous.values())
+    if not sondeigs: return 0
+    columnes = columnes_arxiu(sondeigs)
+    arxiu.afegir(["Arxiu de text"] * len(sondeigs), [segons_utc(s['valid']) for s in sondeigs], [int(pytz.utc.localize(s['run']).timestamp()) for s in sondeigs],
+                 FONTS_CLIMATOLOGIA['Arxiu de text'], calcular_parametres_lot(*columnes), perfils_a_graella(*columnes))
+    return len(sondeigs)
+
+# --- VERIFICACIÓ AMB ELS SONDEIGS DE TEXT ---
+# Els sondeigs de text importats a l'arxiu fan d'observació i les previsions AROME arxivades d'una localitat de
+# referència, de previsió. S'aparellen per hora vàlida (totes les passades, cadascuna amb el seu abast) i es comparen
+# sobre la graella comuna de pressió de l'arxiu: els errors de tots els parells i nivells són una sola matriu per
+# variable, i el biaix i l'RMSE per nivell, per paràmetre o per tram d'abast són sumes sobre un eix.
+FONT_OBSERVACIO = FONTS_CLIMATOLOGIA['Arxiu de text']
+VARIABLES_VERIFICACIO = {'T': '°C', 'Td': '°C', 'Vent': 'm/s', 'Vector vent': 'm/s'}
+TRAMS_ABAST = np.array([0, 6, 12, 24, 36, 48])
+
+def parelles_verificacio(arxiu, poble):
+    # Un sol sondeig observat per hora vàlida (el primer importat) i totes les previsions de la localitat a aquella hora
+    c = arxiu.columnes
+    obs = arxiu.consultar(font=FONT_OBSERVACIO, ultima_passada=False)
+    obs = obs[np.unique(c['valid'][obs], return_index=True)[1]]
+    prev = arxiu.consultar(poble=poble, font=FONTS_CLIMATOLOGIA['AROME'], ultima_passada=False)
+    if not len(obs) or not len(prev): return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    pos = np.minimum(np.searchsorted(c['valid'][obs], c['valid'][prev]), len(obs) - 1)
+    ok = c['valid'][obs][pos] == c['valid'][prev]
+    return obs[pos[ok]], prev[ok]
+
+def biaix_rmse(e, eix=0):
+    ok = np.isfinite(e); n = ok.sum(axis=eix)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return n, np.where(ok, e, 0).sum(axis=eix) / n, np.sqrt(np.where(ok, e * e, 0).sum(axis=eix) / n)
+
+def errors_verificacio(arxiu, obs, prev):
+    # Previsió − observació per (parell, nivell); el vector vent és el mòdul de la diferència (sempre positiu)
+    po, pp = arxiu.perfils_files(obs), arxiu.perfils_files(prev)
+    return {'T': pp['T'] - po['T'], 'Td': pp['Td'] - po['Td'], 'Vent': np.hypot(pp['u'], pp['v']) - np.hypot(po['u'], po['v']),
+            'Vector vent': np.hypot(pp['u'] - po['u'], pp['v'] - po['v'])}
+
+def verificar_previsions(arxiu, poble, abast_max=None):
+    c = arxiu.columnes
+    obs, prev = parelles_verificacio(arxiu, poble)
+    abast = (c['valid'][prev] - c['run'][prev]) / 3600
+    if abast_max is not None: obs, prev, abast = obs[abast <= abast_max], prev[abast <= abast_max], abast[abast <= abast_max]
+    errors = errors_verificacio(arxiu, obs, prev)
+    nivells = {'Nivell (hPa)': GRAELLA_CLIMATOLOGIA, 'Parells': biaix_rmse(errors['T'])[0]}
+    for var, unitat in VARIABLES_VERIFICACIO.items():
+        _, biaix, rmse = biaix_rmse(errors[var])
+        if var != 'Vector vent': nivells[f"{var} biaix ({unitat})"] = biaix
+        nivells[f"{var} RMSE ({unitat})"] = rmse
+    taula_nivells = pd.DataFrame(nivells)
+    # Paràmetres derivats: els de l'arxiu, calculats amb el mateix motor per a les dues fonts
+    parametres = []
+    for k, unitat in UNITATS_PARAMETRES.items():
+        o, p = c[k][obs].astype(float), c[k][prev].astype(float); ok = np.isfinite(o) & np.isfinite(p)
+        n, biaix, rmse = biaix_rmse(p - o)
+        parametres.append({'Paràmetre': k, 'Unitats': unitat, 'Parells': int(n), 'Mitjana observada': o[ok].mean() if ok.any() else np.nan, 'Biaix': biaix, 'RMSE': rmse,
+                           'MAE': np.abs(p - o)[ok].mean() if ok.any() else np.nan, 'Correlació': np.corrcoef(o[ok], p[ok])[0, 1] if ok.sum() > 2 and o[ok].std() > 0 and p[ok].std() > 0 else np.nan})
+    # Trams d'abast: sumes per parell agrupades amb bincount
+    tram = np.clip(np.searchsorted(TRAMS_ABAST, abast, side='right') - 1, 0, len(TRAMS_ABAST) - 1)
+    abasts = {'Abast (h)': [f"{a}–{b}" for a, b in zip(TRAMS_ABAST[:-1], TRAMS_ABAST[1:])] + [f"≥{TRAMS_ABAST[-1]}"],
+              'Parells': np.bincount(tram, minlength=len(TRAMS_ABAST))}
+    for var in ('T', 'Td', 'Vector vent'):
+        e = errors[var]; ok = np.isfinite(e)
+        n = np.bincount(tram, ok.sum(axis=1), minlength=len(TRAMS_ABAST))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if var != 'Vector vent': abasts[f"{var} biaix ({VARIABLES_VERIFICACIO[var]})"] = np.bincount(tram, np.where(ok, e, 0).sum(axis=1), minlength=len(TRAMS_ABAST)) / n
+            abasts[f"{var} RMSE ({VARIABLES_VERIFICACIO[var]})"] = np.sqrt(np.bincount(tram, np.where(ok, e * e, 0).sum(axis=1), minlength=len(TRAMS_ABAST)) / n)
+    taula_abast = pd.DataFrame(abasts)
+    return {'parells': len(prev), 'observats': len(np.unique(obs)), 'passades': len(np.unique(c['run'][prev])), 'nivells': taula_nivells[taula_nivells['Parells'] > 0],
+            'parametres': pd.DataFrame(parametres), 'abast': taula_abast[taula_abast['Parells'] > 0]}
+
+def crear_grafic_verificacio(taula_nivells):
+    fig, axs = plt.subplots(1, 3, figsize=(11, 5), sharey=True)
+    p = taula_nivells['Nivell (hPa)']
+    for ax, var in zip(axs, ('T', 'Td', 'Vent')):
+        unitat = VARIABLES_VERIFICACIO[var]
+        ax.axvline(0, color='grey', lw=0.8)
+        ax.plot(taula_nivells[f"{var} biaix ({unitat})"], p, color='darkred', marker='o', ms=3, label='Biaix')
+        ax.plot(taula_nivells[f"{var} RMSE ({unitat})"], p, color='steelblue', marker='s', ms=3, label='RMSE')
+        if var == 'Vent': ax.plot(taula_nivells[f"Vector vent RMSE ({unitat})"], p, color='steelblue', ls='--', label='RMSE vectorial')
+        ax.set_title(var, weight='bold'); ax.set_xlabel(unitat); ax.grid(alpha=0.3); ax.legend(fontsize='small')
+    axs[0].set_yscale('log'); axs[0].invert_yaxis(); axs[0].set_ylabel('Pressió (hPa)')
+    axs[0].set_yticks([1000, 850, 700, 500, 300, 200]); axs[0].set_yticklabels(['1000', '850', '700', '500', '300', '200']); axs[0].yaxis.set_minor_formatter(plt.NullFormatter())
+    fig.tight_layout()
+    return fig
+
+# --- CERCA D'ANÀLEGS ---
+# Cada perfil de l'arxiu climatològic es converteix en un vector (T, Td, u, v de 1000 a 200 hPa, estandarditzats
+# de manera que cada variable pesi igual), es redueix amb PCA (SVD d'una mostra) i s'indexa amb un KD-tree.
+# Els segments nous es projecten amb la base que ja hi ha; la base només es reajusta quan l'arxiu dobla la mida.
+NIVELLS_ANALEGS = GRAELLA_CLIMATOLOGIA >= 200
+COMPONENTS_ANALEGS = 12
+MOSTRA_PCA = 20000
+FACTOR_CANDIDATS = 10
+BLOC_PROJECCIO = 50000
+
+def omplir_extrems(x):
+    # Els nivells sota terra prenen el primer valor vàlid i els de dalt de tot l'últim
+    ok = np.isfinite(x); files, j = np.arange(len(x)), np.arange(x.shape[1])
+    primer, ultim = np.argmax(ok, axis=1), x.shape[1] - 1 - np.argmax(ok[:, ::-1], axis=1)
+    x = np.where(j < primer[:, None], x[files, primer][:, None], x)
+    return np.where(j > ultim[:, None], x[files, ultim][:, None], x)
+
+def caracteristiques_perfils(perfils):
+    return np.concatenate([omplir_extrems(perfils[var][:, NIVELLS_ANALEGS].astype(float)) for var in VARIABLES_PERFIL_CLIMATOLOGIA], axis=1)
+
+class IndexAnalegs:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.n_arxiu = self.n_ajust = 0
+        self.mitjana = self.escala = self.base = self.arbre = None
+        self.files, self.puntuacions = np.empty(0, dtype=np.int64), np.empty((0, COMPONENTS_ANALEGS))
+
+    def __len__(self):
+        return len(self.files)
+
+    def _ajustar(self, arxiu):
+        mostra = np.sort(np.random.default_rng(0).choice(len(arxiu), min(MOSTRA_PCA, len(arxiu)), replace=False))
+        x = caracteristiques_perfils(arxiu.perfils_files(mostra)); x = x[np.isfinite(x).all(axis=1)]
+        n_nivells = NIVELLS_ANALEGS.sum()
+        self.mitjana = x.mean(axis=0)
+        self.escala = np.maximum(x.std(axis=0), 1e-3) * np.sqrt(n_nivells)
+        _, _, vt = np.linalg.svd((x - self.mitjana) / self.escala, full_matrices=False)
+        self.base, self.n_ajust = vt[:COMPONENTS_ANALEGS].T, len(arxiu)
+
+    def projectar(self, x):
+        return ((x - self.mitjana) / self.escala) @ self.base
+
+    def actualitzar(self, arxiu):
+        with self._lock:
+            if len(arxiu) == self.n_arxiu: return
+            if self.base is None or len(arxiu) >= 2 * self.n_ajust:
+                self._ajustar(arxiu)
+                self.files, self.puntuacions, inici = np.empty(0, dtype=np.int64), np.empty((0, self.base.shape[1])), 0
+            else:
+                inici = self.n_arxiu
+            files, puntuacions = [self.files], [self.puntuacions]
+            for i in range(inici, len(arxiu), BLOC_PROJECCIO):
+                bloc = np.arange(i, min(i + BLOC_PROJECCIO, len(arxiu)))
+                x = caracteristiques_perfils(arxiu.perfils_files(bloc)); ok = np.isfinite(x).all(axis=1)
+                files.append(bloc[ok]); puntuacions.append(self.projectar(x[ok]))
+            self.files, self.puntuacions = np.concatenate(files), np.concatenate(puntuacions)
+            self.arbre = cKDTree(self.puntuacions) if len(self.files) else None
+            self.n_arxiu = len(arxiu)
+
+    def cercar(self, arxiu, perfil, k):
+        # El KD-tree proposa candidats en l'espai reduït; es reordenen amb la distància exacta sobre el vector complet
+        if self.arbre is None: return np.empty(0, dtype=np.int64), np.empty(0)
+        x = caracteristiques_perfils(perfil)
+        if not np.isfinite(x).all(): return np.empty(0, dtype=np.int64), np.empty(0)
+        _, i = self.arbre.query(self.projectar(x)[0], k=min(k * FACTOR_CANDIDATS, len(self.files)))
+        candidats = self.files[np.atleast_1d(i)]
+        distancies = np.sqrt((((caracteristiques_perfils(arxiu.perfils_files(candidats)) - x) / self.escala) ** 2).sum(axis=1))
+        ordre = np.argsort(distancies)[:k]
+        return candidats[ordre], distancies[ordre]
+
+@st.cache_resource
+def obtenir_index_analegs():
+    return IndexAnalegs()
+
+def cercar_analegs(arxiu, index, perfil, valid, k=8, poble=None):
+    # Un sol anàleg per localitat i dia, i mai del mateix dia que el sondeig consultat
+    dia = lambda t: (t + 7200) // 86400  # dia local aproximat
+    n_candidats = k * 24
+    while True:
+        files, distancies = index.cercar(arxiu, perfil, n_candidats)
+        escollits, vistos = [], set()
+        for fila, d in zip(files, distancies):
+            clau = (arxiu.columnes['poble'][fila], dia(arxiu.columnes['valid'][fila]))
+            if clau in vistos or clau[1] == dia(valid) or (poble is not None and arxiu.pobles[clau[0]] != poble): continue
+            vistos.add(clau); escollits.append((fila, d))
+            if len(escollits) == k: break
+        if len(escollits) == k or n_candidats >= len(index): return escollits
+        n_candidats *= 4
+
+def columnes_graella(perfils):
+    # Perfils de la graella comuna a columnes compactades (superfície primer) per al Skew-T i la parcel·la
+    T = perfils['T'].astype(float); valid = np.isfinite(T) & np.isfinite(perfils['Td'])
+    p = np.broadcast_to(GRAELLA_CLIMATOLOGIA, T.shape)
+    return compactar_columnes(valid, p, T, *(perfils[var].astype(float) for var in ('Td', 'u', 'v')))
+
+# --- SONDEIGS MULTIMODEL ---
+# El mateix punt amb diversos models d'Open-Meteo. Les descàrregues que falten es llancen alhora (un fil per
+# model, sense crides a Streamlit dins dels fils) i després es calculen els paràmetres de tots els models i
+# hores en un sol lot vectoritzat. AROME surt de la instantània de la passada; els nivells de pressió que un
+# model no ofereix arriben buits i el muntatge de columnes els descarta.
+MODELS_SONDEIG = {"AROME": "arome_france", "ICON-D2": "icon_d2", "ARPEGE": "meteofrance_arpege_europe", "ECMWF IFS": "ecmwf_ifs025"}
+PARAMETRES_DISPERSIO = ['CAPE_Utilitzable', 'CIN_Fre', 'Shear_0-6km', 'SRH_0-1km', 'SRH_0-3km']
+
+# Cada model publica les passades al seu ritme: l'entrada caduca pel ttl (el mateix que la memòria cau HTTP)
+@cau_gestionada('Sondeigs multimodel', max_entrades=200, max_mb=48, per_run=False)
+def descarregar_perfils_model(lat, lon, model, dia=0):
+    params = {"latitude": lat, "longitude": lon, "hourly": HOURLY_SONDEIG, "models": model, "timezone": "auto", **parametres_dia(dia)}
+    return descodificar_perfils(openmeteo.weather_api("https://api.open-meteo.com/v1/forecast", params=params), P_LEVELS_AROME)
+
+def obtener_perfils_multimodel(lat, lon, models, dia=0):
+    # Els models amb un horitzó més curt que el dia demanat queden sense dades en lloc de fer una petició buida
+    perfils = {}
+    for nom in models:
+        if dia >= HORITZO_DIES[MODELS_SONDEIG[nom]]: perfils[nom] = None; continue
+        if MODELS_SONDEIG[nom] == 'arome_france':
+            try: perfils[nom] = obtener_perfils_localitat(lat, lon, dia)
+            except ErrorOpenMeteo: perfils[nom] = None
+    falten = [nom for nom in models if nom not in perfils]
+    if falten:
+        # Els que ja són a la memòria cau tornen de seguida del seu fil
+        with ThreadPoolExecutor(max_workers=len(falten)) as executor:
+            futurs = {nom: executor.submit(descarregar_perfils_model, lat, lon, MODELS_SONDEIG[nom], dia) for nom in falten}
+        for nom, futur in futurs.items():
+            try: perfils[nom] = futur.result()
+            except Exception as e:
+                registre.warning("Sondeig %s a (%s, %s), dia %s: %s", nom, lat, lon, dia, e); perfils[nom] = None
+    return {nom: perfils[nom] for nom in models}
+
+def parametres_multimodel(perfils):
+    # Retorna els models amb dades i un diccionari de matrius (model, hora)
+    models = [nom for nom, dades in perfils.items() if dades is not None]
+    if not models: return [], {}
+    n_hores = min(perfils[nom]['sfc'].shape[-1] for nom in models)
+    lot = calcular_parametres_lot(*apilar_perfils([(perfils[nom], h) for nom in models for h in range(n_hores)]))
+    return models, {k: val.reshape(len(models), n_hores) for k, val in lot.items()}
+
+def avis_consens(lot_hora):
+    # Avís calculat sobre la mediana de cada paràmetre entre models, i quants models hi coincideixen (pel text: AVISOS
+    # repeteix colors entre nivells)
+    mediana = {k: np.median(val[np.isfinite(val)]) if np.isfinite(val).any() else np.nan for k, val in lot_hora.items()}
+    text, color = generar_avis_localitat(ConjuntParametres.de_valors(mediana))
+    avisos = [generar_avis_localitat(ConjuntParametres.de_valors({k: val[i] for k, val in lot_hora.items()})) for i in range(len(next(iter(lot_hora.values()))))]
+    return text, color, avisos, sum(t == text for t, _ in avisos)
+
+def taula_dispersio(models, lot_hora):
+    taula = pd.DataFrame({f"{k} ({UNITATS_PARAMETRES[k]})": lot_hora[k] for k in PARAMETRES_DISPERSIO}, index=models)
+    with np.errstate(invalid='ignore'):
+        return taula, pd.DataFrame({'Mínim': taula.min(), 'Màxim': taula.max(), 'Rang': taula.max() - taula.min(), 'Desviació': taula.std(ddof=0)})
+
+# --- METEOGRAMA ---
+# Sèrie de les 24 hores d'una localitat. La instantània de la passada ja té els paràmetres de totes les
+# cel·les i hores; sense instantània es calculen totes les hores en un sol lot.
+def serie_parametres_localitat(lat, lon, dia=0):
+    cela = cela_de(lat, lon)
+    instantania = obtenir_magatzem_passades().instantania(dia)
+    if instantania and cela in instantania['pobles']['index']:
+        i = instantania['pobles']['index'][cela]
+        return {k: val[i] for k, val in instantania['pobles']['parametres'].items()}
+    dades = obtener_perfils_cela(*cela, dia)
+    if dades is None: return None
+    return calcular_parametres_lot(*apilar_perfils([(dades, h) for h in range(dades['sfc'].shape[-1])]))
+
+def finestra_risc(nivells):
+    # Primer tram d'hores seguides amb el nivell d'avís més alt del dia
+    maxim = nivells.max(); inici = int(np.argmax(nivells == maxim)); fi = inici
+    while fi + 1 < len(nivells) and nivells[fi + 1] == maxim: fi += 1
+    return int(maxim), inici, fi
+
+def crear_meteograma(serie, nivells, hora):
+    hores = np.arange(len(nivells))
+    fig, axs = plt.subplots(4, 1, figsize=(10, 8), sharex=True, gridspec_kw={'height_ratios': [3, 2, 2, 0.6]})
+    ax = axs[0]
+    ax.bar(hores, serie['CAPE_Utilitzable'], color='orange', alpha=0.8, label='CAPE Utilitzable')
+    ax.plot(hores, serie['CAPE_Brut'], color='darkred', lw=1.5, label='CAPE Brut')
+    ax.set_ylabel('CAPE (J/kg)'); ax.legend(loc='upper left', fontsize='small')
+    ax_cin = ax.twinx()
+    ax_cin.fill_between(hores, serie['CIN_Fre'], 0, color='steelblue', alpha=0.3, step='mid'); ax_cin.set_ylabel('CIN (J/kg)', color='steelblue')
+    ax.set_zorder(ax_cin.get_zorder() + 1); ax.patch.set_visible(False)
+    axs[1].plot(hores, serie['Shear_0-6km'], color='purple', marker='o', ms=3)
+    for llindar in (12, 18, 20): axs[1].axhline(llindar, color='gray', ls='--', lw=0.8)
+    axs[1].set_ylabel('Shear 0-6km (m/s)')
+    axs[2].plot(hores, serie['SRH_0-1km'], color='crimson', marker='o', ms=3, label='0-1 km')
+    axs[2].plot(hores, serie['SRH_0-3km'], color='darkmagenta', ls='--', label='0-3 km')
+    axs[2].axhline(250, color='gray', ls='--', lw=0.8); axs[2].set_ylabel('SRH (m²/s²)'); axs[2].legend(loc='upper left', fontsize='small')
+    axs[3].bar(hores, 1, width=1, color=[AVISOS[n][1] for n in nivells], edgecolor='white')
+    axs[3].set_yticks([]); axs[3].set_ylabel('Avís', rotation=0, ha='right', va='center')
+    axs[3].set_xticks(hores); axs[3].set_xticklabels([f"{h:02d}" for h in hores]); axs[3].set_xlabel('Hora local')
+    for a in axs: a.axvline(hora, color='black', ls=':', lw=1.2); a.grid(axis='x', alpha=0.3)
+    fig.tight_layout()
+    return fig
+
+# --- RESUM REGIONAL D'AVISOS ---
+# Totes les localitats i hores surten de les matrius precalculades de la instantània (una fila per cel·la);
+# només cal repartir-les per localitat. Sense instantània es fa un sol lot a partir de la memòria cau de sondeigs.
+NOMS_CURTS_AVISOS = ["Estable", "Inhibida (CIN)", "LFC massa alt", "Risc baix", "Precaució", "Avís", "Risc alt"]
+
+def columnes_localitats(dia=0):
+    noms = pobles_data.noms
+    obtener_sondeigs_lot(pobles_data.coordenades, dia)
+    dades = [(nom, obtener_perfils_localitat(lat, lon, dia)) for nom, (lat, lon) in zip(noms, pobles_data.coordenades)]
+    dades = [(nom, d) for nom, d in dades if d is not None]
+    if not dades: return [], None, 0
+    n_hores = min(d['sfc'].shape[-1] for _, d in dades)
+    return [nom for nom, _ in dades], apilar_perfils([(d, h) for _, d in dades for h in range(n_hores)]), n_hores
+
+def resum_regional(instantania, dia=0):
+    if instantania:
+        noms, idx = index_pobles(instantania)
+        return noms, {k: val[idx] for k, val in instantania['pobles']['parametres'].items()}, instantania['pobles']['avisos'][idx]
+    noms, columnes, n_hores = columnes_localitats(dia)
+    if not noms: return [], {}, np.empty((0, 24), dtype=int)
+    matrius = {k: val.reshape(len(noms), n_hores) for k, val in calcular_parametres_lot(*columnes).items()}
+    return noms, matrius, generar_avis_lot(matrius)
+
+def crear_mapa_avisos(noms, nivells, titol):
+    fig = plt.figure(figsize=(9, 9), dpi=150)
+    ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    ax.set_extent([0, 3.5, 40.4, 43], crs=ccrs.PlateCarree())
+    ax.add_feature(cfeature.LAND, facecolor="#E0E0E0", zorder=0)
+    ax.add_feature(cfeature.OCEAN, facecolor='#b0c4de', zorder=0)
+    ax.add_feature(cfeature.COASTLINE, edgecolor='black', linewidth=0.5, zorder=3)
+    ax.add_feature(cfeature.BORDERS, linestyle=':', edgecolor='black', zorder=3)
+    files = pobles_data.files(noms); lats, lons = pobles_data.lats[files], pobles_data.lons[files]
+    ordre = np.argsort(nivells)
+    ax.scatter(lons[ordre], lats[ordre], c=[AVISOS[n][1] for n in nivells[ordre]], s=40 + 25 * nivells[ordre], edgecolor='black', linewidth=0.5, zorder=4, transform=ccrs.PlateCarree())
+    for i in np.flatnonzero(nivells >= 4):
+        ax.text(lons[i] + 0.04, lats[i] + 0.03, noms[i], fontsize=7, weight='bold', zorder=5, transform=ccrs.PlateCarree())
+    presents = sorted(set(nivells.tolist()))
+    ax.legend(handles=[mlines.Line2D([], [], marker='o', ls='', markersize=8, markerfacecolor=AVISOS[n][1], markeredgecolor='black', label=NOMS_CURTS_AVISOS[n]) for n in presents], loc='lower right', fontsize='small')
+    ax.set_title(titol, weight='bold')
+    return fig
+
+# --- COTA DE NEU REGIONAL ---
+# Cota de neu i tipus de precipitació de totes les localitats i hores, de la instantània de la passada (un sol lot
+# per construcció) o, sense instantània, d'un sol lot a partir de la memòria cau de sondeigs.
+def precipitacio_regional(instantania, dia=0):
+    if instantania and 'precipitacio' in instantania['pobles']:
+        noms, idx = index_pobles(instantania)
+        return noms, {k: val[idx] for k, val in instantania['pobles']['precipitacio'].items()}
+    noms, columnes, n_hores = columnes_localitats(dia)
+    if not noms: return [], {}
+    p, T, Td, _, _, h = columnes
+    return noms, {k: val.reshape(len(noms), n_hores) for k, val in calcular_precipitacio_lot(p, T, Td, h).items()}
+
+def crear_mapa_cota_neu(noms, cota, tipus, titol):
+    fig = plt.figure(figsize=(9, 9), dpi=150)
+    ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    ax.set_extent([0, 3.5, 40.4, 43], crs=ccrs.PlateCarree())
+    ax.add_feature(cfeature.LAND, facecolor="#E0E0E0", zorder=0)
+    ax.add_feature(cfeature.OCEAN, facecolor='#b0c4de', zorder=0)
+    ax.add_feature(cfeature.COASTLINE, edgecolor='black', linewidth=0.5, zorder=3)
+    ax.add_feature(cfeature.BORDERS, linestyle=':', edgecolor='black', zorder=3)
+    files = pobles_data.files(noms); lats, lons = pobles_data.lats[files], pobles_data.lons[files]
+    norm = BoundaryNorm(np.arange(0, 3001, 250), plt.cm.viridis.N, extend='max')
+    for codi, (nom, _, marcador) in enumerate(TIPUS_PRECIPITACIO):
+        sel = tipus == codi
+        if sel.any(): ax.scatter(lons[sel], lats[sel], c=cota[sel], cmap='viridis', norm=norm, marker=marcador, s=60 if codi == PLUJA else 110, edgecolor='black', linewidth=0.5, zorder=4, transform=ccrs.PlateCarree())
+    for i in np.flatnonzero(np.isin(tipus, [NEU, GRESOL, PLUJA_GELANT])):
+        ax.text(lons[i] + 0.04, lats[i] + 0.03, noms[i], fontsize=7, weight='bold', zorder=5, transform=ccrs.PlateCarree())
+    fig.colorbar(plt.cm.ScalarMappable(norm=norm, cmap='viridis'), ax=ax, shrink=0.6, pad=0.02, label='Cota de neu (m)')
+    presents = sorted({int(t) for t in tipus[np.isfinite(tipus)]})
+    ax.legend(handles=[mlines.Line2D([], [], marker=TIPUS_PRECIPITACIO[t][2], ls='', markersize=8, markerfacecolor='lightgrey', markeredgecolor='black', label=TIPUS_PRECIPITACIO[t][0]) for t in presents], loc='lower right', fontsize='small')
+    ax.set_title(titol, weight='bold')
+    return fig
+
+def crear_cronologia_neu(matrius, hora, fila=None, nom=None):
+    # Dalt: dispersió regional de la cota de neu per hora i la localitat triada; baix: localitats per tipus
+    cota, tipus = matrius['Cota_Neu'], matrius['Tipus_Precipitacio']; hores = np.arange(cota.shape[1])
+    fig, axs = plt.subplots(2, 1, figsize=(10, 6), sharex=True, gridspec_kw={'height_ratios': [3, 1.5]})
+    ax = axs[0]; amb_dades = np.isfinite(cota).any(axis=0)
+    p10, p50, p90 = (np.full(len(hores), np.nan) for _ in range(3))
+    p10[amb_dades], p50[amb_dades], p90[amb_dades] = np.nanpercentile(cota[:, amb_dades], [10, 50, 90], axis=0)
+    ax.fill_between(hores, p10, p90, color='lightsteelblue', alpha=0.6, label='Localitats (p10-p90)')
+    ax.plot(hores, p50, color='steelblue', lw=1.5, label='Mediana regional')
+    if fila is not None:
+        ax.plot(hores, cota[fila], color='navy', lw=2, label=f'Cota de neu a {nom}')
+        ax.plot(hores, matrius['Isozero_Bulb_Humit'][fila], color='navy', ls='--', lw=1, label='Isozero de bulb humit')
+        ax.plot(hores, matrius['Altitud_Terra'][fila], color='saddlebrown', lw=1.5, label='Terra de la cel·la')
+    ax.set_ylabel('Altitud (m)'); ax.set_ylim(bottom=0); ax.legend(loc='upper left', fontsize='small')
+    acumulat = np.zeros(len(hores))
+    for codi, (nom_tipus, color, _) in enumerate(TIPUS_PRECIPITACIO):
+        compte = (tipus == codi).sum(axis=0)
+        if compte.any(): axs[1].bar(hores, compte, bottom=acumulat, color=color, edgecolor='grey', lw=0.5, label=nom_tipus); acumulat += compte
+    axs[1].set_ylim(0, max(acumulat.max(), 1) * 1.4); axs[1].set_ylabel('Localitats'); axs[1].legend(loc='upper left', fontsize='small', ncol=len(TIPUS_PRECIPITACIO))
+    axs[1].set_xticks(hores); axs[1].set_xticklabels([f"{h:02d}" for h in hores]); axs[1].set_xlabel('Hora local')
+    for a in axs: a.axvline(hora, color='black', ls=':', lw=1.2); a.grid(axis='x', alpha=0.3)
+    fig.tight_layout()
+    return fig
+
+# --- INGESTA INCREMENTAL DE PASSADES AROME ---
+# Una instantània conté tot el que es deriva d'una passada: perfils de la graella, paràmetres per hora
+# i localitats en convergència per (hora, nivell). Els lectors sempre veuen una instantània completa;
+# la nova es construeix en segon pla reaprofitant l'anterior i es publica amb un sol canvi de referència.
+LLINDAR_CONVERGENCIA = -5.5
+ESPERA_REINTENT_PASSADA = 300
+# Cada quants segons la pàgina mira si ja ha arribat el fragment d'un altre dia (mentrestant demana per localitat)
+INTERVAL_COMPROVACIO_DIA = 2
+
+def get_arome_run_publicada():
+    try:
+        meta = cache_session.get("https://api.open-meteo.com/data/meteofrance_arome_france0025/static/meta.json", expire_after=600, timeout=10).json()
+        return datetime.fromtimestamp(meta['last_run_initialisation_time'], pytz.utc).strftime('%Y%m%d%HZ')
+    except Exception:
+        return get_arome_run_actual()
+
+def hora_local_run(run):
+    run_utc = pytz.utc.localize(datetime.strptime(run, '%Y%m%d%HZ'))
+    run_local = run_utc.astimezone(pytz.timezone('Europe/Madrid'))
+    avui = datetime.now(pytz.timezone('Europe/Madrid')).date()
+    return run_local.hour if run_local.date() == avui else 0
+
+def columnes_canviades(perfils, anteriors, hora, nivell=None):
+    if nivell is None:
+        a = np.concatenate([perfils['sfc'][:, :, hora], perfils['press'][:, :, :, hora].reshape(len(perfils['lats']), -1)], axis=1)
+        b = np.concatenate([anteriors['sfc'][:, :, hora], anteriors['press'][:, :, :, hora].reshape(len(anteriors['lats']), -1)], axis=1)
+    else:
+        j = P_LEVELS_AROME.index(nivell)
+        a, b = perfils['press'][:, 2:4, j, hora], anteriors['press'][:, 2:4, j, hora]
+    return ~np.all((a == b) | (np.isnan(a) & np.isnan(b)), axis=1)
+
+def vents_graella(instantania, hora, nivell):
+    perfils = instantania['perfils']; j = P_LEVELS_AROME.index(nivell)
+    speeds, dirs = perfils['press'][:, 2, j, hora], perfils['press'][:, 3, j, hora]
+    ok = ~np.isnan(speeds) & ~np.isnan(dirs)
+    return perfils['lats'][ok].tolist(), perfils['lons'][ok].tolist(), speeds[ok].tolist(), dirs[ok].tolist()
+
+def convergencia_instantania(instantania, hora, nivell, motor=MOTOR_CONVERGENCIA_PER_DEFECTE):
+    clau = (hora, nivell, motor)
+    if clau not in instantania['convergencia']:
+        instantania['convergencia'][clau] = calcular_localitats_convergencia(*vents_graella(instantania, hora, nivell), pobles_data, LLINDAR_CONVERGENCIA, motor)
+    return instantania['convergencia'][clau]
+
+def actualitzar_conjunt(nous, anterior, hora_inici):
+    # Fusiona les hores noves amb les del conjunt anterior i només recalcula les columnes que han canviat.
+    # Els paràmetres i els índexs queden en un sol conjunt (columna, hora, paràmetre) de float32; temps_indexs
+    # és el cost de cada família d'índexs en aquesta construcció
+    if anterior is not None:
+        sfc, press = anterior['perfils']['sfc'].copy(), anterior['perfils']['press'].copy()
+        sfc[..., hora_inici:], press[..., hora_inici:] = nous['sfc'], nous['press']
+        perfils = {**nous, 'sfc': sfc, 'press': press}
+        valors = anterior['parametres'].valors.copy()
+    else:
+        perfils = nous
+        valors = np.full((len(perfils['lats']), perfils['sfc'].shape[-1], len(NOMS_LOT)), np.nan, dtype=np.float32)
+    temps = dict.fromkeys(INDEXS_SEVERS, 0.0)
+    for hora in range(perfils['sfc'].shape[-1]):
+        canvi = columnes_canviades(perfils, anterior['perfils'], hora) if anterior is not None else np.ones(len(perfils['lats']), dtype=bool)
+        if not canvi.any(): continue
+        columnes = muntar_columnes(perfils['sfc'][canvi], perfils['press'][canvi], P_LEVELS_AROME, hora)
+        nou_lot = calcular_parametres_lot(*columnes)
+        nou_lot.update(calcular_indexs_lot(*columnes, nou_lot, temps=temps))
+        valors[canvi, hora] = np.column_stack([nou_lot[k] for k in NOMS_LOT])
+    return {'perfils': perfils, 'parametres': ConjuntParametres(NOMS_LOT, valors), 'temps_indexs': temps}
+
+def construir_instantania(run, anterior, precalcular=False, dia=0):
+    # Una instantània per dia de l'horitzó; només la d'avui reaprofita les hores anteriors a la passada
+    data = data_dia(dia).isoformat()
+    reaprofitable = anterior is not None and anterior['data'] == data
+    hora_inici = hora_local_run(run) if reaprofitable and dia == 0 else 0
+    graella = actualitzar_conjunt(descarregar_perfils_graella(hora_inici, dia), anterior if reaprofitable else None, hora_inici)
+    # Les localitats es desen per cel·la del model, com a la memòria cau de sondeigs
+    celles = sorted(set(obtenir_planificador_celles().resoldre(coordenades_pobles())))
+    anteriors_pobles = anterior['pobles'] if reaprofitable and anterior['pobles']['celles'] == celles else None
+    nous_pobles = descarregar_perfils_punts([c[0] for c in celles], [c[1] for c in celles], hora_inici if anteriors_pobles else 0, dia)
+    pobles = {**actualitzar_conjunt(nous_pobles, anteriors_pobles, hora_inici if anteriors_pobles else 0), 'celles': celles, 'index': {c: i for i, c in enumerate(celles)}}
+    # Nivell d'avís i diagnòstic hivernal de cada (cel·la, hora), per als resums de tota la regió
+    pobles['avisos'] = generar_avis_lot(pobles['parametres'])
+    pobles['precipitacio'] = precipitacio_perfils(pobles['perfils'])
+    instantania = {'run': run, 'data': data, 'dia': dia, 'hora_inici': hora_inici, **graella, 'pobles': pobles, 'convergencia': {}}
+    if reaprofitable:
+        for (hora, nivell, motor), llista in anterior['convergencia'].items():
+            if not columnes_canviades(graella['perfils'], anterior['perfils'], hora, nivell).any():
+                instantania['convergencia'][(hora, nivell, motor)] = llista
+    if precalcular:
+        for hora in range(graella['perfils']['sfc'].shape[-1]):
+            for nivell in P_LEVELS_AROME: convergencia_instantania(instantania, hora, nivell)
+    return instantania
+
+class MagatzemPassades:
+    # La instantània d'avui es manté com fins ara; la dels altres dies de l'horitzó és un Future per dia, lligat a
+    # la passada i a la data, que llança el primer que el demana (la pàgina o la precàrrega en segon pla)
+    def __init__(self, arxiu=None):
+        self._actual = None
+        self._arxiu = arxiu
+        self._lock = threading.Lock()
+        self._fil = None
+        self._ultim_intent = 0.0
+        self._error_construccio = self._error_arxiu = None
+        self._dies, self._errors_dies = {}, {}
+        self._executor_dies = ThreadPoolExecutor(max_workers=2, thread_name_prefix='dies')
+
+    def instantania(self, dia=0):
+        # El fragment d'un altre dia no s'espera: mentre es construeix (o si ha fallat) es retorna None
+        if dia == 0 or self._actual is None: return self._actual
+        run, futur = self._actual['run'], self._fragment_dia(dia)
+        if not futur.done(): return None
+        if (e := futur.exception()) is not None:
+            registre.warning("Fragment del dia %s de la passada %s: %s", dia, run, e)
+            with self._lock: self._errors_dies[dia] = (run, e)
+            return None
+        with self._lock: self._errors_dies.pop(dia, None)
+        return futur.result()
+
+    def carregant_dia(self, dia):
+        return dia > 0 and self._actual is not None and not self._fragment_dia(dia).done()
+
+    def precarregar(self, dies):
+        if self._actual is None: return
+        for dia in dies:
+            if dia > 0: self._fragment_dia(dia)
+
+    def incidencies(self):
+        # Última construcció i últim arxivament que han fallat, com a (passada, excepció), i segons fins al proper intent
+        with self._lock: return self._error_construccio, self._error_arxiu, max(0.0, ESPERA_REINTENT_PASSADA - (time.time() - self._ultim_intent))
+
+    def incidencia_dia(self, dia):
+        # Últim error (passada, excepció) en servir el dia, fins que se serveix bé
+        with self._lock: return self._errors_dies.get(dia)
+
+    def dies_carregats(self):
+        with self._lock: fragments = list(self._dies.items())
+        return sorted(dia for dia, (_, futur) in fragments if futur.done() and futur.exception() is None)
+
+    def _fragment_dia(self, dia):
+        run = self._actual['run']; clau = (run, data_dia(dia).isoformat())
+        with self._lock:
+            fragment = self._dies.get(dia)
+            if fragment is None or fragment[0] != clau or (fragment[1].done() and fragment[1].exception() is not None):
+                fragment = self._dies[dia] = (clau, self._executor_dies.submit(construir_instantania, run, None, False, dia))
+        return fragment[1]
+
+    def actualitzar(self, run):
+        actual = self._actual
+        avui = datetime.now(pytz.timezone('Europe/Madrid')).strftime('%Y-%m-%d')
+        if actual is not None and actual['run'] == run and actual['data'] == avui: return
+        # També en fred: fins que es publica la primera instantània, la pàgina demana les dades per localitat
+        with self._lock:
+            if (self._fil is not None and self._fil.is_alive()) or time.time() - self._ultim_intent < ESPERA_REINTENT_PASSADA: return
+            self._ultim_intent = time.time()
+            self._fil = threading.Thread(target=self._construir, args=(run, actual), daemon=True)
+            self._fil.start()
+
+    def construint(self):
+        with self._lock: return self._fil is not None and self._fil.is_alive()
+
+    def _construir(self, run, anterior):
+        # Si falla es continua servint la instantània anterior (o les peticions per localitat, en fred); l'error es
+        # queda fins a la propera passada publicada. En fred es publica sense precalcular la convergència.
+        try: self._publicar(construir_instantania(run, anterior, precalcular=anterior is not None))
+        except Exception as e:
+            registre.exception("No s'ha pogut construir la passada %s; es continua servint la %s", run, anterior['run'] if anterior else "cap")
+            with self._lock: self._error_construccio = (run, e)
+
+    def _publicar(self, nova):
+        with self._lock: self._actual, self._error_construccio = nova, None
+        if self._arxiu is not None: threading.Thread(target=self._arxivar, args=(nova,), daemon=True).start()
+
+    def _arxivar(self, instantania):
+        try:
+            arxivar_instantania(instantania, self._arxiu)
+            with self._lock: self._error_arxiu = None
+        except Exception as e:
+            registre.exception("No s'ha pogut arxivar la passada %s", instantania['run'])
+            with self._lock: self._error_arxiu = (instantania['run'], e)
+
+@st.cache_resource
+def obtenir_magatzem_passades():
+    return MagatzemPassades(obtenir_arxiu_climatologic())
+
+# --- ESTAT DE SESSIÓ ---
+# Els canvis de pestanya o de controls interns només tornen a executar el fragment de les pestanyes; la resta de
+# reexecucions reutilitzen el sondeig de la localitat (perfil, isoterma i paràmetres) guardat a la sessió
+# mentre no canviïn la passada, la localitat, la resolució o l'hora.
+def memoritzar_sessio(nom, clau, calcular):
+    memo = st.session_state.get(nom)
+    if memo is None or memo[0] != clau: memo = st.session_state[nom] = (clau, calcular())
+    return memo[1]
+
+def sondeig_localitat(dades_poble, hora):
+    # Perfil del punt per a l'hora (superfície + nivells per sobre del terra), isoterma de 0 °C, paràmetres, índexs i cota de neu
+    if not dades_poble: return None
+    if np.isnan(dades_poble['sfc'][0, 2, hora]): return {'sense_pressio': True}
+    columnes = [c[0] for c in muntar_columnes(dades_poble['sfc'][:1], dades_poble['press'][:1], dades_poble['p_levels'], hora)]
+    n = int(np.isfinite(columnes[0]).sum())
+    if n == 0: return {'sense_pressio': False}
+    perfil = Sondeig(*(c[:n] for c in columnes))
+    parametros = calculate_parameters(*perfil.amb_unitats())
+    p, T, Td, u, v, h = perfil.dades.astype(float)[:, None, :]
+    indexs = calcular_indexs_lot(p, T, Td, u, v, h, {k: np.atleast_1d(val) for k, val in parametros.items()})
+    precipitacio = calcular_precipitacio_lot(p, T, Td, h)
+    # La isoterma de 0 °C surt dels índexs (primer pas des de terra), en metres sobre el terra
+    zero_iso_h_agl = (float(indexs['Iso_0C'][0]) - float(h[0, 0])) * units.m if np.isfinite(indexs['Iso_0C'][0]) else None
+    return {'sense_pressio': False, 'perfil': perfil, 'zero_iso_h_agl': zero_iso_h_agl, 'parametros': parametros | parametres_columna(indexs | precipitacio, 0)}
+
+# --- RENDERITZACIÓ PROGRESSIVA ---
+# La convergència, el sondeig de la localitat i les figures pesades (mapa de vents, Skew-T, núvol) es calculen
+# en un grup de fils compartit; el fil del guió només omple els llocs reservats a mesura que acaben, de manera
+# que l'avís i les mètriques surten abans que la resta. Els Future es guarden a la sessió amb la seva clau:
+# una reexecució o el fragment de pestanyes recullen el càlcul en curs en lloc de tornar-lo a llançar.
+# Les tasques del grup no criden st.* (no tenen context de guió).
+PESTANYES = ["🗨️ Anàlisi Detallada", "📊 Paràmetres", "📈 Meteograma", "🗺️ Mapes de Vents", "🔄 Hodògraf", "🏔️ Sondeig", "🔎 Anàlegs", "🗺️ Orografia", "☁️ Visualització", "🌡️ Mapes de Paràmetres", "🔁 Comparativa", "📚 Climatologia", "🧭 Multimodel", "🚨 Catalunya ara", "❄️ Cota de neu", "✅ Verificació"]
+METRIQUES_RESUM = [('CAPE Utilitzable', 'CAPE_Utilitzable'), ('CIN (Fre)', 'CIN_Fre'), ('Shear 0-6km', 'Shear_0-6km'), ('SRH 0-1km', 'SRH_0-1km')]
+
+@st.cache_resource
+def obtenir_executor_pagina():
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix='pagina')
+
+def en_segon_pla(nom, clau, funcio, *args):
+    # Un càlcul que ha fallat no es queda a la sessió: la propera execució el torna a llançar
+    memo = st.session_state.get(nom)
+    if memo is not None and memo[1].done() and memo[1].exception() is not None: del st.session_state[nom]
+    return memoritzar_sessio(nom, clau, lambda: obtenir_executor_pagina().submit(funcio, *args))
+
+def localitats_en_convergencia(instantania, hora, nivell, motor, dia=0):
+    if instantania: return convergencia_instantania(instantania, hora, nivell, motor)
+    return encontrar_localitats_con_convergencia(hora, nivell, pobles_data, LLINDAR_CONVERGENCIA, motor, dia)
+
+def sondeig_punt(lat, lon, pressupost_bytes, hora, dia=0):
+    return sondeig_localitat(obtener_perfils_alta_resolucio(lat, lon, pressupost_bytes, dia), hora)
+
+def png_mapa_vents(instantania, hora, nivell, dia=0):
+    lats_map, lons_map, speeds_map, dirs_map = vents_graella(instantania, hora, nivell) if instantania else obtener_dades_mapa_vents(hora, nivell, dia)
+    if not lats_map or len(lats_map) <= 4: return None
+    u_map, v_map = mpcalc.wind_components((np.array(speeds_map) * 1000 / 3600) * units('m/s'), np.array(dirs_map) * units.degrees)
+    return png_figura(crear_mapa_vents(lats_map, lons_map, u_map, v_map, pobles_data, nivell))
+
+def png_nuvol(sondeig, convergencia_activa):
+    _, _, _, u, v, H = sondeig['perfil'].amb_unitats()
+    fig = crear_grafic_nuvol(sondeig['parametros'], H, u, v, is_convergence_active=convergencia_activa)
+    return png_figura(fig) if fig else None
+
+def skewt_en_segon_pla(sondeig, clau_sondeig, motor_ascens):
+    p, T, Td, u, v, _ = sondeig['perfil'].amb_unitats()
+    return en_segon_pla('figura_skewt', (clau_sondeig, motor_ascens), crear_skewt, p, T, Td, u, v, MOTORS_ASCENS[motor_ascens](), obtenir_fons_skewt().renderitzar)
+
+def avis_api(funcio, *args, buit=None):
+    # Crida des del fil del guió: una descàrrega fallida es mostra a la pàgina i es retorna el valor buit
+    try: return funcio(*args)
+    except ErrorOpenMeteo as e:
+        st.error(f"Error a l'API d'Open-Meteo: {e}"); return buit
+
+def mostrar_figura(futur, text_espera, text_buit, avis_buit=st.info):
+    with st.spinner(text_espera):
+        try: png = futur.result()
+        except ErrorOpenMeteo as e:
+            st.error(f"Error a l'API d'Open-Meteo: {e}"); return
+    if png is None: avis_buit(text_buit)
+    else: st.image(png)
+
+# --- ANIMACIÓ DE LA CONVERGÈNCIA ---
+# Les 24 hores d'un nivell es renderitzen en un grup de processos (el dibuix de Matplotlib no allibera el GIL): cada
+# procés importa animacio_convergencia, hi dibuixa el fons estàtic una sola vegada i rep només els vents de cada hora,
+# que surten de la instantània sense tornar-los a descarregar. El GIF resultant es guarda per passada, dia i nivell:
+# un cop fet, reproduir-lo o tornar-hi no costa res. Els processos s'engeguen amb spawn (el servidor té fils).
+PROCESSOS_ANIMACIO = max(1, min(4, (os.cpu_count() or 1)))
+PPP_ANIMACIO, MS_FOTOGRAMA = 80, 600
+
+@st.cache_resource
+def obtenir_grup_animacio():
+    return ProcessPoolExecutor(max_workers=PROCESSOS_ANIMACIO, mp_context=multiprocessing.get_context('spawn'), initializer=inicialitzar, initargs=(PPP_ANIMACIO,))
+
+def feines_animacio(instantania, nivell, dia=0):
+    # (lats, lons, u, v, títol) de cada hora amb prou punts de vent
+    feines = []
+    for hora in range(instantania['perfils']['sfc'].shape[-1] if instantania else 24):
+        lats, lons, speeds, dirs = vents_graella(instantania, hora, nivell) if instantania else obtener_dades_mapa_vents(hora, nivell, dia)
+        if not lats or len(lats) <= 4: continue
+        u, v = mpcalc.wind_components((np.array(speeds) * 1000 / 3600) * units('m/s'), np.array(dirs) * units.degrees)
+        feines.append((np.array(lats), np.array(lons), u.m, v.m, f"Flux i focus de convergència a {nivell}hPa · {etiqueta_dia(dia)} {hora:02d}:00h"))
+    return feines
+
+def muntar_gif(fotogrames):
+    imatges = [Image.open(io.BytesIO(f)) for f in fotogrames]
+    memoria = io.BytesIO(); imatges[0].save(memoria, format='GIF', save_all=True, append_images=imatges[1:], duration=MS_FOTOGRAMA, loop=0)
+    return memoria.getvalue()
+
+@cau_gestionada('Animacions', max_entrades=12, max_mb=96, clau=lambda instantania, nivell, dia=0: (instantania['run'] if instantania else run_vigent(), nivell, dia))
+def gif_convergencia(instantania, nivell, dia=0):
+    feines = feines_animacio(instantania, nivell, dia)
+    if not feines: return None
+    try: return muntar_gif(list(obtenir_grup_animacio().map(renderitzar_fotograma, *zip(*feines))))
+    except BrokenProcessPool:
+        # Un procés mort deixa el grup inservible: el següent intent n'engega un de nou
+        obtenir_grup_animacio.clear(); raise
 
 # --- INTERFAZ PRINCIPAL ---
-st.markdown("""
+# La pàgina només es dibuixa quan el fitxer s'executa com a guió (streamlit run): els bancs de proves
+# (python -m bancs) i els tests l'importen com un mòdul sense cap element a la pàgina.
+OPCIONS_HORES = [f"{h:02d}:00h" for h in range(24)]
+
+@st.fragment(run_every=INTERVAL_COMPROVACIO_DIA)
+def esperar_fragment_dia(magatzem, dia):
+    # Comprova sense bloquejar si el dia ja és a punt; quan hi és, torna a dibuixar la pàgina amb el fragment
+    if not magatzem.carregant_dia(dia): st.rerun()
+
+@st.fragment
+def mostrar_pestanyes(sondeig, clau_sondeig, poble_sel, dia, hora, nivell_global, instantania, localitats_convergencia, analisi_parcelles, motor_ascens):
+    # Només aquesta funció es torna a executar quan canvia la pestanya o un control de dins d'una pestanya
+    t_inici = st.session_state.pop('inici_execucio', None); completa = t_inici is not None
+    t_inici = t_inici or time.perf_counter()
+    p, T, Td, u, v, H = sondeig['perfil'].amb_unitats(); parametros, zero_iso_h_agl = sondeig['parametros'], sondeig['zero_iso_h_agl']
+    lat_sel, lon_sel = pobles_data[poble_sel]['lat'], pobles_data[poble_sel]['lon']
+    tab_list = PESTANYES
+    selected_tab = st.radio("Navegació:", tab_list, index=0, horizontal=True, key='pestanya')
+
+    if selected_tab == tab_list[0]:
+        conversa = generar_analisi_detallada(parametros)
+        for msg in conversa:
+            st.markdown(f'<div class="chat-bubble">🧑‍🔬 {msg}</div>', unsafe_allow_html=True)
+    elif selected_tab == tab_list[1]:
+        st.subheader("Paràmetres Clau")
+        if analisi_parcelles:
+            parcelles = calcular_parcelles_lot(p.m[None], T.m[None], Td.m[None], H.m[None], MOTORS_ASCENS[motor_ascens]())
+            display_metrics(parametros | parametres_columna(parcelles, 0))
+        else: display_metrics(parametros)
+    elif selected_tab == tab_list[2]:
+        serie = avis_api(serie_parametres_localitat, lat_sel, lon_sel, dia)
+        if serie is not None:
+            nivells_avis = generar_avis_lot(serie)
+            maxim, inici, fi = finestra_risc(nivells_avis)
+            st.subheader(f"Evolució de les 24 hores a {poble_sel} ({etiqueta_dia(dia)})")
+            st.markdown(f'<div class="avis-box" style="border-color: {AVISOS[maxim][1]}; background-color: {AVISOS[maxim][1]}20;">Màxim del dia ({inici:02d}:00h–{fi:02d}:59h): {AVISOS[maxim][0]}</div>', unsafe_allow_html=True)
+            st.pyplot(crear_meteograma(serie, nivells_avis, hora))
+        else:
+            st.error("No s'ha pogut obtenir la sèrie horària d'aquesta localitat.")
+    elif selected_tab == tab_list[3]:
+        st.subheader(f"Vents i Convergència a {nivell_global}hPa")
+        if st.toggle("▶️ Animació de les 24 hores", key='animacio_vents'):
+            mostrar_figura(en_segon_pla('gif_vents', (instantania['run'] if instantania else run_vigent(), dia, nivell_global), gif_convergencia, instantania, nivell_global, dia),
+                           f"Renderitzant les 24 hores en {PROCESSOS_ANIMACIO} processos... 🎞️", "No hi ha prous punts de vent per animar aquest nivell.", st.error)
+        else:
+            mostrar_figura(en_segon_pla('figura_vents', (instantania['run'] if instantania else None, dia, hora, nivell_global), png_mapa_vents, instantania, hora, nivell_global, dia),
+                           "Generant mapa de vents... 🌬️💨", "No s'han pogut obtenir les dades per al mapa de vents o no hi ha prous punts de dades per a aquest nivell i hora.", st.error)
+    elif selected_tab == tab_list[4]:
+        st.subheader("Hodògraf (0-10 km)"); st.pyplot(crear_hodograf(p, u, v, H))
+    elif selected_tab == tab_list[5]:
+        st.subheader(f"Sondeig per a {poble_sel} ({etiqueta_dia(dia)}, {hora}:00h Local)"); mostrar_figura(skewt_en_segon_pla(sondeig, clau_sondeig, motor_ascens), "Dibuixant el sondeig...", "")
+    elif selected_tab == tab_list[6]:
+        arxiu = obtenir_arxiu_climatologic(); arxiu.recarregar()
+        index_analegs = obtenir_index_analegs()
+        with st.spinner("Indexant l'arxiu de sondeigs..."): index_analegs.actualitzar(arxiu)
+        if not len(index_analegs):
+            st.info("L'arxiu climatològic encara no té perfils. Es van afegint a cada passada; també pots importar l'arxiu de text des de la pestanya de Climatologia.")
+        else:
+            col_a, col_b = st.columns([1, 2])
+            with col_a: k_analegs = st.slider("Nombre d'anàlegs:", 3, 20, 8)
+            with col_b: nomes_poble = st.checkbox(f"Només sondeigs de {poble_sel}", value=False)
+            perfil_actual = perfils_a_graella(p.m[None], T.m[None], Td.m[None], u.m[None], v.m[None])
+            valid_actual = segons_utc(datetime.combine(data_dia(dia), datetime.min.time()) + timedelta(hours=hora))
+            t0 = time.perf_counter()
+            analegs = cercar_analegs(arxiu, index_analegs, perfil_actual, valid_actual, k_analegs, poble_sel if nomes_poble else None)
+            st.caption(f"{len(analegs)} anàlegs entre {len(index_analegs)} perfils indexats, trobats en {(time.perf_counter() - t0) * 1000:.1f} ms")
+            if analegs:
+                files_a = np.array([f for f, _ in analegs])
+                taula_a = arxiu.taula(files_a); taula_a.insert(0, 'Distància', [d for _, d in analegs])
+                st.dataframe(taula_a.round(1), hide_index=True)
+                top = files_a[:5]; perfils_top = arxiu.perfils_files(top)
+                p_a, T_a, Td_a, u_a, v_a = columnes_graella({var: np.concatenate([perfil_actual[var], perfils_top[var]]) for var in VARIABLES_PERFIL_CLIMATOLOGIA})
+                with np.errstate(invalid='ignore'):
+                    parcela_a = perfil_parcela_lot(p_a, p_a[:, 0], T_a[:, 0] + 273.15, Td_a[:, 0] + 273.15)[0] - 273.15
+                etiquetes_a = [f"{etiqueta_dia(dia)} {hora:02d}h"] + [f"{l} {v:%d/%m/%Y %Hh}" for l, v in zip(taula_a['Localitat'][:5], taula_a['Vàlid'][:5])]
+                st.image(crear_skewt_comparatiu(p_a, T_a, Td_a, parcela_a, u_a, v_a, etiquetes_a))
+            else:
+                st.info("No s'han trobat anàlegs amb aquests criteris.")
+    elif selected_tab == tab_list[7]:
+        st.subheader("Potencial d'Activació per Orografia")
+        fig_oro = crear_grafic_orografia(parametros, zero_iso_h_agl)
+        if fig_oro: st.pyplot(fig_oro)
+        else: st.info("No hi ha LCL o LFC, per tant no es pot calcular el potencial d'activació orogràfica.")
+    elif selected_tab == tab_list[8]:
+        st.subheader("Visualització del Núvol")
+        is_conv_active = poble_sel in localitats_convergencia
+        mostrar_figura(en_segon_pla('figura_nuvol', (clau_sondeig, is_conv_active), png_nuvol, sondeig, is_conv_active),
+                       "Dibuixant la possible estructura del núvol... ☁️⚡️", "No hi ha LCL o EL, per tant no es pot visualitzar l'estructura del núvol.")
+    elif selected_tab == tab_list[9]:
+        param_opcions = {"CAPE Utilitzable": 'CAPE_Utilitzable', "CIN (Fre)": 'CIN_Fre', "Shear 0-6km": 'Shear_0-6km', "SRH 0-1km": 'SRH_0-1km', "SRH 0-3km": 'SRH_0-3km',
+                         "DCAPE": 'DCAPE', "STP": 'STP', "SCP": 'SCP', "SHIP (calamarsa)": 'SHIP'}
+        param_label = st.selectbox("Paràmetre:", list(param_opcions.keys()))
+        st.subheader(f"{param_label} a tot Catalunya ({etiqueta_dia(dia)}, {hora}:00h)")
+        with st.spinner("Calculant paràmetres a tota la graella... 🗺️"):
+            if instantania and np.isfinite(instantania['parametres'][param_opcions[param_label]][:, hora]).sum() > 4:
+                perfils_g = instantania['perfils']
+                st.pyplot(crear_mapa_parametre(perfils_g['lats'], perfils_g['lons'], instantania['parametres'][param_opcions[param_label]][:, hora], param_opcions[param_label], hora, marca=(poble_sel, lat_sel, lon_sel)))
+            else:
+                st.error("No s'han pogut obtenir els perfils de la graella per a aquesta hora.")
+    elif selected_tab == tab_list[10]:
+        mode_comparativa = st.radio("Comparar:", ["Hores", "Localitats"], horizontal=True)
+        if mode_comparativa == "Hores":
+            hores_sel = st.multiselect("Hores a comparar:", OPCIONS_HORES, default=[OPCIONS_HORES[h] for h in sorted({hora, min(hora + 3, 23), min(hora + 6, 23)})])
+            perfils_sel = avis_api(obtener_perfils_localitat, lat_sel, lon_sel, dia)
+            parelles, etiquetes = [(perfils_sel, int(h[:2])) for h in hores_sel], hores_sel
+        else:
+            pobles_comp = st.multiselect("Localitats a comparar:", pobles_data.noms, default=[poble_sel])
+            # Si el lot ha fallat ja s'ha avisat: no es torna a provar localitat per localitat
+            if not instantania and avis_api(obtener_sondeigs_lot, [(pobles_data[nom]['lat'], pobles_data[nom]['lon']) for nom in pobles_comp], dia) is None: pobles_comp = []
+            parelles, etiquetes = [(avis_api(obtener_perfils_localitat, pobles_data[nom]['lat'], pobles_data[nom]['lon'], dia), hora) for nom in pobles_comp], pobles_comp
+        valides = [i for i, (dades, _) in enumerate(parelles) if dades is not None]
+        if valides:
+            with st.spinner("Comparant sondeigs..."):
+                parelles, etiquetes = [parelles[i] for i in valides], [etiquetes[i] for i in valides]
+                p_c, T_c, Td_c, u_c, v_c, h_c = apilar_perfils(parelles)
+                lot_c = calcular_parametres_lot(p_c, T_c, Td_c, u_c, v_c, h_c)
+                with np.errstate(invalid='ignore'):
+                    parcela_c = perfil_parcela_lot(p_c, p_c[:, 0], T_c[:, 0] + 273.15, Td_c[:, 0] + 273.15)[0] - 273.15
+                col_a, col_b = st.columns([3, 2])
+                with col_a: st.image(crear_skewt_comparatiu(p_c, T_c, Td_c, parcela_c, u_c, v_c, etiquetes))
+                with col_b: st.pyplot(crear_hodograf_comparatiu(u_c, v_c, h_c, etiquetes))
+                taula_valors, taula_deltes = taules_comparativa(lot_c, etiquetes)
+                st.markdown("**Paràmetres**"); st.dataframe(taula_valors.round(1))
+                st.markdown(f"**Diferències respecte de {etiquetes[0]}**"); st.dataframe(taula_deltes.round(1))
+        else:
+            st.info("Selecciona almenys un sondeig amb dades per comparar.")
+    elif selected_tab == tab_list[11]:
+        arxiu = obtenir_arxiu_climatologic(); arxiu.recarregar()
+        st.caption(f"{len(arxiu)} sondeigs arxivats · {len(arxiu.runs)} passades · {len(arxiu.pobles)} localitats")
+        opcions_pobles = ["Totes"] + sorted(arxiu.pobles)
+        col_a, col_b, col_c = st.columns([2, 1, 1])
+        with col_a: poble_clim = st.selectbox("Localitat:", opcions_pobles, index=opcions_pobles.index(poble_sel) if poble_sel in opcions_pobles else 0)
+        with col_b: des_de = st.date_input("Des de:", value=None)
+        with col_c: fins_a = st.date_input("Fins a:", value=None)
+        condicions, opcions_param = [], ["—"] + list(UNITATS_PARAMETRES)
+        for i, (param_defecte, llindar_defecte) in enumerate([('CAPE_Utilitzable', 1500.0), ('Shear_0-6km', 18.0), ("—", 0.0)]):
+            col_p, col_o, col_v = st.columns([3, 1, 2])
+            param_clim = col_p.selectbox("Paràmetre", opcions_param, index=opcions_param.index(param_defecte), key=f"clim_param_{i}", label_visibility="collapsed")
+            operador = col_o.selectbox("Operador", list(OPERADORS_CONSULTA), key=f"clim_op_{i}", label_visibility="collapsed")
+            llindar = col_v.number_input("Llindar", value=llindar_defecte, key=f"clim_llindar_{i}", label_visibility="collapsed")
+            if param_clim != "—": condicions.append((param_clim, operador, llindar))
+        per_dies = st.checkbox("Agrupa per dies (valor màxim del dia)", value=True)
+        t0 = time.perf_counter()
+        files_clim = arxiu.consultar(poble=None if poble_clim == "Totes" else poble_clim, condicions=condicions,
+                                     des_de=segons_utc(datetime.combine(des_de, datetime.min.time())) if des_de else None,
+                                     fins_a=segons_utc(datetime.combine(fins_a, datetime.max.time().replace(microsecond=0))) if fins_a else None)
+        ms_consulta = (time.perf_counter() - t0) * 1000
+        taula_clim = arxiu.taula(files_clim)
+        if per_dies and len(taula_clim):
+            columnes_param = [c for c in taula_clim.columns if c.split(' (')[0] in UNITATS_PARAMETRES]
+            taula_clim = taula_clim.assign(Dia=taula_clim['Vàlid'].dt.date).groupby(['Localitat', 'Dia']).agg({'Vàlid': 'count', **{c: 'max' for c in columnes_param}}).rename(columns={'Vàlid': 'Hores'}).reset_index()
+        st.caption(f"{len(taula_clim)} {'dies' if per_dies else 'sondeigs'} trobats en {ms_consulta:.1f} ms")
+        st.dataframe(taula_clim.round(1), hide_index=True)
+        if st.button("Importar l'arxiu de sondeigs de text"):
+            with st.spinner("Important sondeigs..."): st.success(f"{arxivar_sondeigs_text(arxiu)} sondeigs nous afegits a l'arxiu.")
+    elif selected_tab == tab_list[12]:
+        # Els models globals arriben més enllà de l'horitzó d'AROME: aquí el dia es tria a part
+        col_a, col_b = st.columns([2, 3])
+        with col_a: models_sel = st.multiselect("Models:", list(MODELS_SONDEIG), default=list(MODELS_SONDEIG))
+        with col_b: dia_mm = st.radio("Dia:", range(max(HORITZO_DIES.values())), index=dia, format_func=etiqueta_dia, horizontal=True, key='dia_multimodel')
+        fora_horitzo = [nom for nom in models_sel if dia_mm >= HORITZO_DIES[MODELS_SONDEIG[nom]]]
+        if fora_horitzo: st.caption(f"Fora de l'horitzó el {etiqueta_dia(dia_mm)}: {', '.join(fora_horitzo)}")
+        if models_sel:
+            with st.spinner("Descarregant els models en paral·lel..."):
+                t0 = time.perf_counter(); perfils_mm = obtener_perfils_multimodel(lat_sel, lon_sel, models_sel, dia_mm); s_baixada = time.perf_counter() - t0
+                t0 = time.perf_counter(); models_ok, lot_mm = parametres_multimodel(perfils_mm); ms_calcul = (time.perf_counter() - t0) * 1000
+            st.caption(f"{len(models_ok)} de {len(models_sel)} models en {s_baixada:.1f} s · paràmetres de {len(models_ok)}×{next(iter(lot_mm.values())).shape[1] if lot_mm else 0} perfils en {ms_calcul:.0f} ms")
+            if models_ok:
+                lot_hora = {k: val[:, hora] for k, val in lot_mm.items()}
+                text_c, color_c, avisos_mm, coincidents = avis_consens(lot_hora)
+                st.markdown(f'<div class="avis-box" style="border-color: {color_c}; background-color: {color_c}20;">Consens ({coincidents} de {len(models_ok)} models): {text_c}</div>', unsafe_allow_html=True)
+                taula_mm, dispersio_mm = taula_dispersio(models_ok, lot_hora)
+                st.markdown(f"**Paràmetres per model ({etiqueta_dia(dia_mm)}, {hora}:00h)**"); st.dataframe(taula_mm.assign(Avís=[t.split(':')[0] for t, _ in avisos_mm]).round(1))
+                st.markdown("**Dispersió entre models**"); st.dataframe(dispersio_mm.round(1))
+                param_mm = st.selectbox("Evolució diària de:", PARAMETRES_DISPERSIO)
+                st.line_chart(pd.DataFrame(lot_mm[param_mm].T, columns=models_ok))
+            else:
+                st.error("No s'ha pogut obtenir cap dels models seleccionats per a aquesta localitat.")
+    elif selected_tab == tab_list[13]:
+        t0 = time.perf_counter(); noms_r, matrius_r, avisos_r = avis_api(resum_regional, instantania, dia, buit=([], {}, np.empty((0, 24), dtype=int))); ms_resum = (time.perf_counter() - t0) * 1000
+        if len(noms_r):
+            vista_r = st.radio("Mostra:", [f"Hora seleccionada ({hora:02d}:00h)", "Màxim del dia"], horizontal=True)
+            nivells_r = avisos_r[:, hora] if vista_r != "Màxim del dia" else avisos_r.max(axis=1)
+            for col, (etiqueta, rang) in zip(st.columns(4), [("Sense risc", (0, 2)), ("Risc baix", (3, 3)), ("Precaució", (4, 4)), ("Avís o risc alt", (5, 6))]):
+                col.metric(etiqueta, int(((nivells_r >= rang[0]) & (nivells_r <= rang[1])).sum()))
+            st.pyplot(crear_mapa_avisos(noms_r, nivells_r, f"Avisos a Catalunya · {vista_r}"))
+            maxims_r = avisos_r.max(axis=1)
+            files_r = []
+            for i in np.argsort(-maxims_r, kind='stable'):
+                if maxims_r[i] < 4: break
+                _, inici, fi = finestra_risc(avisos_r[i])
+                files_r.append({'Localitat': noms_r[i], 'Avís màxim': NOMS_CURTS_AVISOS[maxims_r[i]], 'Finestra': f"{inici:02d}–{fi:02d}h",
+                                'CAPE Utilitzable màx (J/kg)': np.nanmax(matrius_r['CAPE_Utilitzable'][i]), 'Shear 0-6km màx (m/s)': np.nanmax(matrius_r['Shear_0-6km'][i]), 'SRH 0-1km màx (m²/s²)': np.nanmax(matrius_r['SRH_0-1km'][i])})
+            if files_r: st.dataframe(pd.DataFrame(files_r).round(0), hide_index=True)
+            else: st.success(f"Cap localitat arriba al nivell de precaució ({etiqueta_dia(dia)}).")
+            st.caption(f"{len(noms_r)} localitats × {avisos_r.shape[1]} hores resumides en {ms_resum:.0f} ms")
+        else:
+            st.error("No s'han pogut obtenir les dades de les localitats.")
+    elif selected_tab == tab_list[14]:
+        t0 = time.perf_counter(); noms_n, matrius_n = avis_api(precipitacio_regional, instantania, dia, buit=([], {})); ms_neu = (time.perf_counter() - t0) * 1000
+        if len(noms_n):
+            cota_n, tipus_n = matrius_n['Cota_Neu'], matrius_n['Tipus_Precipitacio']
+            vista_n = st.radio("Mostra:", [f"Hora seleccionada ({hora:02d}:00h)", "Mínim del dia"], horizontal=True, key='vista_cota_neu')
+            # El mínim del dia es mostra amb el tipus de l'hora en què s'assoleix
+            hores_n = np.full(len(noms_n), hora) if vista_n != "Mínim del dia" else np.argmin(np.where(np.isfinite(cota_n), cota_n, np.inf), axis=1)
+            files_n = np.arange(len(noms_n)); cota_v, tipus_v = cota_n[files_n, hores_n], tipus_n[files_n, hores_n]
+            for col, (codi, (nom_tipus, _, _)) in zip(st.columns(len(TIPUS_PRECIPITACIO)), enumerate(TIPUS_PRECIPITACIO)):
+                col.metric(nom_tipus, int((tipus_v == codi).sum()))
+            st.pyplot(crear_mapa_cota_neu(noms_n, cota_v, tipus_v, f"Cota de neu · {etiqueta_dia(dia)} · {vista_n}"))
+            st.pyplot(crear_cronologia_neu(matrius_n, hora, noms_n.index(poble_sel) if poble_sel in noms_n else None, poble_sel))
+            hivernals = np.isin(tipus_n, [AIGUANEU, NEU, GRESOL, PLUJA_GELANT])
+            files_t = []
+            for i in np.argsort(np.nanmin(np.where(np.isfinite(cota_n), cota_n, np.inf), axis=1), kind='stable'):
+                if not hivernals[i].any(): continue
+                h_min = int(np.argmin(np.where(np.isfinite(cota_n[i]), cota_n[i], np.inf)))
+                files_t.append({'Localitat': noms_n[i], 'Cota mínima (m)': cota_n[i, h_min], 'Hora': f"{h_min:02d}h", 'Tipus': TIPUS_PRECIPITACIO[int(tipus_n[i, h_min])][0],
+                                'Hores amb neu': int((tipus_n[i] == NEU).sum()), 'Hores gelants': int(np.isin(tipus_n[i], [GRESOL, PLUJA_GELANT]).sum()), 'Nas càlid màx (°C)': np.nanmax(np.append(matrius_n['Nas_Calid_Tmax'][i], -np.inf))})
+            if files_t: st.dataframe(pd.DataFrame(files_t).replace(-np.inf, np.nan).round(1), hide_index=True)
+            else: st.success(f"Cap localitat amb neu, aiguaneu ni precipitació gelant a terra ({etiqueta_dia(dia)}).")
+            st.caption(f"{len(noms_n)} localitats × {cota_n.shape[1]} hores en {ms_neu:.0f} ms · tipus de precipitació si n'hi ha (àrees de Bourgouin) · cota de neu = isozero de bulb humit − {FUSIO_COTA_NEU:.0f} m")
+        else:
+            st.error("No s'han pogut obtenir les dades de les localitats.")
+    elif selected_tab == tab_list[15]:
+        arxiu = obtenir_arxiu_climatologic(); arxiu.recarregar()
+        if not (arxiu.columnes['font'] == FONT_OBSERVACIO).any():
+            with st.spinner("Important l'arxiu de sondeigs de text..."): arxivar_sondeigs_text(arxiu)
+        opcions_verif = sorted(nom for nom in arxiu.pobles if nom != "Arxiu de text")
+        col_a, col_b = st.columns([2, 2])
+        with col_a: poble_verif = st.selectbox("Previsió AROME de:", opcions_verif, index=opcions_verif.index(poble_sel) if poble_sel in opcions_verif else 0) if opcions_verif else None
+        with col_b: abast_verif = st.slider("Abast màxim (h):", 6, 72, 48, step=6)
+        t0 = time.perf_counter(); verif = verificar_previsions(arxiu, poble_verif, abast_verif) if poble_verif else None; ms_verif = (time.perf_counter() - t0) * 1000
+        if verif and verif['parells']:
+            for col, (etiqueta, valor) in zip(st.columns(3), [("Parells", verif['parells']), ("Sondeigs observats", verif['observats']), ("Passades AROME", verif['passades'])]): col.metric(etiqueta, valor)
+            st.pyplot(crear_grafic_verificacio(verif['nivells']))
+            st.markdown("**Biaix i RMSE per nivell** (previsió − observació)"); st.dataframe(verif['nivells'].round(2), hide_index=True)
+            st.markdown("**Paràmetres derivats**"); st.dataframe(verif['parametres'].round(2), hide_index=True)
+            st.markdown("**Per tram d'abast**"); st.dataframe(verif['abast'].round(2), hide_index=True)
+        else:
+            st.info(f"Cap parell: l'arxiu no té previsions AROME{f' ({poble_verif})' if poble_verif else ''} per a les hores vàlides dels sondeigs de text.")
+        st.caption(f"Observació: sondeigs de text de l'arxiu ({int((arxiu.columnes['font'] == FONT_OBSERVACIO).sum())}) · graella comuna de {len(GRAELLA_CLIMATOLOGIA)} nivells · verificació en {ms_verif:.0f} ms")
+    st.caption(f"⏱️ {'Pàgina completa' if completa else 'Només la pestanya'}: {(time.perf_counter() - t_inici) * 1000:.0f} ms")
+
+def main():
+    st.set_page_config(layout="wide", page_title="Tempestes.cat")
+    st.session_state['inici_execucio'] = time.perf_counter()
+    st.markdown("""
 <style>
 .main-title { font-size: 3.5em; font-weight: bold; text-align: center; margin-bottom: -10px; color: #FFFFFF; }
 .subtitle { font-size: 1.2em; text-align: center; color: #A0A0A0; margin-bottom: 25px; }
 .chat-bubble { background-color:#262D31; border-radius:15px; padding:12px 18px; margin-bottom:10px; max-width:95%; border:1px solid rgba(255,255,255,0.1); }
 .avis-box { padding: 15px; border-radius: 10px; border: 2px solid; margin-bottom: 20px; text-align: center; font-size: 1.1em; font-weight: bold; }
 .update-info { text-align: center; color: gray; font-style: italic; margin-top: -15px; margin-bottom: 20px; }
+.metric-container { border: 1px solid rgba(255,255,255,0.1); border-radius: 10px; padding: 10px; margin-bottom: 10px; }
 </style>
 """, unsafe_allow_html=True)
 
-st.markdown('<p class="main-title">⚡ Tempestes.cat</p>', unsafe_allow_html=True)
-st.markdown('<p class="subtitle">Eina d\'Anàlisi i Previsió de Fenòmens Severs a Catalunya</p>', unsafe_allow_html=True)
+    st.markdown('<p class="main-title">⚡ Tempestes.cat</p>', unsafe_allow_html=True)
+    st.markdown('<p class="subtitle">Eina d\'Anàlisi i Previsió de Fenòmens Severs a Catalunya</p>', unsafe_allow_html=True)
 
-col1, col2 = st.columns(2)
-with col1:
-    try:
-        tz = pytz.timezone('Europe/Madrid')
-        now_local = datetime.now(tz)
-        default_hour_index = now_local.hour
-    except:
-        default_hour_index = 12 
-        
-    hour_options = [f"{h:02d}:00h" for h in range(24)]
-    hora_sel_str = st.radio("Hora del pronòstic (Local):", hour_options, index=default_hour_index, horizontal=True)
-    hora = int(hora_sel_str.split(':')[0])
+    col1, col2 = st.columns(2)
+    with col1:
+        try:
+            tz = pytz.timezone('Europe/Madrid')
+            now_local = datetime.now(tz)
+            default_hour_index = now_local.hour
+        except:
+            default_hour_index = 12 
 
-with col2:
-    p_levels_all = [1000, 925, 850, 700, 600, 500, 400, 300, 250, 200, 150, 100]
-    nivell_global = st.selectbox("Nivell d'anàlisi de vents:", p_levels_all, index=p_levels_all.index(850))
+        # Hores vàlides de tot l'horitzó d'AROME: primer el dia i després l'hora local d'aquell dia
+        dia = st.radio("Dia del pronòstic:", range(HORITZO_DIES['arome_france']), format_func=etiqueta_dia, horizontal=True)
+        hora_sel_str = st.radio("Hora del pronòstic (Local):", OPCIONS_HORES, index=default_hour_index, horizontal=True)
+        hora = int(hora_sel_str.split(':')[0])
 
-st.markdown(f'<p class="update-info">🕒 {get_next_arome_update_time()}</p>', unsafe_allow_html=True)
+    with col2:
+        p_levels_all = P_LEVELS_AROME
+        nivell_global = st.selectbox("Nivell d'anàlisi de vents:", p_levels_all, index=p_levels_all.index(850))
 
-with st.spinner(f"Analitzant convergències a {nivell_global}hPa per a les {hora}:00h..."):
-    conv_threshold = -5.5
-    localitats_convergencia = encontrar_localitats_con_convergencia(hora, nivell_global, pobles_data, conv_threshold)
+    with st.spinner("Carregant la darrera passada del model AROME..."):
+        magatzem = obtenir_magatzem_passades()
+        magatzem.actualitzar(get_arome_run_publicada())
+        instantania = magatzem.instantania()
+    if dia > 0:
+        instantania = magatzem.instantania(dia)
+        if magatzem.carregant_dia(dia):
+            st.info(f"El pronòstic de {etiqueta_dia(dia)} es prepara en segon pla; mentrestant les dades es demanen per localitat.")
+            esperar_fragment_dia(magatzem, dia)
+        elif (error_dia := magatzem.incidencia_dia(dia)):
+            st.warning(f"No s'ha pogut carregar {etiqueta_dia(dia)} de la passada {error_dia[0]} ({error_dia[1]}); les dades es demanen per localitat.")
+    # Només el dia consultat es descodifica i s'analitza aquí; la resta de l'horitzó es prepara en segon pla
+    magatzem.precarregar(d for d in range(HORITZO_DIES['arome_france']) if d != dia)
 
-opciones_display = []
-for nom_poble in sorted(pobles_data.keys()):
-    if nom_poble in localitats_convergencia:
-        opciones_display.append(f"📍 {nom_poble} (Convergència a les {hora}:00h)")
-    else:
-        opciones_display.append(nom_poble)
+    run_en_us = f" · Passada en ús: {instantania['run'][8:]}" if instantania else ""
+    st.markdown(f'<p class="update-info">🕒 {get_next_arome_update_time()}{run_en_us}</p>', unsafe_allow_html=True)
+    if instantania is None and magatzem.construint(): st.caption("La passada s'està preparant en segon pla; mentrestant les dades es demanen per localitat.")
 
-poble_sel_display = st.selectbox('Selecciona una localitat:', options=opciones_display)
-poble_sel = poble_sel_display.replace('📍 ', '').split(' (')[0]
-lat_sel, lon_sel = pobles_data[poble_sel]['lat'], pobles_data[poble_sel]['lon']
+    with st.sidebar.expander("🧮 Memòria cau"):
+        st.dataframe(pd.DataFrame(obtenir_gestor_cau().metriques()), hide_index=True)
+        n_pobles, n_celles = obtenir_planificador_celles().metriques(coordenades_pobles())
+        st.caption(f"Planificador: {n_pobles} localitats → {n_celles} cel·les del model")
+        incidencia_celles = obtenir_planificador_celles().incidencia()
+        if incidencia_celles: st.warning(f"No s'han pogut resoldre les cel·les del model ({incidencia_celles[0]}); es fan servir les coordenades de les localitats. Nou intent d'aquí a {incidencia_celles[1]:.0f} s.")
+        if instantania:
+            st.caption(f"Instantània de la passada {instantania['run']} ({etiqueta_dia(dia)}): {mida_aproximada(instantania) / 1e6:.1f} MB")
+            temps_indexs = {nom: ms + instantania['pobles']['temps_indexs'][nom] for nom, ms in instantania['temps_indexs'].items()}
+            st.caption("Índexs a l'última construcció (ms): " + " · ".join(f"{nom} {ms:.0f}" for nom, ms in temps_indexs.items()))
+        st.caption(f"Dies carregats: {', '.join(etiqueta_dia(d) for d in [0] + magatzem.dies_carregats())}")
+        error_construccio, error_arxiu, s_reintent = magatzem.incidencies()
+        if error_construccio:
+            servint = f"es continua servint la {instantania['run']}" if instantania else "les dades es demanen per localitat"
+            st.warning(f"La passada {error_construccio[0]} ha fallat ({error_construccio[1]}); {servint}. Nou intent d'aquí a {s_reintent / 60:.0f} min.")
+        if error_arxiu: st.warning(f"La passada {error_arxiu[0]} no s'ha pogut arxivar a la climatologia ({error_arxiu[1]}).")
 
-sondeo, p_levels = obtener_sondeo_atmosferico(lat_sel, lon_sel)
+    resolucio_vertical = st.sidebar.radio("Resolució vertical del sondeig:", list(RESOLUCIONS_VERTICALS.keys()), help="La resolució adaptativa afegeix nivells d'AROME a la capa límit i a l'entorn del LCL/LFC.")
+    motor_ascens = st.sidebar.radio("Motor d'ascens de la parcel·la:", list(MOTORS_ASCENS.keys()), help="La taula de pseudoadiabàtiques interpola ascensos precalculats en lloc d'integrar-los (Skew-T i anàlisi de parcel·les).")
+    motor_convergencia = st.sidebar.radio("Càlcul de convergència:", list(MOTORS_CONVERGENCIA.keys()), help="La malla nativa deriva el vent als 12×12 punts descarregats i interpola la divergència només a les localitats, sense passar per una malla cúbica de 100×100.")
+    analisi_parcelles = st.sidebar.checkbox("Anàlisi de parcel·les (SB, ML, MU)", help="Calcula CAPE, CIN, LFC i EL de la parcel·la de superfície, de la capa barrejada (100 hPa) i de la més inestable en una sola passada.")
 
-if sondeo:
-    data_is_valid = False
-    with st.spinner(f"Processant dades per a {poble_sel}..."):
-        hourly = sondeo.Hourly(); T_s, Td_s, P_s = (hourly.Variables(i).ValuesAsNumpy()[hora] for i in range(3))
-        if np.isnan(P_s): st.error(f"Dades de pressió superficial no disponibles per les {hora}:00h.")
-        else:
-            s_idx, n_plvls = 3, len(p_levels); T_p, Td_p, Ws_p, Wd_p, H_p = ([hourly.Variables(s_idx + i*n_plvls + j).ValuesAsNumpy()[hora] for j in range(n_plvls)] for i in range(5))
-            def interpolate_sfc(sfc_val, p_sfc, p_api, d_api):
-                if np.isnan(sfc_val):
-                    valid_p = [p for p, t in zip(p_api, d_api) if not np.isnan(t)]; valid_d = [t for t in d_api if not np.isnan(t)]
-                    if len(valid_p) > 1: p_sorted, d_sorted = zip(*sorted(zip(valid_p, valid_d))); return np.interp(p_sfc, p_sorted, d_sorted)
-                return sfc_val
-            T_s = interpolate_sfc(T_s, P_s, p_levels, T_p); Td_s = interpolate_sfc(Td_s, P_s, p_levels, Td_p)
-            if not np.isnan(T_s) and not np.isnan(Td_s):
-                p_profile, T_profile, Td_profile, u_profile, v_profile, h_profile = [P_s], [T_s], [Td_s], [0.0], [0.0], [mpcalc.pressure_to_height_std(P_s*units.hPa).m]
-                for i, p_level in enumerate(p_levels):
-                    if p_level < P_s and not np.isnan(T_p[i]):
-                        p_profile.append(p_level); T_profile.append(T_p[i]); Td_profile.append(Td_p[i]); h_profile.append(H_p[i])
-                        u_comp, v_comp = mpcalc.wind_components(Ws_p[i]*units.knots, Wd_p[i]*units.degrees)
-                        u_profile.append(u_comp.to('m/s').m); v_profile.append(v_comp.to('m/s').m)
-                p = np.array(p_profile)*units.hPa; T = np.array(T_profile)*units.degC; Td = np.array(Td_profile)*units.degC
-                H = np.array(h_profile)*units.m; u = np.array(u_profile)*units.m/units.s; v = np.array(v_profile)*units.m/units.s
-                zero_iso_h_agl = None
-                try:
-                    T_c = T.to('degC').m; H_m = H.to('m').m
-                    zero_cross_indices = np.where(np.diff(np.sign(T_c)))[0]
-                    if zero_cross_indices.size > 0:
-                        idx = zero_cross_indices[0]
-                        h_zero_iso_msl = np.interp(0, [T_c[idx+1], T_c[idx]], [H_m[idx+1], H_m[idx]])
-                        zero_iso_h_agl = (h_zero_iso_msl - H_m[0]) * units.m
-                except Exception: pass
-                parametros = calculate_parameters(p, T, Td, u, v, H); data_is_valid = True
-    if data_is_valid:
-        avis_text, avis_color = generar_avis_localitat(parametros)
-        st.markdown(f'<div class="avis-box" style="border-color: {avis_color}; background-color: {avis_color}20;">{avis_text}</div>', unsafe_allow_html=True)
-
-        tab_list = ["🗨️ Anàlisi Detallada", "📊 Paràmetres", "🗺️ Mapes de Vents", "🔄 Hodògraf", "🏔️ Sondeig", "🗺️ Orografia", "☁️ Visualització"]
-        selected_tab = st.radio("Navegació:", tab_list, index=0, horizontal=True)
-        
-        if selected_tab == tab_list[0]:
-            conversa = generar_analisi_detallada(parametros)
-            for msg in conversa:
-                st.markdown(f'<div class="chat-bubble">🧑‍🔬 {msg}</div>', unsafe_allow_html=True)
-        elif selected_tab == tab_list[1]:
-            st.subheader("Paràmetres Clau"); display_metrics(parametros)
-        elif selected_tab == tab_list[2]:
-            st.subheader(f"Vents i Convergència a {nivell_global}hPa")
-            with st.spinner("Generant mapa de vents... 🌬️💨"):
-                lats_map, lons_map, speeds_map, dirs_map = obtener_dades_mapa_vents(hora, nivell_global)
-                if lats_map and len(lats_map) > 4:
-                    speeds_ms = (np.array(speeds_map) * 1000 / 3600) * units('m/s')
-                    dirs_deg = np.array(dirs_map) * units.degrees
-                    u_map, v_map = mpcalc.wind_components(speeds_ms, dirs_deg)
-                    fig_vents = crear_mapa_vents(lats_map, lons_map, u_map, v_map, pobles_data, nivell_global)
-                    st.pyplot(fig_vents)
-                else:
-                    st.error("No s'han pogut obtenir les dades per al mapa de vents o no hi ha prous punts de dades per a aquest nivell i hora.")
-        elif selected_tab == tab_list[3]:
-            st.subheader("Hodògraf (0-10 km)"); st.pyplot(crear_hodograf(p, u, v, H))
-        elif selected_tab == tab_list[4]:
-            st.subheader(f"Sondeig per a {poble_sel} ({hora}:00h Local)"); st.pyplot(crear_skewt(p, T, Td, u, v))
-        elif selected_tab == tab_list[5]:
-            st.subheader("Potencial d'Activació per Orografia")
-            fig_oro = crear_grafic_orografia(parametros, zero_iso_h_agl)
-            if fig_oro: st.pyplot(fig_oro)
-            else: st.info("No hi ha LCL o LFC, per tant no es pot calcular el potencial d'activació orogràfica.")
-        elif selected_tab == tab_list[6]:
-            with st.spinner("Dibuixant la possible estructura del núvol... ☁️⚡️"):
-                st.subheader("Visualització del Núvol")
-                is_conv_active = poble_sel in localitats_convergencia
-                fig_nuvol = crear_grafic_nuvol(parametros, H, u, v, is_convergence_active=is_conv_active)
-                if fig_nuvol: st.pyplot(fig_nuvol)
-                else: st.info("No hi ha LCL o EL, per tant no es pot visualitzar l'estructura del núvol.")
-    else:
-        st.warning(f"No s'han pogut calcular els paràmetres per a les {hora}:00h. Pot ser que el model no tingui dades completes per a aquest punt i hora. Prova amb una altra hora o localitat.")
-else:
-    st.error("No s'han pogut obtenir dades. Pot ser que la localitat estigui fora de la cobertura del model AROME.")
+    # Tot es llança de cop amb els valors dels controls (la localitat i la pestanya són a la sessió abans de dibuixar-les)
+    poble_sel = st.session_state.get('poble_sel', pobles_data.noms[0])
+    if poble_sel not in pobles_data: poble_sel = st.session_state['poble_sel'] = pobles_data.noms[0]
+    lat_sel, lon_sel = pobles_data[poble_sel]['lat'], pobles_data[poble_sel]['lon']
+    pestanya = st.session_state.get('pestanya', PESTANYES[0])
+    run_pagina = instantania['run'] if instantania else None
+    futur_convergencia = en_segon_pla('convergencia', (run_pagina, dia, hora, nivell_global, motor_convergencia), localitats_en_convergencia, instantania, hora, nivell_global, motor_convergencia, dia)
+    clau_sondeig = (run_pagina, dia, poble_sel, resolucio_vertical, hora)
+    futur_sondeig = en_segon_pla('sondeig', clau_sondeig, sondeig_punt, lat_sel, lon_sel, RESOLUCIONS_VERTICALS[resolucio_vertical], hora, dia)
+    if pestanya == PESTANYES[3]: en_segon_pla('figura_vents', (run_pagina, dia, hora, nivell_global), png_mapa_vents, instantania, hora, nivell_global, dia)
+
+    lloc_selector, lloc_avis, lloc_resum = st.empty(), st.empty(), st.empty()
+    lloc_selector.caption(f"Analitzant convergències a {nivell_global}hPa per a les {hora}:00h...")
+    lloc_avis.caption(f"Processant dades per a {poble_sel}...")
+    for futur in as_completed([futur_sondeig, futur_convergencia]):
+        if futur is futur_convergencia:
+            # Opcions estables (la tupla del catàleg) i etiquetes amb 📍 només per a les localitats en convergència
+            localitats_convergencia = futur.result()
+            etiquetes = {nom: f"📍 {nom} (Convergència a les {hora}:00h)" for nom in localitats_convergencia}
+            lloc_selector.selectbox('Selecciona una localitat:', pobles_data.noms, key='poble_sel', format_func=lambda nom: etiquetes.get(nom, nom))
+            continue
+        try: sondeig = futur.result()
+        except ErrorOpenMeteo as e:
+            sondeig = None; lloc_avis.error(f"Error a l'API d'Open-Meteo: {e}"); continue
+        if sondeig is None:
+            lloc_avis.error("No s'han pogut obtenir dades. Pot ser que la localitat estigui fora de la cobertura del model AROME."); continue
+        if 'parametros' not in sondeig:
+            with lloc_avis.container():
+                if sondeig['sense_pressio']: st.error(f"Dades de pressió superficial no disponibles per les {hora}:00h.")
+                st.warning(f"No s'han pogut calcular els paràmetres per a les {hora}:00h. Pot ser que el model no tingui dades completes per a aquest punt i hora. Prova amb una altra hora o localitat.")
+            continue
+        avis_text, avis_color = generar_avis_localitat(sondeig['parametros'])
+        lloc_avis.markdown(f'<div class="avis-box" style="border-color: {avis_color}; background-color: {avis_color}20;">{avis_text}</div>', unsafe_allow_html=True)
+        with lloc_resum.container(): mostrar_targetes(sondeig['parametros'], METRIQUES_RESUM)
+        if pestanya == PESTANYES[5]: skewt_en_segon_pla(sondeig, clau_sondeig, motor_ascens)
+
+    if sondeig is not None and 'parametros' in sondeig:
+        mostrar_pestanyes(sondeig, clau_sondeig, poble_sel, dia, hora, nivell_global, instantania, localitats_convergencia, analisi_parcelles, motor_ascens)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# --- BANCS DE PROVES ---
+# Proves de rendiment i precisió de l'aplicació, fora de la pàgina: python -m bancs [text del nom]. Les
+# comprovacions de correcció que abans feien els bancs (MetPy, avisos escalars, SDK) són a tests/.
+from bancs.motor import banc_resolucio_vertical, banc_parcelles, banc_indexs, banc_taula_pseudoadiabatiques, banc_convergencia, banc_cota_neu
+from bancs.dades import banc_descodificacio, banc_representacio_compacta, banc_cataleg, banc_horitzo
+from bancs.figures import banc_fons_skewt, banc_animacio
+from bancs.arxiu import banc_arxiu_climatologic, banc_verificacio, banc_analegs
+
+BANCS_DE_PROVES = {
+    "Resolució vertical: precisió vs. bytes": banc_resolucio_vertical,
+    "Descodificació de respostes": banc_descodificacio,
+    "Parcel·les SB/ML/MU: cost d'una passada": banc_parcelles,
+    "Skew-T: fons estàtic vs. figura nova": banc_fons_skewt,
+    "Representació compacta: memòria i pickle": banc_representacio_compacta,
+    "Índexs de temps sever: cost per família": banc_indexs,
+    "Taula de pseudoadiabàtiques: precisió i escombrada": banc_taula_pseudoadiabatiques,
+    "Convergència: malla nativa vs. cúbica": banc_convergencia,
+    "Catàleg de localitats: cost per pàgina × 10": banc_cataleg,
+    "Arxiu climatològic: ingesta i consultes": banc_arxiu_climatologic,
+    "Verificació: parells i errors per nivell": banc_verificacio,
+    "Anàlegs: KD-tree vs. força bruta": banc_analegs,
+    "Cota de neu: lot vectoritzat vs. perfil a perfil": banc_cota_neu,
+    "Horitzó per dies: fragment vs. tot d'entrada": banc_horitzo,
+    "Animació de convergència: fotogrames i grup de processos": banc_animacio,
+}
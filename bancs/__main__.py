@@ -0,0 +1,20 @@
+# --- EXECUCIÓ DES DE LA LÍNIA D'ORDRES ---
+# python -m bancs                     tots els bancs
+# python -m bancs neu arxiu           només els que contenen algun dels textos al nom
+# python -m bancs --passada ...       carrega abans la darrera passada AROME (els bancs fan servir la instantània)
+import sys
+import pandas as pd
+from app_interactiva import get_arome_run_publicada, obtenir_magatzem_passades
+from bancs import BANCS_DE_PROVES
+
+def main(arguments):
+    if '--passada' in arguments:
+        obtenir_magatzem_passades().actualitzar(get_arome_run_publicada()); arguments = [a for a in arguments if a != '--passada']
+    seleccio = [nom for nom in BANCS_DE_PROVES if not arguments or any(a.lower() in nom.lower() for a in arguments)]
+    if not seleccio: sys.exit(f"Cap banc coincideix amb {' '.join(arguments)}. Disponibles:\n  " + "\n  ".join(BANCS_DE_PROVES))
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.max_colwidth', 80):
+        for nom in seleccio:
+            print(f"\n=== {nom} ===\n{BANCS_DE_PROVES[nom]().round(2).to_string(index=False)}", flush=True)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,90 @@
+# --- BANCS DE L'ARXIU CLIMATOLÒGIC ---
+# Ingesta i consultes de l'arxiu, verificació i cerca d'anàlegs sobre arxius sintètics temporals.
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from app_interactiva import (
+    ArxiuClimatologic, COMPONENTS_ANALEGS, FONTS_CLIMATOLOGIA, FONT_OBSERVACIO, GRAELLA_CLIMATOLOGIA, IndexAnalegs,
+    UNITATS_PARAMETRES, calcular_parametres_lot, caracteristiques_perfils, carregar_arxiu_sondeigs, columnes_arxiu,
+    perfils_a_graella, pobles_data, segons_utc, verificar_previsions)
+
+def banc_arxiu_climatologic():
+    # Tres anys sintètics (totes les localitats, totes les hores) a partir dels paràmetres de l'arxiu de text
+    ref = calcular_parametres_lot(*columnes_arxiu(carregar_arxiu_sondeigs()))
+    rng = np.random.default_rng(0); noms = list(pobles_data.noms)
+    inici = segons_utc(datetime(2023, 1, 1))
+    files = []
+    with tempfile.TemporaryDirectory() as directori:
+        arxiu = ArxiuClimatologic(directori)
+        t0 = time.perf_counter()
+        for dia in range(0, 3 * 365, 30):
+            n_hores = min(30, 3 * 365 - dia) * 24
+            valid = np.repeat(inici + 3600 * (dia * 24 + np.arange(n_hores)), len(noms))
+            mostra = rng.integers(0, len(ref['CAPE_Brut']), len(valid))
+            arxiu.afegir(noms * n_hores, valid, valid - 6 * 3600, FONTS_CLIMATOLOGIA['AROME'],
+                         {k: val[mostra] * rng.lognormal(0, 0.5, len(valid)) for k, val in ref.items()})
+        files.append({'Operació': f"Ingesta de {len(arxiu)} files en {len(arxiu.segments)} segments", 'Temps (ms)': (time.perf_counter() - t0) * 1000, 'Files': len(arxiu)})
+        t0 = time.perf_counter(); ArxiuClimatologic(directori)
+        files.append({'Operació': "Obertura en fred (lectura de columnes i índexs)", 'Temps (ms)': (time.perf_counter() - t0) * 1000, 'Files': len(arxiu)})
+        condicions = [('CAPE_Utilitzable', '>', 1500), ('Shear_0-6km', '>', 18)]
+        for nom, kwargs in [("Lleida: CAPE > 1500 i Shear > 18", {'poble': 'Lleida', 'condicions': condicions}),
+                            ("Lleida, juliol de 2024: CAPE > 1500", {'poble': 'Lleida', 'des_de': segons_utc(datetime(2024, 7, 1)), 'fins_a': segons_utc(datetime(2024, 7, 31, 23)), 'condicions': condicions[:1]}),
+                            ("Totes les localitats: CAPE > 1500 i Shear > 18", {'condicions': condicions})]:
+            t0 = time.perf_counter()
+            for _ in range(20): resultat = arxiu.consultar(**kwargs)
+            files.append({'Operació': nom, 'Temps (ms)': (time.perf_counter() - t0) * 1000 / 20, 'Files': len(resultat)})
+    return pd.DataFrame(files)
+
+def banc_verificacio():
+    # Arxius sintètics amb N sondeigs observats (els de text, remostrejats) i quatre passades per hora vàlida amb un
+    # biaix conegut (+0,5 °C a T, soroll d'1 °C): l'RMSE de T ha de sortir a prop de √1,25 ≈ 1,12 °C
+    sondeigs = carregar_arxiu_sondeigs()
+    columnes = columnes_arxiu(sondeigs); graella, ref = perfils_a_graella(*columnes), calcular_parametres_lot(*columnes)
+    rng = np.random.default_rng(0); inici = segons_utc(datetime(2024, 1, 1)); files = []
+    for n_obs in (250, 1000, 5000):
+        with tempfile.TemporaryDirectory() as directori:
+            arxiu = ArxiuClimatologic(directori)
+            mostra = rng.integers(0, len(sondeigs), n_obs); valid = inici + 3600 * np.arange(n_obs)
+            t0 = time.perf_counter()
+            arxiu.afegir(["Arxiu de text"] * n_obs, valid, valid, FONT_OBSERVACIO, {k: val[mostra] for k, val in ref.items()}, {var: val[mostra] for var, val in graella.items()})
+            for abast in (6, 18, 30, 42):
+                soroll = {var: val[mostra] + rng.normal(0.5 if var == 'T' else 0, 1, val[mostra].shape) for var, val in graella.items()}
+                arxiu.afegir(["Lleida"] * n_obs, valid, valid - abast * 3600, FONTS_CLIMATOLOGIA['AROME'], {k: val[mostra] * rng.lognormal(0, 0.2, n_obs) for k, val in ref.items()}, soroll)
+            ms_ingesta = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter(); resultat = verificar_previsions(arxiu, "Lleida"); ms = (time.perf_counter() - t0) * 1000
+            nivells = resultat['nivells']; pes = nivells['Parells'] / nivells['Parells'].sum()
+            files.append({'Parells': resultat['parells'], 'Nivells comparats': int(nivells['Parells'].sum()), 'Ingesta (ms)': ms_ingesta, 'Verificació (ms)': ms,
+                          'µs per parell': ms * 1000 / resultat['parells'], 'T biaix (°C)': (nivells['T biaix (°C)'] * pes).sum(), 'T RMSE (°C)': np.sqrt((nivells['T RMSE (°C)'] ** 2 * pes).sum())})
+    return pd.DataFrame(files)
+
+def banc_analegs():
+    # Arxiu sintètic: perfils de l'arxiu de text amb pertorbacions; referència = força bruta sobre el vector complet
+    base = perfils_a_graella(*columnes_arxiu(carregar_arxiu_sondeigs()))
+    rng = np.random.default_rng(1); n = 50000
+    mostra = rng.integers(0, len(base['T']), n)
+    desplacament = rng.normal(0, 2, (n, 1))
+    perfils = {'T': base['T'][mostra] + desplacament + rng.normal(0, 0.7, (n, len(GRAELLA_CLIMATOLOGIA))),
+               'Td': base['Td'][mostra] + desplacament + rng.normal(0, 2.5, (n, len(GRAELLA_CLIMATOLOGIA))),
+               'u': base['u'][mostra] * rng.uniform(0.3, 1.7, (n, 1)) + rng.normal(0, 1.5, (n, len(GRAELLA_CLIMATOLOGIA))),
+               'v': base['v'][mostra] * rng.uniform(0.3, 1.7, (n, 1)) + rng.normal(0, 1.5, (n, len(GRAELLA_CLIMATOLOGIA)))}
+    consultes = {var: val[rng.integers(0, n, 50)] + rng.normal(0, 0.5, (50, len(GRAELLA_CLIMATOLOGIA))) for var, val in perfils.items()}
+    files = []
+    with tempfile.TemporaryDirectory() as directori:
+        arxiu = ArxiuClimatologic(directori)
+        arxiu.afegir(["Sintètic"] * n, 3600 * np.arange(n), 0, FONTS_CLIMATOLOGIA['AROME'], {k: np.full(n, np.nan) for k in UNITATS_PARAMETRES}, perfils)
+        index = IndexAnalegs()
+        t0 = time.perf_counter(); index.actualitzar(arxiu); ms_index = (time.perf_counter() - t0) * 1000
+        x_total = (caracteristiques_perfils(arxiu.perfils_files(np.arange(n))) - index.mitjana) / index.escala
+        x_consultes = (caracteristiques_perfils(consultes) - index.mitjana) / index.escala
+        t0 = time.perf_counter()
+        exactes = [np.argsort(((x_total - x) ** 2).sum(axis=1))[:10] for x in x_consultes]
+        ms_forca = (time.perf_counter() - t0) * 1000 / 50
+        t0 = time.perf_counter()
+        trobats = [index.cercar(arxiu, {var: val[i:i + 1] for var, val in consultes.items()}, 10)[0] for i in range(50)]
+        ms_arbre = (time.perf_counter() - t0) * 1000 / 50
+        encerts = np.mean([len(set(a.tolist()) & set(b.tolist())) / 10 for a, b in zip(exactes, trobats)])
+        files.append({'Mètode': "Força bruta (vector complet, numpy)", 'Construcció (ms)': 0.0, 'Consulta (ms)': ms_forca, 'Encerts top-10 (%)': 100.0})
+        files.append({'Mètode': f"PCA ({COMPONENTS_ANALEGS} components) + KD-tree, reordenat", 'Construcció (ms)': ms_index, 'Consulta (ms)': ms_arbre, 'Encerts top-10 (%)': 100 * encerts})
+    return pd.DataFrame(files).assign(Perfils=n)
@@ -0,0 +1,135 @@
+# --- BANCS DE DESCÀRREGA I REPRESENTACIÓ ---
+# Descodificació de respostes, representació compacta, catàleg de localitats i horitzó per dies.
+import os
+import pickle
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from metpy.units import units
+from app_interactiva import (
+    CatalegLocalitats, ConjuntParametres, HORITZO_DIES, HOURLY_SONDEIG, LATS_GRAELLA, LLINDAR_CONVERGENCIA,
+    LONS_GRAELLA, NOMS_PARAMETRES, P_LEVELS_AROME, PlanificadorCelles, Sondeig, UNITATS_PARAMETRES, actualitzar_conjunt,
+    calcular_localitats_convergencia, calcular_parametres_lot, carregar_arxiu_sondeigs, celles_de, columnes_arxiu,
+    coordenades_pobles, descodificar_perfils, mida_aproximada, muntar_columnes, obtenir_magatzem_passades,
+    parametres_columna, pobles_data, valors_respostes)
+from bancs.sintetics import camp_vents_analitic, llegir_respostes, resposta_sintetica, variables_horitzo
+
+def banc_descodificacio():
+    rng = np.random.default_rng(0); files = []
+    for nom, n_punts, n_vars in [("Sondeig (1 punt)", 1, len(HOURLY_SONDEIG)), ("Graella de vents (144 punts)", 144, 2), ("Graella de sondeigs (144 punts)", 144, len(HOURLY_SONDEIG))]:
+        valors = rng.normal(size=(n_punts, n_vars, 24)).astype(np.float32)
+        respostes = llegir_respostes(b''.join(resposta_sintetica(v) for v in valors))
+        sdk = lambda: np.stack([np.stack([r.Hourly().Variables(i).ValuesAsNumpy() for i in range(n_vars)]) for r in respostes])
+        directa = lambda: valors_respostes(respostes)
+        if not (np.array_equal(sdk(), valors) and np.array_equal(directa(), valors)): raise ValueError("La descodificació no coincideix")
+        fila = {'Resposta': nom, 'Variables': n_vars}
+        for etiqueta, funcio in [('SDK variable a variable (ms)', sdk), ('Recorregut únic (ms)', directa)]:
+            repeticions = max(5, 2000 // (n_punts * n_vars))
+            t0 = time.perf_counter()
+            for _ in range(repeticions): funcio()
+            fila[etiqueta] = (time.perf_counter() - t0) * 1000 / repeticions
+        fila['Acceleració (x)'] = fila['SDK variable a variable (ms)'] / fila['Recorregut únic (ms)']
+        fila['Còpies'] = "cap (vista sobre el buffer)" if np.shares_memory(directa(), np.frombuffer(respostes[0]._tab.Bytes, dtype=np.uint8)) else "una recollida"
+        files.append(fila)
+    return pd.DataFrame(files)
+
+def banc_representacio_compacta():
+    # Magatzem localitat × hora d'una passada sencera, amb la representació anterior (llistes convertides a
+    # quantitats float64 i un diccionari {'value', 'units'} per paràmetre) i amb Sondeig/ConjuntParametres
+    instantania = obtenir_magatzem_passades().instantania()
+    if instantania:
+        perfils = instantania['pobles']['perfils']; n_hores = perfils['sfc'].shape[-1]
+        columnes = [np.concatenate(c) for c in zip(*(muntar_columnes(perfils['sfc'], perfils['press'], P_LEVELS_AROME, h) for h in range(n_hores)))]
+        origen = f"passada {instantania['run']}"
+    else:
+        sondeigs = columnes_arxiu(carregar_arxiu_sondeigs()); n_hores = 24
+        columnes = [c[np.arange(len(pobles_data) * n_hores) % len(c)] for c in sondeigs[:6]]
+        origen = "sondeigs de l'arxiu repetits"
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'): lot = calcular_parametres_lot(*columnes)
+    unitats_perfil = (units.hPa, units.degC, units.degC, units('m/s'), units('m/s'), units.m)
+    def anterior(i):
+        ok = np.isfinite(columnes[0][i])
+        return {'perfil': tuple(np.array(c[i][ok].tolist()) * u for c, u in zip(columnes, unitats_perfil)),
+                'parametros': {k: {'value': float(val[i]), 'units': UNITATS_PARAMETRES[k]} for k, val in lot.items() if np.isfinite(val[i])}}
+    def compacta(i):
+        ok = np.isfinite(columnes[0][i])
+        return {'perfil': Sondeig(*(c[i][ok] for c in columnes)), 'parametros': parametres_columna(lot, i)}
+    files = []
+    for nom, construir in (("Anterior (quantitats float64 + dict de dicts)", anterior), ("Sondeig + ConjuntParametres (float32, __slots__)", compacta)):
+        t0 = time.perf_counter(); [construir(i) for i in range(len(columnes[0]))]; ms = (time.perf_counter() - t0) * 1000
+        tracemalloc.start(); magatzem = [construir(i) for i in range(len(columnes[0]))]; memoria = tracemalloc.get_traced_memory()[0]; tracemalloc.stop()
+        t0 = time.perf_counter(); serialitzat = pickle.dumps(magatzem, protocol=pickle.HIGHEST_PROTOCOL); pickle.loads(serialitzat)
+        files.append({'Representació': f"{nom}: {len(magatzem)} sondeigs ({origen})", 'Memòria (MB)': memoria / 1e6, 'Pickle (MB)': len(serialitzat) / 1e6,
+                      'Construcció (ms)': ms, 'Pickle + unpickle (ms)': (time.perf_counter() - t0) * 1000})
+    # Paràmetres de la instantània: una llista de diccionaris per hora + les matrius (cel·la, hora) vs. un sol conjunt
+    per_hora = {k: val.reshape(n_hores, -1) for k, val in lot.items()}
+    for nom, magatzem in (("Paràmetres per hora + matrius (float64)", [[{k: val[h].copy() for k, val in per_hora.items()} for h in range(n_hores)], {k: val.T.copy() for k, val in per_hora.items()}]),
+                          ("ConjuntParametres (cel·la, hora, paràmetre) float32", ConjuntParametres(NOMS_PARAMETRES, np.stack([per_hora[k].T for k in NOMS_PARAMETRES], axis=-1)))):
+        t0 = time.perf_counter(); serialitzat = pickle.dumps(magatzem, protocol=pickle.HIGHEST_PROTOCOL); pickle.loads(serialitzat)
+        files.append({'Representació': nom, 'Memòria (MB)': mida_aproximada(magatzem) / 1e6, 'Pickle (MB)': len(serialitzat) / 1e6, 'Pickle + unpickle (ms)': (time.perf_counter() - t0) * 1000})
+    for fila, ref in ((files[1], files[0]), (files[3], files[2])): fila['Reducció memòria (x)'] = ref['Memòria (MB)'] / fila['Memòria (MB)']
+    return pd.DataFrame(files)
+
+def banc_cataleg():
+    # Feina de cada pàgina que depèn del nombre de localitats, amb el catàleg actual i amb un de deu vegades més
+    # gran (les mateixes localitats desplaçades), com a diccionari recorregut en Python i com a catàleg en columnes
+    rng = np.random.default_rng(0)
+    lon_grid, lat_grid = np.meshgrid(LONS_GRAELLA, LATS_GRAELLA)
+    lats_g, lons_g = lat_grid.ravel().tolist(), lon_grid.ravel().tolist()
+    speeds, dirs, _ = camp_vents_analitic(rng, np.array(lats_g), np.array(lons_g))
+    grid_lat, grid_lon = np.linspace(min(lats_g), max(lats_g), 100), np.linspace(min(lons_g), max(lons_g), 100)
+    camp = rng.normal(size=(100, 100))
+    files = []
+    with tempfile.TemporaryDirectory() as directori:
+        for copies in (1, 10):
+            ruta = os.path.join(directori, f'pobles_{copies}.csv')
+            pd.DataFrame({'nom': [f"{nom} {k}" if k else nom for k in range(copies) for nom in pobles_data.noms],
+                          'lat': np.concatenate([pobles_data.lats + (rng.uniform(-0.05, 0.05, len(pobles_data)) if k else 0) for k in range(copies)]),
+                          'lon': np.concatenate([pobles_data.lons + (rng.uniform(-0.05, 0.05, len(pobles_data)) if k else 0) for k in range(copies)])}).to_csv(ruta, index=False)
+            t0 = time.perf_counter(); cataleg = CatalegLocalitats(ruta); ms_lectura = (time.perf_counter() - t0) * 1000
+            diccionari = {nom: cataleg[nom] for nom in cataleg.noms}
+            convergencia = calcular_localitats_convergencia(lats_g, lons_g, speeds, dirs, cataleg, LLINDAR_CONVERGENCIA, "Malla nativa (ràpid)")
+            planificador = PlanificadorCelles(); planificador.celles = {c: (round(c[0] / 0.025) * 0.025, round(c[1] / 0.025) * 0.025) for c in cataleg.coordenades}
+            def mostreig_anterior():
+                return [camp[np.abs(grid_lat - c['lat']).argmin(), np.abs(grid_lon - c['lon']).argmin()] for c in diccionari.values()]
+            def mostreig_columnes():
+                return camp[np.abs(grid_lat - cataleg.lats[:, None]).argmin(axis=1), np.abs(grid_lon - cataleg.lons[:, None]).argmin(axis=1)]
+            def selector_anterior():
+                formatar = lambda nom: f"📍 {nom} (Convergència a les 14:00h)" if nom in convergencia else nom
+                return [formatar(nom) for nom in sorted(diccionari)]
+            def selector_columnes():
+                etiquetes = {nom: f"📍 {nom} (Convergència a les 14:00h)" for nom in convergencia}
+                return [etiquetes.get(nom, nom) for nom in cataleg.noms]
+            def celles_anterior():
+                return [planificador.resoldre([(c['lat'], c['lon']) for c in diccionari.values()]) and planificador.resoldre([(c['lat'], c['lon'])])[0] for c in diccionari.values()]
+            def celles_columnes():
+                planificador.resoldre(cataleg.coordenades); return planificador.resoldre(cataleg.coordenades)
+            for operacio, anterior, columnes in (("Mostreig del camp a les localitats", mostreig_anterior, mostreig_columnes),
+                                                 ("Etiquetes del selector (📍)", selector_anterior, selector_columnes),
+                                                 ("Cel·la del model de cada localitat", celles_anterior, celles_columnes)):
+                fila = {'Operació': operacio, 'Localitats': len(cataleg)}
+                for etiqueta, funcio in (('Diccionari (ms)', anterior), ('Catàleg en columnes (ms)', columnes)):
+                    t0 = time.perf_counter(); funcio(); fila[etiqueta] = (time.perf_counter() - t0) * 1000
+                files.append(fila)
+            t0 = time.perf_counter(); calcular_localitats_convergencia(lats_g, lons_g, speeds, dirs, cataleg, LLINDAR_CONVERGENCIA, "Malla nativa (ràpid)")
+            files.append({'Operació': "Convergència completa (malla nativa)", 'Localitats': len(cataleg), 'Catàleg en columnes (ms)': (time.perf_counter() - t0) * 1000})
+            files.append({'Operació': "Lectura del catàleg (CSV)", 'Localitats': len(cataleg), 'Catàleg en columnes (ms)': ms_lectura})
+    return pd.DataFrame(files).sort_values(['Operació', 'Localitats'], kind='stable')
+
+def banc_horitzo():
+    # Cost d'obrir la pàgina amb un sol dia (el fragment que es consulta) o amb tot l'horitzó demanat d'entrada:
+    # bytes de resposta de la graella i de les cel·les de les localitats, descodificació, anàlisi i memòria
+    rng = np.random.default_rng(0); n_punts = len(LATS_GRAELLA) * len(LONS_GRAELLA) + len(set(celles_de(coordenades_pobles())))
+    files = []
+    for nom, dies in (("Fragment d'un dia (a demanda)", 1), (f"Tot l'horitzó AROME d'entrada ({HORITZO_DIES['arome_france']} dies)", HORITZO_DIES['arome_france']), (f"Horitzó ARPEGE d'entrada ({HORITZO_DIES['meteofrance_arpege_europe']} dies)", HORITZO_DIES['meteofrance_arpege_europe'])):
+        dades = b''.join(resposta_sintetica(v) for v in variables_horitzo(rng, n_punts, 24 * dies))
+        t0 = time.perf_counter(); perfils = descodificar_perfils(llegir_respostes(dades), P_LEVELS_AROME); ms_desc = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'): conjunt = actualitzar_conjunt(perfils, None, 0)
+        ms_analisi = (time.perf_counter() - t0) * 1000
+        files.append({'Càrrega': nom, 'Hores': 24 * dies, 'Resposta (MB)': len(dades) / 1e6, 'Descodificació (ms)': ms_desc, 'Anàlisi (ms)': ms_analisi,
+                      'Fins a la pàgina (ms)': ms_desc + ms_analisi, 'Memòria (MB)': mida_aproximada({**conjunt, 'resposta': dades}) / 1e6})
+    for fila in files[1:]: fila['Cost vs. fragment (x)'] = fila['Fins a la pàgina (ms)'] / files[0]['Fins a la pàgina (ms)']
+    return pd.DataFrame(files)
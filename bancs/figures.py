@@ -0,0 +1,60 @@
+# --- BANCS DE FIGURES ---
+# Fons estàtic del Skew-T i animació de la convergència.
+import time
+import numpy as np
+import pandas as pd
+from metpy.units import units
+from animacio_convergencia import FonsMapa, renderitzar_fotograma
+from app_interactiva import (
+    FonsSkewT, LATS_GRAELLA, LONS_GRAELLA, PPP_ANIMACIO, PROCESSOS_ANIMACIO, carregar_arxiu_sondeigs, columnes_arxiu,
+    crear_mapa_vents, crear_skewt, feines_animacio, gif_convergencia, muntar_gif, obtenir_grup_animacio,
+    obtenir_magatzem_passades, png_figura, renderitzar_skewt_complet)
+
+def banc_fons_skewt():
+    # Mateix sondeig renderitzat amb figura nova (fons redibuixat + st.pyplot) i amb el fons estàtic en memòria
+    sondeigs = columnes_arxiu(carregar_arxiu_sondeigs())
+    ok = np.isfinite(sondeigs[0][0])
+    p, T, Td, u, v = (c[0][ok] for c in sondeigs[:5])
+    args = (p * units.hPa, T * units.degC, Td * units.degC, u * units('m/s'), v * units('m/s'))
+    t0 = time.perf_counter(); fons = FonsSkewT(); ms_fons = (time.perf_counter() - t0) * 1000
+    files = []
+    for nom, renderitzar in (("Figura nova a cada sondeig", renderitzar_skewt_complet), ("Fons estàtic + traces", fons.renderitzar)):
+        crear_skewt(*args, renderitzar=renderitzar)
+        t0 = time.perf_counter()
+        for _ in range(3): png = crear_skewt(*args, renderitzar=renderitzar)
+        files.append({'Renderització': nom, 'Temps per sondeig (ms)': (time.perf_counter() - t0) * 1000 / 3, 'PNG (kB)': len(png) / 1000})
+    # Només el dibuix, sense el càlcul de la parcel·la (traces fixes)
+    for nom, renderitzar in (("Figura nova, només traces", renderitzar_skewt_complet), ("Fons estàtic, només traces", fons.renderitzar)):
+        t0 = time.perf_counter()
+        for _ in range(3): renderitzar(lambda skew: (skew.plot(args[0], args[1], 'r', lw=2), skew.plot(args[0], args[2], 'b', lw=2), skew.plot_barbs(*args[0:1], *args[3:], length=7)))
+        files.append({'Renderització': nom, 'Temps per sondeig (ms)': (time.perf_counter() - t0) * 1000 / 3})
+    files.append({'Renderització': "Preparació del fons (una vegada per procés)", 'Temps per sondeig (ms)': ms_fons})
+    return pd.DataFrame(files)
+
+def banc_animacio():
+    # Cost de les 24 hores d'un nivell: una figura completa per hora (com el selector d'hores), el fons reutilitzat en
+    # un sol procés, el grup de processos i el GIF ja desat. Els dos primers es mesuren amb 4 hores i s'extrapolen.
+    instantania = obtenir_magatzem_passades().instantania(); nivell = 850
+    feines = feines_animacio(instantania, nivell)
+    if not feines:
+        rng = np.random.default_rng(0); lons, lats = (m.ravel() for m in np.meshgrid(LONS_GRAELLA, LATS_GRAELLA))
+        feines = [(lats, lons, 8 + rng.normal(0, 4, lats.size), rng.normal(0, 4, lats.size), f"Prova {h:02d}:00h") for h in range(24)]
+    n, mostra = len(feines), feines[:4]; files = []
+    t0 = time.perf_counter()
+    for lats, lons, u, v, _ in mostra: png_figura(crear_mapa_vents(lats, lons, u * units('m/s'), v * units('m/s'), None, nivell))
+    ms = (time.perf_counter() - t0) * 1000 * n / len(mostra)
+    files.append({'Camí': "Figura completa per hora (crear_mapa_vents + PNG)", 'Fotogrames': n, 'Temps (s)': ms / 1000, 'ms per fotograma': ms / n})
+    t0 = time.perf_counter(); fons = FonsMapa(PPP_ANIMACIO); ms_fons = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    for lats, lons, u, v, titol in mostra: fons.renderitzar(lats, lons, u, v, titol)
+    ms = (time.perf_counter() - t0) * 1000 * n / len(mostra) + ms_fons
+    files.append({'Camí': "Fons estàtic reutilitzat, un sol procés", 'Fotogrames': n, 'Temps (s)': ms / 1000, 'ms per fotograma': ms / n})
+    t0 = time.perf_counter(); grup = obtenir_grup_animacio(); list(grup.map(abs, range(PROCESSOS_ANIMACIO))); ms_arrencada = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter(); gif = muntar_gif(list(grup.map(renderitzar_fotograma, *zip(*feines)))); ms = (time.perf_counter() - t0) * 1000
+    files.append({'Camí': f"Grup de {PROCESSOS_ANIMACIO} processos + GIF ({len(gif) / 1e6:.1f} MB; arrencada {ms_arrencada:.0f} ms a part)", 'Fotogrames': n, 'Temps (s)': ms / 1000, 'ms per fotograma': ms / n})
+    if instantania:
+        gif_convergencia(instantania, nivell, 0)
+        t0 = time.perf_counter(); gif_convergencia(instantania, nivell, 0); ms = (time.perf_counter() - t0) * 1000
+        files.append({'Camí': "GIF ja desat per a la passada", 'Fotogrames': n, 'Temps (s)': ms / 1000, 'ms per fotograma': ms / n})
+    for fila in files[1:]: fila['Acceleració (x)'] = files[0]['Temps (s)'] / max(fila['Temps (s)'], 1e-6)
+    return pd.DataFrame(files)
@@ -0,0 +1,176 @@
+# --- BANCS DEL MOTOR DE CÀLCUL ---
+# Resolució vertical, parcel·les, índexs, taula de pseudoadiabàtiques, convergència i cota de neu. Els
+# sondeigs de l'arxiu de text (resolució de 25 hPa) fan de referència.
+import time
+import numpy as np
+import pandas as pd
+import metpy.calc as mpcalc
+from metpy.units import units
+from app_interactiva import (
+    BYTES_PER_NIVELL, DIR_TAULES, LATS_GRAELLA, LLINDAR_CONVERGENCIA, LONS_GRAELLA, MIDA_BLOC_NIVELLS,
+    MOTORS_CONVERGENCIA, PARCELLES, PRESSIO_MIN_NEU, P_LEVELS_AROME, TaulaPseudoadiabatiques, UNITATS_PARAMETRES,
+    altura_std_a_pressio, calcular_indexs_lot, calcular_parametres_lot, calcular_parcelles_lot,
+    calcular_precipitacio_lot, carregar_arxiu_sondeigs, columnes_arxiu, columnes_hores, columnes_parcelles, lcl_lot,
+    obtenir_magatzem_passades, obtenir_taula_pseudoadiabatiques, perfil_parcela_lot, planificar_nivells, pobles_data,
+    pressio_a_altura_std, termodinamica_lot, vents_graella)
+from bancs.sintetics import camp_vents_analitic, remostrejar_columnes
+
+def banc_resolucio_vertical():
+    referencia = columnes_arxiu(carregar_arxiu_sondeigs())
+    ref = calcular_parametres_lot(*referencia)
+    p0, n = referencia[0][:, 0], len(referencia[0])
+    p_lcl, _ = lcl_lot(p0, referencia[1][:, 0] + 273.15, referencia[2][:, 0] + 273.15)
+    lot_std = calcular_parametres_lot(*remostrejar_columnes(referencia, [P_LEVELS_AROME] * n))
+    p_lfc = altura_std_a_pressio(lot_std['LFC_AGL'] + pressio_a_altura_std(p0))
+    files = []
+    for nom, pressupost in [("Estàndard (12 nivells)", 0), ("Adaptativa (4 extres)", 4 * BYTES_PER_NIVELL), ("Adaptativa (8 extres)", 8 * BYTES_PER_NIVELL), ("Completa (24 nivells)", np.inf)]:
+        extres = [planificar_nivells(p0[i], p_lcl[i], p_lfc[i], pressupost) for i in range(n)]
+        columnes = remostrejar_columnes(referencia, [sorted(P_LEVELS_AROME + e, reverse=True) for e in extres])
+        t0 = time.perf_counter(); lot = calcular_parametres_lot(*columnes); ms = (time.perf_counter() - t0) * 1000
+        n_extres = np.mean([len(e) for e in extres])
+        fila = {'Resolució': nom, 'Nivells extres': n_extres, 'Peticions': 1 + np.mean([-(-len(e) // MIDA_BLOC_NIVELLS) for e in extres]),
+                'kB per sondeig': (3 * (24 * 4 + 48) + (len(P_LEVELS_AROME) + n_extres) * BYTES_PER_NIVELL) / 1000, f'Càlcul {n} perfils (ms)': ms}
+        for k in ('CAPE_Brut', 'CIN_Fre', 'LCL_AGL', 'LFC_AGL', 'SRH_0-1km', 'PWAT_Total'):
+            fila[f"Error {k} ({UNITATS_PARAMETRES[k]})"] = np.nanmedian(np.abs(lot[k] - ref[k]))
+        files.append(fila)
+    return pd.DataFrame(files)
+
+def banc_parcelles():
+    # Cost d'afegir ML i MU a la parcel·la de superfície, amb MetPy i amb el motor vectoritzat, i error respecte MetPy
+    p, T, Td, u, v, h = columnes_arxiu(carregar_arxiu_sondeigs())
+    perfils = [(p[i][ok] * units.hPa, T[i][ok] * units.degC, Td[i][ok] * units.degC) for i in range(len(p)) for ok in [np.isfinite(p[i])]]
+    def metpy_sb(): return [mpcalc.surface_based_cape_cin(*c) for c in perfils]
+    def metpy_tots(): return [(mpcalc.surface_based_cape_cin(*c), mpcalc.mixed_layer_cape_cin(*c), mpcalc.most_unstable_cape_cin(*c)) for c in perfils]
+    def tres_passades():
+        columnes, _ = columnes_parcelles(p, T, Td); n = len(p)
+        return [termodinamica_lot(*(c[i * n:(i + 1) * n] for c in columnes)) for i in range(len(PARCELLES))]
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        proves = [("MetPy", "SB", metpy_sb, 1), ("MetPy", "SB + ML + MU", metpy_tots, 1),
+                  ("Vectoritzat", "SB", lambda: termodinamica_lot(p, T, Td), 5), ("Vectoritzat", "SB + ML + MU (tres passades)", tres_passades, 5),
+                  ("Vectoritzat", "SB + ML + MU (una passada)", lambda: calcular_parcelles_lot(p, T, Td, h), 5)]
+        files, ref = [], {}
+        for motor, parcelles, funcio, repeticions in proves:
+            t0 = time.perf_counter()
+            for _ in range(repeticions): resultat = funcio()
+            ms = (time.perf_counter() - t0) * 1000 / repeticions
+            files.append({'Motor': motor, 'Parcel·les': parcelles, f'Temps {len(p)} perfils (ms)': ms, 'Cost vs. SB (x)': ms / ref.setdefault(motor, ms)})
+            if parcelles == "SB + ML + MU": mp = resultat
+    for i, tipus in enumerate(PARCELLES):
+        cape_ref, cin_ref = np.array([r[i][0].m for r in mp]), np.array([r[i][1].m for r in mp])
+        files[-1][f'Error CAPE {tipus} (J/kg)'] = np.nanmedian(np.abs(resultat[f'CAPE_{tipus}'] - cape_ref))
+        files[-1][f'Error CIN {tipus} (J/kg)'] = np.nanmedian(np.abs(resultat[f'CIN_{tipus}'] - cin_ref))
+    return pd.DataFrame(files)
+
+def banc_indexs():
+    # Cost de cada família d'índexs sobre tots els perfils (cel·la, hora) de la passada, al costat dels paràmetres
+    # base; la darrera fila és el que la biblioteca afegeix a cada construcció d'instantània
+    instantania = obtenir_magatzem_passades().instantania()
+    if instantania:
+        columnes = columnes_hores(instantania['pobles']['perfils']); origen = f"passada {instantania['run']}"
+    else:
+        columnes = columnes_arxiu(carregar_arxiu_sondeigs()); origen = "arxiu de sondeigs"
+    n = len(columnes[0]); files = []
+    for nom_motor, taula in (("RK4", None), ("Taula", obtenir_taula_pseudoadiabatiques())):
+        t0 = time.perf_counter(); base = calcular_parametres_lot(*columnes, taula=taula); ms_base = (time.perf_counter() - t0) * 1000
+        temps = {}; t0 = time.perf_counter(); indexs = calcular_indexs_lot(*columnes, base, taula=taula, temps=temps); ms_total = (time.perf_counter() - t0) * 1000
+        files.append({'Motor': nom_motor, 'Càlcul': f"Paràmetres base ({n} perfils, {origen})", 'Temps (ms)': ms_base, 'µs per perfil': ms_base * 1000 / n})
+        for nom, ms in temps.items():
+            files.append({'Motor': nom_motor, 'Càlcul': nom, 'Temps (ms)': ms, 'µs per perfil': ms * 1000 / n, '% de la base': 100 * ms / ms_base})
+        files.append({'Motor': nom_motor, 'Càlcul': f"Tots els índexs ({np.isfinite(indexs['STP']).sum()} STP vàlids)", 'Temps (ms)': ms_total, 'µs per perfil': ms_total * 1000 / n, '% de la base': 100 * ms_total / ms_base})
+    return pd.DataFrame(files)
+
+def banc_taula_pseudoadiabatiques():
+    # Fites d'error respecte MetPy (arxiu de text) i escombrada pobles × hores amb el motor RK4 i amb la taula
+    t0 = time.perf_counter(); taula = TaulaPseudoadiabatiques(DIR_TAULES); ms_obertura = (time.perf_counter() - t0) * 1000
+    sondeigs = columnes_arxiu(carregar_arxiu_sondeigs())
+    p, T, Td, h = sondeigs[0], sondeigs[1], sondeigs[2], sondeigs[5]
+    errors = {'Parcel·la': [], 'Bulb humit': []}; temps = {'MetPy': 0.0, 'Taula': 0.0}
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        for i in range(len(p)):
+            ok = np.isfinite(p[i]) & (p[i] >= 100); p_i, t_k, td_k = p[i][ok], T[i][ok] + 273.15, Td[i][ok] + 273.15
+            t0 = time.perf_counter()
+            ref_parcela = mpcalc.parcel_profile(p_i * units.hPa, t_k[0] * units.K, td_k[0] * units.K).to('K').m
+            ref_bulb = mpcalc.wet_bulb_temperature(p_i * units.hPa, t_k * units.K, td_k * units.K).to('K').m
+            t1 = time.perf_counter()
+            parcela = perfil_parcela_lot(p_i[None], p_i[:1], t_k[:1], td_k[:1], taula)[0][0]; bulb = taula.bulb_humit(p_i, t_k, td_k)
+            temps['MetPy'] += t1 - t0; temps['Taula'] += time.perf_counter() - t1
+            errors['Parcel·la'].append(np.abs(parcela - ref_parcela)); errors['Bulb humit'].append(np.abs(bulb - ref_bulb))
+        files = [{'Prova': f"{nom} vs. MetPy ({len(p)} sondeigs)", 'Error mitjà (K)': np.mean(np.concatenate(e)), 'Error P99 (K)': np.percentile(np.concatenate(e), 99),
+                  'Error màxim (K)': np.max(np.concatenate(e)), 'MetPy (ms)': temps['MetPy'] * 1000, 'Taula (ms)': temps['Taula'] * 1000, 'Acceleració (x)': temps['MetPy'] / temps['Taula']}
+                 for nom, e in errors.items()]
+        # Escombrada de tots els pobles × 24 hores: sondeigs de l'arxiu repetits i desplaçats
+        n = len(pobles_data) * 24; rng = np.random.default_rng(0); origen = np.arange(n) % len(p)
+        soroll = rng.normal(0, 1.5, (n, 1))
+        columnes = (p[origen], T[origen] + soroll, Td[origen] + soroll - np.abs(rng.normal(0, 1, (n, 1))), sondeigs[3][origen], sondeigs[4][origen], h[origen])
+        resultats, ascens = {}, {'Prova': f"Només l'ascens de la parcel·la ({n} perfils)"}
+        for motor, t in (("RK4", None), ("Taula", taula)):
+            t0 = time.perf_counter(); perfil_parcela_lot(columnes[0], columnes[0][:, 0], columnes[1][:, 0] + 273.15, columnes[2][:, 0] + 273.15, t)
+            ascens[f"{motor} (ms)"] = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter(); resultats[motor] = calcular_parametres_lot(*columnes, taula=t); temps[motor] = (time.perf_counter() - t0) * 1000
+        ascens['Acceleració (x)'] = ascens['RK4 (ms)'] / ascens['Taula (ms)']; files.append(ascens)
+        fila = {'Prova': f"Escombrada {len(pobles_data)} pobles × 24 h ({n} perfils)", 'RK4 (ms)': temps['RK4'], 'Taula (ms)': temps['Taula'], 'Acceleració (x)': temps['RK4'] / temps['Taula']}
+        for k in ('CAPE_Brut', 'CIN_Fre', 'LFC_AGL', 'EL_MSL'):
+            fila[f"Error {k} ({UNITATS_PARAMETRES[k]})"] = np.nanmedian(np.abs(resultats['Taula'][k] - resultats['RK4'][k]))
+        files.append(fila)
+    files.append({'Prova': "Obertura de la taula (mmap)", 'Taula (ms)': ms_obertura})
+    return pd.DataFrame(files)
+
+def banc_convergencia():
+    # Camps analítics a la malla 12×12 (coordenades ajustades a 0,025° com les cel·les d'AROME): error de cada
+    # motor respecte la divergència exacta a les localitats i coincidència de les localitats marcades
+    rng = np.random.default_rng(0)
+    lon_grid, lat_grid = np.meshgrid(LONS_GRAELLA, LATS_GRAELLA)
+    lats, lons = np.round(lat_grid.ravel() / 0.025) * 0.025, np.round(lon_grid.ravel() / 0.025) * 0.025
+    camps = [camp_vents_analitic(rng, lats, lons) for _ in range(24)]
+    exacta = np.concatenate([div(pobles_data.lats, pobles_data.lons) for _, _, div in camps])
+    marcades = {}; files = []
+    for nom, motor in MOTORS_CONVERGENCIA.items():
+        t0 = time.perf_counter()
+        valors = np.concatenate([motor(lats.tolist(), lons.tolist(), speeds, dirs, pobles_data) for speeds, dirs, _ in camps])
+        ms = (time.perf_counter() - t0) * 1000 / len(camps)
+        marcades[nom] = valors < LLINDAR_CONVERGENCIA; certes = exacta < LLINDAR_CONVERGENCIA
+        files.append({'Prova': f"{nom}: {len(camps)} camps analítics", 'Temps per camp (ms)': ms, 'Error mitjà (1e-5 s⁻¹)': np.nanmean(np.abs(valors - exacta)),
+                      'Correlació': np.corrcoef(valors, exacta)[0, 1], 'Jaccard vs. exacta': (marcades[nom] & certes).sum() / max((marcades[nom] | certes).sum(), 1)})
+    for fila in files: fila['Acceleració (x)'] = files[0]['Temps per camp (ms)'] / fila['Temps per camp (ms)']
+    # Passada en ús: coincidència entre els dos motors a totes les hores i nivells
+    instantania = obtenir_magatzem_passades().instantania()
+    if instantania:
+        cubica, nativa, temps = [], [], {nom: 0.0 for nom in MOTORS_CONVERGENCIA}
+        for hora in range(instantania['perfils']['sfc'].shape[-1]):
+            for nivell in P_LEVELS_AROME:
+                vents = vents_graella(instantania, hora, nivell)
+                if len(vents[0]) < 4: continue
+                for nom, llista in zip(MOTORS_CONVERGENCIA, (cubica, nativa)):
+                    t0 = time.perf_counter(); llista.append(MOTORS_CONVERGENCIA[nom](*vents, pobles_data)); temps[nom] += time.perf_counter() - t0
+        if cubica:
+            cubica, nativa = np.concatenate(cubica), np.concatenate(nativa)
+            a, b = cubica < LLINDAR_CONVERGENCIA, nativa < LLINDAR_CONVERGENCIA
+            files.append({'Prova': f"Passada {instantania['run']}: nativa vs. cúbica ({len(cubica) // len(pobles_data)} hores × nivells)",
+                          'Temps per camp (ms)': temps["Malla nativa (ràpid)"] * 1000 * len(pobles_data) / len(cubica), 'Acceleració (x)': temps["Interpolació cúbica (100×100)"] / temps["Malla nativa (ràpid)"],
+                          'Error mitjà (1e-5 s⁻¹)': np.nanmean(np.abs(nativa - cubica)), 'Correlació': pd.Series(nativa).corr(pd.Series(cubica)),
+                          'Jaccard nativa vs. cúbica': (a & b).sum() / max((a | b).sum(), 1)})
+    return pd.DataFrame(files)
+
+def banc_cota_neu():
+    # Escombrada perfil a perfil com abans (bulb humit de MetPy i pas per zero amb np.diff(np.sign)) sobre una mostra,
+    # extrapolada a totes les (localitat, hora), davant del lot vectoritzat amb RK4 i amb la taula
+    instantania = obtenir_magatzem_passades().instantania()
+    if instantania:
+        p, T, Td, _, _, h = columnes_hores(instantania['pobles']['perfils']); origen = f"passada {instantania['run']}"
+    else:
+        p, T, Td, _, _, h = columnes_arxiu(carregar_arxiu_sondeigs()); origen = "arxiu de sondeigs"
+    n = len(p); mostra = np.flatnonzero(np.isfinite(T[:, 0]))[:60]
+    iso_ref = np.full(len(mostra), np.nan); t0 = time.perf_counter()
+    for j, i in enumerate(mostra):
+        ok = np.isfinite(p[i]) & (p[i] >= PRESSIO_MIN_NEU)
+        tw = mpcalc.wet_bulb_temperature(p[i][ok] * units.hPa, T[i][ok] * units.degC, np.minimum(Td[i][ok], T[i][ok]) * units.degC).m; h_i = h[i][ok]
+        creua = np.where(np.diff(np.sign(tw)))[0]
+        if tw[0] <= 0: iso_ref[j] = h_i[0]
+        elif creua.size > 0: k = creua[0]; iso_ref[j] = np.interp(0, [tw[k + 1], tw[k]], [h_i[k + 1], h_i[k]])
+    ms_ref = (time.perf_counter() - t0) * 1000 * n / max(len(mostra), 1)
+    files = [{'Càlcul': f"Perfil a perfil amb MetPy ({len(mostra)} de {n} perfils, {origen})", 'Temps (ms)': ms_ref, 'µs per perfil': ms_ref * 1000 / n}]
+    for nom_motor, taula in (("RK4", None), ("Taula", obtenir_taula_pseudoadiabatiques())):
+        t0 = time.perf_counter(); lot = calcular_precipitacio_lot(p, T, Td, h, taula); ms = (time.perf_counter() - t0) * 1000
+        files.append({'Càlcul': f"Lot vectoritzat ({nom_motor})", 'Temps (ms)': ms, 'µs per perfil': ms * 1000 / n, 'Acceleració (x)': ms_ref / ms,
+                      'Δ isozero bulb humit màx. (m)': np.nanmax(np.abs(lot['Isozero_Bulb_Humit'][mostra] - iso_ref))})
+    return pd.DataFrame(files)
@@ -0,0 +1,68 @@
+# --- DADES SINTÈTIQUES ---
+# Entrades dels bancs i dels tests que no depenen de la xarxa: respostes amb el format binari de l'API,
+# sondeigs remostrejats i camps de vent amb divergència coneguda.
+import flatbuffers
+import numpy as np
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+from app_interactiva import (
+    P_LEVELS_AROME, obtenir_magatzem_passades, pressio_a_altura_std)
+
+def remostrejar_columnes(columnes, nivells_per_columna):
+    p = columnes[0]
+    sortida = [np.full((len(p), max(len(n) for n in nivells_per_columna) + 1), np.nan) for _ in columnes]
+    for i, nivells in enumerate(nivells_per_columna):
+        ok = np.isfinite(p[i]); p_i = p[i][ok]
+        p_nous = np.array([p_i[0]] + [n for n in nivells if p_i[-1] <= n < p_i[0]])
+        for k, var in enumerate(columnes):
+            sortida[k][i, :len(p_nous)] = np.interp(np.log(p_nous), np.log(p_i)[::-1], var[i][ok][::-1])
+    return sortida
+
+def resposta_sintetica(valors, lat=41.0, lon=2.0):
+    # Missatge amb la mateixa estructura que els de l'API (coordenades i variables horàries), amb la mida al davant
+    builder = flatbuffers.Builder(valors.nbytes + 1024)
+    variables = []
+    for fila in valors:
+        vector = builder.CreateNumpyVector(np.ascontiguousarray(fila, dtype=np.float32))
+        builder.StartObject(14); builder.PrependUOffsetTRelativeSlot(3, vector, 0); variables.append(builder.EndObject())
+    builder.StartVector(4, len(variables), 4)
+    for v in reversed(variables): builder.PrependUOffsetTRelative(v)
+    llista = builder.EndVector()
+    builder.StartObject(4); builder.PrependInt32Slot(2, 3600, 0); builder.PrependUOffsetTRelativeSlot(3, llista, 0); hourly = builder.EndObject()
+    builder.StartObject(15); builder.PrependFloat32Slot(0, lat, 0); builder.PrependFloat32Slot(1, lon, 0); builder.PrependUOffsetTRelativeSlot(11, hourly, 0)
+    builder.FinishSizePrefixed(builder.EndObject())
+    return bytes(builder.Output())
+
+def llegir_respostes(dades):
+    # El mateix tall del cos de la resposta que fa el client d'openmeteo_requests
+    respostes, pos = [], 0
+    while pos < len(dades):
+        mida = int.from_bytes(dades[pos:pos + 4], 'little')
+        respostes.append(WeatherApiResponse.GetRootAs(dades, pos + 4)); pos += mida + 4
+    return respostes
+
+def camp_vents_analitic(rng, lats, lons):
+    # Vent sintètic suau (ones de 1-2,5°) amb divergència coneguda, en km/h i graus com els retorna l'API
+    k = 2 * np.pi / rng.uniform(1.0, 2.5, 4); fase = rng.uniform(0, 2 * np.pi, 2); amp = rng.uniform(2, 4, 2); fons = rng.uniform(-10, 10, 2)
+    u = lambda la, lo: fons[0] + amp[0] * np.sin(k[0] * lo + fase[0]) * np.cos(k[1] * la)
+    v = lambda la, lo: fons[1] + amp[1] * np.cos(k[2] * lo) * np.sin(k[3] * la + fase[1])
+    graus = 6371008.8 * np.pi / 180
+    div = lambda la, lo: 1e5 * (amp[0] * k[0] * np.cos(k[0] * lo + fase[0]) * np.cos(k[1] * la) / (graus * np.cos(np.radians(la)))
+                                + amp[1] * k[3] * np.cos(k[2] * lo) * np.cos(k[3] * la + fase[1]) / graus)
+    uu, vv = u(lats, lons), v(lats, lons)
+    return np.hypot(uu, vv) * 3.6, np.degrees(np.arctan2(-uu, -vv)) % 360, div
+
+def variables_horitzo(rng, n_punts, n_hores):
+    # Variables horàries (punt, variable, hora) en l'ordre d'HOURLY_SONDEIG: les de la instantània si n'hi ha,
+    # repetides dia rere dia; si no, una atmosfera estàndard amb un cicle diürn i soroll
+    instantania = obtenir_magatzem_passades().instantania()
+    if instantania:
+        perfils = instantania['perfils']
+        dia = np.concatenate([perfils['sfc'], perfils['press'].reshape(len(perfils['lats']), -1, perfils['sfc'].shape[-1])], axis=1)
+        return np.resize(dia[np.arange(n_punts) % len(dia)], (n_punts, dia.shape[1], n_hores)).astype(np.float32)
+    p = np.array(P_LEVELS_AROME, dtype=float); z = pressio_a_altura_std(p)
+    cicle = 4 * np.sin(np.arange(n_hores) * 2 * np.pi / 24 - np.pi / 2)
+    t_sfc = 22 + cicle + rng.normal(0, 1, (n_punts, 1))
+    t = t_sfc[:, None] - 6.5e-3 * z[None, :, None] + rng.normal(0, 0.5, (n_punts, len(p), n_hores))
+    nivells = np.stack([t, t - 4 - z[None, :, None] / 400, np.broadcast_to(10 + z[None, :, None] / 300, t.shape), np.full(t.shape, 250.0), np.broadcast_to(z[None, :, None], t.shape)], axis=1)
+    sfc = np.stack([t_sfc, t_sfc - 6, np.full(t_sfc.shape, 1008.0)], axis=1) + np.zeros((1, 1, n_hores))
+    return np.concatenate([sfc, nivells.reshape(n_punts, -1, n_hores)], axis=1).astype(np.float32)
@@ -0,0 +1,20 @@
+# --- CONFIGURACIÓ DELS TESTS ---
+# L'aplicació s'importa com a mòdul (la pàgina només es dibuixa amb streamlit run). Els sondeigs de l'arxiu de
+# text (resolució de 25 hPa) fan de referència, com als bancs de proves.
+import logging
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.getLogger('streamlit.runtime.scriptrunner_utils.script_run_context').setLevel(logging.ERROR)
+
+from app_interactiva import TaulaPseudoadiabatiques, carregar_arxiu_sondeigs, columnes_arxiu
+
+@pytest.fixture(scope='session')
+def sondeigs():
+    return columnes_arxiu(carregar_arxiu_sondeigs())
+
+@pytest.fixture(scope='session')
+def taula(tmp_path_factory):
+    return TaulaPseudoadiabatiques(str(tmp_path_factory.mktemp('taules')))
@@ -0,0 +1,41 @@
+# --- VERIFICACIÓ I ANÀLEGS SOBRE ARXIUS SINTÈTICS ---
+# La verificació ha de recuperar un biaix conegut i la cerca d'anàlegs (PCA + KD-tree) ha de trobar la major
+# part dels veïns de la força bruta sobre el vector complet.
+from datetime import datetime
+import numpy as np
+from app_interactiva import (ArxiuClimatologic, FONTS_CLIMATOLOGIA, FONT_OBSERVACIO, GRAELLA_CLIMATOLOGIA, IndexAnalegs, UNITATS_PARAMETRES,
+                             calcular_parametres_lot, caracteristiques_perfils, perfils_a_graella, segons_utc, verificar_previsions)
+
+def test_verificacio_recupera_el_biaix(sondeigs, tmp_path):
+    # Quatre passades per hora vàlida amb +0,5 °C a T i soroll d'1 °C: biaix 0,5 °C i RMSE √1,25 ≈ 1,12 °C
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'): graella, ref = perfils_a_graella(*sondeigs), calcular_parametres_lot(*sondeigs)
+    rng = np.random.default_rng(0); n_obs = 500
+    arxiu = ArxiuClimatologic(str(tmp_path))
+    mostra = rng.integers(0, len(sondeigs[0]), n_obs); valid = segons_utc(datetime(2024, 1, 1)) + 3600 * np.arange(n_obs)
+    arxiu.afegir(["Arxiu de text"] * n_obs, valid, valid, FONT_OBSERVACIO, {k: val[mostra] for k, val in ref.items()}, {var: val[mostra] for var, val in graella.items()})
+    for abast in (6, 18, 30, 42):
+        soroll = {var: val[mostra] + rng.normal(0.5 if var == 'T' else 0, 1, val[mostra].shape) for var, val in graella.items()}
+        arxiu.afegir(["Lleida"] * n_obs, valid, valid - abast * 3600, FONTS_CLIMATOLOGIA['AROME'], {k: val[mostra] for k, val in ref.items()}, soroll)
+    resultat = verificar_previsions(arxiu, "Lleida")
+    assert resultat['parells'] == 4 * n_obs
+    nivells = resultat['nivells']; pes = nivells['Parells'] / nivells['Parells'].sum()
+    assert abs((nivells['T biaix (°C)'] * pes).sum() - 0.5) < 0.05
+    assert abs(np.sqrt((nivells['T RMSE (°C)'] ** 2 * pes).sum()) - np.sqrt(1.25)) < 0.05
+
+def test_analegs_com_forca_bruta(sondeigs, tmp_path):
+    base = perfils_a_graella(*sondeigs)
+    rng = np.random.default_rng(1); n, m = 5000, len(GRAELLA_CLIMATOLOGIA)
+    mostra = rng.integers(0, len(base['T']), n); desplacament = rng.normal(0, 2, (n, 1))
+    perfils = {'T': base['T'][mostra] + desplacament + rng.normal(0, 0.7, (n, m)), 'Td': base['Td'][mostra] + desplacament + rng.normal(0, 2.5, (n, m)),
+               'u': base['u'][mostra] * rng.uniform(0.3, 1.7, (n, 1)) + rng.normal(0, 1.5, (n, m)), 'v': base['v'][mostra] * rng.uniform(0.3, 1.7, (n, 1)) + rng.normal(0, 1.5, (n, m))}
+    consultes = {var: val[rng.integers(0, n, 20)] + rng.normal(0, 0.5, (20, m)) for var, val in perfils.items()}
+    arxiu = ArxiuClimatologic(str(tmp_path))
+    arxiu.afegir(["Sintètic"] * n, 3600 * np.arange(n), 0, FONTS_CLIMATOLOGIA['AROME'], {k: np.full(n, np.nan) for k in UNITATS_PARAMETRES}, perfils)
+    index = IndexAnalegs(); index.actualitzar(arxiu)
+    x_total = (caracteristiques_perfils(arxiu.perfils_files(np.arange(n))) - index.mitjana) / index.escala
+    encerts = []
+    for i, x in enumerate((caracteristiques_perfils(consultes) - index.mitjana) / index.escala):
+        exactes = np.argsort(((x_total - x) ** 2).sum(axis=1))[:10]
+        trobats = index.cercar(arxiu, {var: val[i:i + 1] for var, val in consultes.items()}, 10)[0]
+        encerts.append(len(set(exactes.tolist()) & set(trobats.tolist())) / 10)
+    assert np.mean(encerts) >= 0.8
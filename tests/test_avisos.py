@@ -0,0 +1,22 @@
+# --- AVISOS EN LOT VS. PER LOCALITAT ---
+# generar_avis_lot aplica les regles de generar_avis_localitat sobre matrius; un NaN és un paràmetre absent. El consens
+# multimodel compta els models amb el mateix avís.
+import numpy as np
+from app_interactiva import AVISOS, avis_consens, generar_avis_localitat, generar_avis_lot
+
+def test_lot_com_localitat():
+    rng = np.random.default_rng(0); n = 20000
+    lot = {'CAPE_Utilitzable': rng.uniform(0, 3000, n), 'CIN_Fre': rng.uniform(-300, 0, n), 'Shear_0-6km': rng.uniform(0, 30, n),
+           'SRH_0-1km': rng.uniform(-50, 400, n), 'LCL_AGL': rng.uniform(0, 3000, n), 'LFC_AGL': rng.uniform(0, 5000, n)}
+    for val in lot.values(): val[rng.random(n) < 0.1] = np.nan
+    nivells = generar_avis_lot(lot)
+    for i in range(n):
+        params = {k: float(val[i]) for k, val in lot.items() if np.isfinite(val[i])}
+        assert AVISOS[nivells[i]] == generar_avis_localitat(params), params
+
+def test_consens_pel_text_i_no_pel_color():
+    # Estable i inhibida (CIN) comparteixen color, però no són el mateix avís
+    lot_hora = {'CAPE_Utilitzable': np.array([50.0, 500.0, 40.0]), 'CIN_Fre': np.array([0.0, -200.0, 0.0]), 'Shear_0-6km': np.array([5.0, 5.0, 5.0]),
+                'SRH_0-1km': np.array([20.0, 20.0, 20.0]), 'LCL_AGL': np.array([800.0, 800.0, 800.0]), 'LFC_AGL': np.array([1500.0, 1500.0, 1500.0])}
+    text, color, avisos, coincidents = avis_consens(lot_hora)
+    assert (text, color) == AVISOS[0] and avisos[1] == AVISOS[1] and coincidents == 2
@@ -0,0 +1,28 @@
+# --- MEMÒRIA CAU GESTIONADA ---
+# Les entrades lligades a una passada d'AROME surten quan canvia la passada; les d'altres models (sense passada)
+# només caduquen pel ttl.
+import numpy as np
+import app_interactiva
+from app_interactiva import HOURLY_SONDEIG, MemoriaCau, descarregar_perfils_model, obtenir_gestor_cau
+from bancs.sintetics import llegir_respostes, resposta_sintetica
+
+def test_expulsio_per_passada_i_ttl(monkeypatch):
+    cau = MemoriaCau('Prova', max_entrades=10, max_bytes=10 ** 6, ttl=3600)
+    cau.desar('sense passada', 1, None); cau.desar('amb passada', 2, '2026101900')
+    cau.expulsar_runs_antics('2026101903')
+    assert cau.obtenir('sense passada', None) == (True, 1)
+    assert cau.obtenir('amb passada', '2026101903') == (False, None)
+    ara = app_interactiva.time.time()
+    monkeypatch.setattr(app_interactiva.time, 'time', lambda: ara + 3601)
+    assert cau.obtenir('sense passada', None) == (False, None)
+
+def test_sondeigs_multimodel_no_segueixen_arome(monkeypatch):
+    crides = []
+    def api(url, params):
+        crides.append(params['models'])
+        return llegir_respostes(resposta_sintetica(np.full((len(HOURLY_SONDEIG), 24), 10.0, dtype=np.float32)))
+    monkeypatch.setattr(app_interactiva.openmeteo, 'weather_api', api)
+    descarregar_perfils_model(41.39, 2.17, 'icon_d2', 0)
+    obtenir_gestor_cau().canvi_de_run('passada nova')
+    descarregar_perfils_model(41.39, 2.17, 'icon_d2', 0)
+    assert crides == ['icon_d2']
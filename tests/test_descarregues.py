@@ -0,0 +1,30 @@
+# --- DESCÀRREGUES FALLIDES ---
+# Una descàrrega que falla es registra i arriba com a ErrorOpenMeteo a qui llegeix el futur, sense cap crida a
+# st.* des dels fils del grup i sense quedar a la memòria cau.
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import app_interactiva
+from app_interactiva import ErrorOpenMeteo, obtener_sondeo_cela, sondeig_punt
+
+@pytest.fixture
+def api_caiguda(monkeypatch):
+    crides = []
+    def falla(url, params):
+        crides.append(params); raise RuntimeError("sense xarxa")
+    monkeypatch.setattr(app_interactiva.openmeteo, 'weather_api', falla)
+    for nom in ('error', 'warning', 'info', 'toast'):
+        monkeypatch.setattr(app_interactiva.st, nom, lambda *args, **kwargs: pytest.fail("st.* fora del fil del guió"))
+    return crides
+
+def test_error_es_llanca_i_no_es_desa(api_caiguda, caplog):
+    with caplog.at_level(logging.WARNING, logger='tempestes'):
+        for _ in range(2):
+            with pytest.raises(ErrorOpenMeteo, match="sense xarxa"): obtener_sondeo_cela(41.5, 1.75, 0)
+    assert len(api_caiguda) == 2
+    assert "sense xarxa" in caplog.text
+
+def test_sondeig_en_segon_pla(api_caiguda):
+    with ThreadPoolExecutor(1) as executor:
+        futur = executor.submit(sondeig_punt, 41.39, 2.17, 0, 12, 0)
+        assert isinstance(futur.exception(), ErrorOpenMeteo)
@@ -0,0 +1,32 @@
+# --- DESCODIFICACIÓ DIRECTA VS. SDK ---
+# valors_respostes llegeix els vectors de totes les respostes d'un recorregut; ha de donar el mateix que
+# ValuesAsNumpy() variable a variable sobre respostes amb el format binari de l'API.
+import numpy as np
+import pytest
+import app_interactiva
+from app_interactiva import HOURLY_SONDEIG, valors_respostes, valors_respostes_sdk
+from bancs.sintetics import llegir_respostes, resposta_sintetica
+
+@pytest.mark.parametrize('n_punts, n_vars', [(1, len(HOURLY_SONDEIG)), (144, 2), (144, len(HOURLY_SONDEIG))])
+def test_com_sdk(n_punts, n_vars):
+    valors = np.random.default_rng(0).normal(size=(n_punts, n_vars, 24)).astype(np.float32)
+    respostes = llegir_respostes(b''.join(resposta_sintetica(v) for v in valors))
+    np.testing.assert_array_equal(valors_respostes_sdk(respostes), valors)
+    np.testing.assert_array_equal(valors_respostes(respostes), valors)
+
+def test_respostes_de_buffers_diferents():
+    # Respostes que no comparteixen buffer van pel camí de l'SDK
+    valors = np.random.default_rng(1).normal(size=(3, 4, 24)).astype(np.float32)
+    respostes = [llegir_respostes(resposta_sintetica(v))[0] for v in valors]
+    np.testing.assert_array_equal(valors_respostes(respostes), valors)
+
+def test_entrades_de_l_sdk():
+    # Les entrades de la vtaula surten de les classes generades de l'SDK (hourly és el camp 11, variables i values el 3)
+    assert (app_interactiva.ENTRADA_HOURLY, app_interactiva.ENTRADA_VARIABLES, app_interactiva.ENTRADA_VALORS) == (26, 10, 10)
+
+def test_lectura_directa_que_no_coincideix(monkeypatch, caplog):
+    valors = np.random.default_rng(2).normal(size=(4, 5, 24)).astype(np.float32)
+    respostes = llegir_respostes(b''.join(resposta_sintetica(v) for v in valors))
+    monkeypatch.setattr(app_interactiva, 'valors_directes', lambda responses: np.zeros_like(valors))
+    np.testing.assert_array_equal(valors_respostes(respostes), valors)
+    assert "no coincideix" in caplog.text
@@ -0,0 +1,91 @@
+# --- MOTOR VECTORITZAT VS. METPY ---
+# calcular_parametres_lot, els índexs i les parcel·les han de donar el mateix que MetPy perfil a perfil, amb
+# les fites citades a cada canvi (FITES per als paràmetres base, SRH total, DCAPE dins del 0,2 %, Bunkers a 0,1).
+import numpy as np
+import pytest
+import metpy.calc as mpcalc
+from metpy.units import units
+from app_interactiva import (calculate_parameters, calcular_indexs_lot, calcular_parametres_lot, calcular_parcelles_lot,
+                             calcular_precipitacio_lot, perfil_parcela_lot, termodinamica_lot, PRESSIO_MIN_NEU)
+
+# Fita absoluta per paràmetre (unitats de UNITATS_PARAMETRES), sense marge relatiu: amb els sondeigs de l'arxiu
+# el màxim és de 31 J/kg al CAPE, 4 J/kg al CIN, 5 m al LCL, 28 m al LFC i 0,11 km a l'EL
+FITES = {'CAPE_Brut': 35, 'CIN_Fre': 5, 'CAPE_Utilitzable': 35, 'LCL_AGL': 10, 'LFC_AGL': 40, 'EL_MSL': 0.15,
+         'Shear_0-6km': 0.05, 'SRH_0-1km': 0.01, 'SRH_0-3km': 0.01, 'PWAT_Total': 0.1}
+
+def perfils_metpy(sondeigs):
+    p, T, Td, u, v, h = sondeigs
+    for i in range(len(p)):
+        ok = np.isfinite(p[i])
+        yield i, (p[i][ok] * units.hPa, T[i][ok] * units.degC, Td[i][ok] * units.degC, u[i][ok] * units('m/s'), v[i][ok] * units('m/s'), h[i][ok] * units.m)
+
+@pytest.fixture(scope='module')
+def lot(sondeigs):
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        base = calcular_parametres_lot(*sondeigs)
+        return base, calcular_indexs_lot(*sondeigs, base)
+
+def test_parametres_com_metpy(sondeigs, lot):
+    base, _ = lot
+    for i, perfil in perfils_metpy(sondeigs):
+        ref = calculate_parameters(*perfil)
+        for k, fita in FITES.items():
+            if k in ref: assert base[k][i] == pytest.approx(ref[k], rel=0, abs=fita), (i, k)
+
+def test_srh_total(sondeigs, lot):
+    # La SRH és el total (positiva + negativa) que retorna storm_relative_helicity, tant al punt com a la graella
+    base, _ = lot
+    for i, (p, T, Td, u, v, h) in perfils_metpy(sondeigs):
+        _, _, total = mpcalc.storm_relative_helicity(h, u, v, depth=1 * units.km)
+        assert base['SRH_0-1km'][i] == pytest.approx(total.m, abs=0.01)
+
+def test_dcape(sondeigs, lot):
+    # Només els perfils amb descendent més fred que l'entorn: amb DCAPE negativa (el sondeig de neu a 1065 hPa)
+    # la fita no s'aplica
+    _, indexs = lot
+    for i, (p, T, Td, u, v, h) in perfils_metpy(sondeigs):
+        ref = mpcalc.downdraft_cape(p, T, Td)[0].m
+        if ref > 0: assert indexs['DCAPE'][i] == pytest.approx(ref, rel=0.002), i
+
+def test_bunkers(sondeigs, lot):
+    _, indexs = lot
+    for i, (p, T, Td, u, v, h) in perfils_metpy(sondeigs):
+        with np.errstate(invalid='ignore', divide='ignore'): (u_rm, v_rm), _, _ = mpcalc.bunkers_storm_motion(p, u, v, h)
+        if not np.isfinite(u_rm.m):
+            assert np.isnan(indexs['Bunkers_Vel'][i]); continue
+        assert indexs['Bunkers_Vel'][i] == pytest.approx(np.hypot(u_rm.m, v_rm.m), abs=0.1)
+        assert (indexs['Bunkers_Dir'][i] - np.degrees(np.arctan2(-u_rm.m, -v_rm.m)) + 180) % 360 - 180 == pytest.approx(0, abs=0.1)
+
+def test_parcella_sb_identica(sondeigs):
+    # La parcel·la SB de la passada única SB/ML/MU és la de termodinamica_lot (llevat de l'arrodoniment: el lot té
+    # tres vegades més columnes)
+    p, T, Td, _, _, h = sondeigs
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        parcelles, sb = calcular_parcelles_lot(p, T, Td, h), termodinamica_lot(p, T, Td)
+    np.testing.assert_allclose(parcelles['CAPE_SB'], sb['cape'], rtol=1e-8); np.testing.assert_allclose(parcelles['CIN_SB'], sb['cin'], rtol=1e-8)
+
+def test_taula_com_metpy(sondeigs, taula):
+    # Fites de la taula de pseudoadiabàtiques: 0,1 K a la parcel·la i 0,03 K al bulb humit fins a 100 hPa
+    p, T, Td = sondeigs[:3]
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        for i in range(len(p)):
+            ok = np.isfinite(p[i]) & (p[i] >= 100); p_i, t_k, td_k = p[i][ok], T[i][ok] + 273.15, Td[i][ok] + 273.15
+            ref_parcela = mpcalc.parcel_profile(p_i * units.hPa, t_k[0] * units.K, td_k[0] * units.K).to('K').m
+            ref_bulb = mpcalc.wet_bulb_temperature(p_i * units.hPa, t_k * units.K, td_k * units.K).to('K').m
+            np.testing.assert_allclose(perfil_parcela_lot(p_i[None], p_i[:1], t_k[:1], td_k[:1], taula)[0][0], ref_parcela, atol=0.11)
+            np.testing.assert_allclose(taula.bulb_humit(p_i, t_k, td_k), ref_bulb, atol=0.035)
+
+@pytest.mark.parametrize('amb_taula', [False, True])
+def test_cota_neu_com_perfil_a_perfil(sondeigs, taula, amb_taula):
+    # Isozero de bulb humit del lot vs. l'escombrada anterior (MetPy i primer canvi de signe), dins de 4 m
+    p, T, Td, _, _, h = sondeigs
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        lot = calcular_precipitacio_lot(p, T, Td, h, taula if amb_taula else None)
+    for i in range(len(p)):
+        ok = np.isfinite(p[i]) & (p[i] >= PRESSIO_MIN_NEU)
+        tw = mpcalc.wet_bulb_temperature(p[i][ok] * units.hPa, T[i][ok] * units.degC, np.minimum(Td[i][ok], T[i][ok]) * units.degC).m; h_i = h[i][ok]
+        creua = np.where(np.diff(np.sign(tw)))[0]
+        if tw[0] <= 0: ref = h_i[0]
+        elif creua.size > 0: k = creua[0]; ref = np.interp(0, [tw[k + 1], tw[k]], [h_i[k + 1], h_i[k]])
+        else: continue
+        assert lot['Isozero_Bulb_Humit'][i] == pytest.approx(ref, abs=4), i
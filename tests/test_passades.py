@@ -0,0 +1,48 @@
+# --- FRAGMENTS PER DIA DEL MAGATZEM DE PASSADES ---
+# instantania(dia) no espera el fragment d'un altre dia: mentre es construeix retorna None (la pàgina fa les
+# peticions per localitat i en comprova l'arribada), i si falla deixa l'error a incidencia_dia fins que se serveix bé.
+# La primera passada també es construeix en segon pla, i el seu error queda a incidencies().
+import threading
+from concurrent.futures import Future
+import app_interactiva
+from app_interactiva import MagatzemPassades
+
+def magatzem_amb(monkeypatch, futur):
+    magatzem = MagatzemPassades(); magatzem._actual = {'run': '2026101900'}
+    monkeypatch.setattr(magatzem, '_fragment_dia', lambda dia: futur)
+    return magatzem
+
+def test_fragment_en_construccio(monkeypatch):
+    futur = Future(); magatzem = magatzem_amb(monkeypatch, futur)
+    assert magatzem.instantania(1) is None and magatzem.carregant_dia(1)
+    assert magatzem.incidencia_dia(1) is None
+    futur.set_result({'run': '2026101900', 'dia': 1})
+    assert not magatzem.carregant_dia(1)
+    assert magatzem.instantania(1) == {'run': '2026101900', 'dia': 1}
+
+def test_fragment_que_falla(monkeypatch):
+    futur = Future(); futur.set_exception(RuntimeError("sense xarxa"))
+    magatzem = magatzem_amb(monkeypatch, futur)
+    assert magatzem.instantania(1) is None
+    assert str(magatzem.incidencia_dia(1)[1]) == "sense xarxa"
+    assert magatzem.instantania(0) == {'run': '2026101900'}
+
+def test_arrencada_en_fred_en_segon_pla(monkeypatch):
+    # La petició que engega la construcció no l'espera
+    pot_acabar = threading.Event()
+    def construir(run, anterior, precalcular=True, dia=0):
+        pot_acabar.wait(5); return {'run': run, 'data': 'avui', 'precalcular': precalcular}
+    monkeypatch.setattr(app_interactiva, 'construir_instantania', construir)
+    magatzem = MagatzemPassades()
+    magatzem.actualitzar('2026101900')
+    assert magatzem.instantania() is None and magatzem.construint()
+    pot_acabar.set(); magatzem._fil.join(5)
+    assert magatzem.instantania() == {'run': '2026101900', 'data': 'avui', 'precalcular': False}
+
+def test_arrencada_en_fred_que_falla(monkeypatch):
+    def construir(run, anterior, precalcular=True, dia=0): raise RuntimeError("sense xarxa")
+    monkeypatch.setattr(app_interactiva, 'construir_instantania', construir)
+    magatzem = MagatzemPassades()
+    magatzem.actualitzar('2026101900'); magatzem._fil.join(5)
+    error_construccio, error_arxiu, _ = magatzem.incidencies()
+    assert magatzem.instantania() is None and error_construccio[0] == '2026101900' and str(error_construccio[1]) == "sense xarxa"